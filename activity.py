@@ -0,0 +1,89 @@
+"""
+User activity tracking with O(1) expiry and per-user token-bucket rate limits
+"""
+
+import time
+from collections import OrderedDict
+
+
+class _UserState:
+    __slots__ = ('last_seen', 'tokens', 'refilled', 'limited')
+
+    def __init__(self, now: float, burst: float):
+        self.last_seen = now
+        self.tokens = burst
+        self.refilled = now
+        self.limited = False
+
+
+class ActivityTracker:
+    """Recently active users, oldest first, with a token bucket per user
+
+    Entries are kept in last-seen order, so expired users are always at the
+    front and each sweep only looks at entries it removes (amortised O(1))
+    """
+
+    def __init__(self, ttl: float = 1800, max_users: int = 50000, rate: float = 0.5,
+                 burst: float = 10, sweep_limit: int = 64):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.rate = rate
+        self.burst = burst
+        self.sweep_limit = sweep_limit
+        self._users = OrderedDict()
+        self.expired = 0
+        self.denied = 0
+
+    def _sweep(self, now: float) -> None:
+        # Bounded work per call; anything left is picked up by later calls
+        for _ in range(self.sweep_limit):
+            if not self._users:
+                return
+            user_id, state = next(iter(self._users.items()))
+            if now - state.last_seen <= self.ttl and len(self._users) <= self.max_users:
+                return
+            self._users.popitem(last=False)
+            self.expired += 1
+
+    def touch(self, user_id, now: float = None) -> _UserState:
+        """Mark a user active and return their state"""
+        now = time.monotonic() if now is None else now
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserState(now, self.burst)
+        else:
+            state.last_seen = now
+            self._users.move_to_end(user_id)
+        self._sweep(now)
+        return state
+
+    def allow(self, user_id, cost: float = 1.0, now: float = None):
+        """Take cost tokens from the user's bucket
+
+        Returns (allowed, first_denial); first_denial is True only for the first
+        refused request in a row, so the user is told once instead of every time
+        """
+        now = time.monotonic() if now is None else now
+        state = self.touch(user_id, now)
+        state.tokens = min(self.burst, state.tokens + (now - state.refilled) * self.rate)
+        state.refilled = now
+        cost = min(cost, self.burst)
+        if state.tokens >= cost:
+            state.tokens -= cost
+            state.limited = False
+            return True, False
+        self.denied += 1
+        first_denial = not state.limited
+        state.limited = True
+        return False, first_denial
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def stats(self) -> dict:
+        """Tracked users and limiter counters"""
+        return {
+            "active_users": len(self._users),
+            "expired": self.expired,
+            "rate_limited": self.denied,
+        }
@@ -0,0 +1,288 @@
+"""
+Generate/decode analytics on the /data volume
+Handlers append events to an in-memory ring buffer (no I/O, no await); a
+background task flushes it in batches to an append-only SQLite (WAL) event log
+and updates daily rollups in the same transaction, so /stats reads a few
+small tables instead of scanning events
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency buckets kept per day; the last one is open
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+# Seconds a flush waits for another process writing to the same database
+_BUSY_TIMEOUT = 30.0
+
+# Decode outcomes that count as a scan attempt for the success rate
+SCAN_OUTCOMES = ('found', 'none', 'unreadable')
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS events (ts REAL NOT NULL, kind TEXT NOT NULL, source TEXT NOT NULL, "
+    "outcome TEXT NOT NULL, cached INTEGER NOT NULL, latency_ms REAL, label TEXT)",
+    "CREATE INDEX IF NOT EXISTS events_ts ON events (ts)",
+    "CREATE TABLE IF NOT EXISTS daily (day TEXT NOT NULL, kind TEXT NOT NULL, source TEXT NOT NULL, "
+    "outcome TEXT NOT NULL, cached INTEGER NOT NULL, count INTEGER NOT NULL, "
+    "PRIMARY KEY (day, kind, source, outcome, cached))",
+    "CREATE TABLE IF NOT EXISTS daily_latency (day TEXT NOT NULL, kind TEXT NOT NULL, bucket INTEGER NOT NULL, "
+    "count INTEGER NOT NULL, PRIMARY KEY (day, kind, bucket))",
+    "CREATE TABLE IF NOT EXISTS daily_labels (day TEXT NOT NULL, label TEXT NOT NULL, count INTEGER NOT NULL, "
+    "PRIMARY KEY (day, label))",
+)
+
+
+class Event(NamedTuple):
+    ts: float
+    kind: str  # 'generate' or 'decode'
+    source: str  # text, styled, inline, batch / photo, image, pdf, video
+    outcome: str  # ok, busy, error / found, none, unreadable, too_large, busy, timeout, error
+    cached: bool
+    latency_ms: Optional[float]
+    label: Optional[str]  # generate only: URL host or payload type, never the payload
+
+
+def payload_label(text: str) -> str:
+    """Coarse, non-identifying label of a payload: the URL host or the payload type"""
+    lowered = text.strip().lower()
+    if lowered.startswith(('http://', 'https://')):
+        host = urlsplit(lowered).hostname or ''
+        return host[4:] if host.startswith('www.') else host or 'url'
+    for prefix, label in (('wifi:', 'wifi'), ('tel:', 'phone'), ('mailto:', 'email'), ('smsto:', 'sms'),
+                          ('begin:vcard', 'vcard'), ('geo:', 'location')):
+        if lowered.startswith(prefix):
+            return label
+    if lowered.lstrip('+').replace(' ', '').isdigit():
+        return 'number'
+    return 'text'
+
+
+def _bucket(latency_ms: float) -> int:
+    for index, bound in enumerate(LATENCY_BUCKETS_MS):
+        if latency_ms <= bound:
+            return index
+    return len(LATENCY_BUCKETS_MS) - 1
+
+
+def _percentile_bound(counts: dict, pct: float):
+    """Upper bound (ms) of the bucket holding the pct percentile, None without data"""
+    total = sum(counts.values())
+    if not total:
+        return None
+    seen = 0
+    for bucket in sorted(counts):
+        seen += counts[bucket]
+        if seen >= total * pct / 100:
+            return LATENCY_BUCKETS_MS[bucket]
+    return LATENCY_BUCKETS_MS[-1]
+
+
+class AnalyticsLog:
+    """Ring buffer of events flushed in batches to SQLite with incremental daily rollups
+
+    When the buffer is full the oldest unflushed events are dropped (and
+    counted) rather than slowing handlers down
+    """
+
+    def __init__(self, db_path=None, capacity: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 5.0, retention_days: int = 90):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self._buffer = deque(maxlen=capacity)
+        self._wakeup = None
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.persistent = db_path is not None
+        self._db = self._open_db(db_path)
+        self._pruned_day = None
+
+    def _open_db(self, db_path):
+        if db_path is not None:
+            try:
+                os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+                # Worker processes share the file; writers wait for each other's transactions
+                db = sqlite3.connect(db_path, timeout=_BUSY_TIMEOUT, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                for statement in _SCHEMA:
+                    db.execute(statement)
+                db.commit()
+                return db
+            except (sqlite3.Error, OSError) as e:
+                logger.error(f"Analytics persistence disabled, keeping events in memory: {e}")
+                self.persistent = False
+        db = sqlite3.connect(':memory:', check_same_thread=False)
+        for statement in _SCHEMA:
+            db.execute(statement)
+        return db
+
+    def record(self, kind: str, source: str, outcome: str, started: float = None, cached: bool = False,
+               label: str = None) -> None:
+        """Buffer one event; started is a time.perf_counter() value (None = no latency)"""
+        latency_ms = (time.perf_counter() - started) * 1000 if started is not None else None
+        if len(self._buffer) == self.capacity:
+            self.dropped += 1
+        self._buffer.append(Event(time.time(), kind, source, outcome, cached, latency_ms, label))
+        self.recorded += 1
+        if self._wakeup is not None and len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def run(self) -> None:
+        """Flush every flush_interval seconds, or as soon as a batch is full"""
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                logger.error(f"Analytics flush failed: {e}")
+
+    async def flush(self) -> int:
+        """Write all buffered events off the event loop; returns how many were written"""
+        batch = []
+        while self._buffer:
+            batch.append(self._buffer.popleft())
+        if batch:
+            await asyncio.to_thread(self._write, batch)
+        return len(batch)
+
+    def _write(self, batch: list) -> None:
+        daily = Counter()
+        latency = Counter()
+        labels = Counter()
+        for event in batch:
+            day = time.strftime('%Y-%m-%d', time.gmtime(event.ts))
+            key = (day, event.kind, event.source, event.outcome, int(event.cached))
+            daily[key] += 1
+            if event.latency_ms is not None:
+                latency[(day, event.kind, _bucket(event.latency_ms))] += 1
+            if event.label:
+                labels[(day, event.label)] += 1
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO events (ts, kind, source, outcome, cached, latency_ms, label) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(e.ts, e.kind, e.source, e.outcome, int(e.cached), e.latency_ms, e.label) for e in batch],
+            )
+            self._db.executemany(
+                "INSERT INTO daily VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (day, kind, source, outcome, cached) "
+                "DO UPDATE SET count = count + excluded.count",
+                [key + (count,) for key, count in daily.items()],
+            )
+            self._db.executemany(
+                "INSERT INTO daily_latency VALUES (?, ?, ?, ?) ON CONFLICT (day, kind, bucket) "
+                "DO UPDATE SET count = count + excluded.count",
+                [key + (count,) for key, count in latency.items()],
+            )
+            self._db.executemany(
+                "INSERT INTO daily_labels VALUES (?, ?, ?) ON CONFLICT (day, label) "
+                "DO UPDATE SET count = count + excluded.count",
+                [key + (count,) for key, count in labels.items()],
+            )
+            self._prune()
+        self.flushed += len(batch)
+        self.flushes += 1
+
+    def _prune(self) -> None:
+        # Raw events expire after retention_days (once a day); rollups are kept
+        today = time.strftime('%Y-%m-%d', time.gmtime())
+        if self._pruned_day == today:
+            return
+        self._pruned_day = today
+        self._db.execute("DELETE FROM events WHERE ts < ?", (time.time() - self.retention_days * 86400,))
+
+    async def summary(self, days: int = 7, top: int = 5) -> dict:
+        """Rollups for the last `days` days (UTC), including events not flushed yet"""
+        await self.flush()
+        return await asyncio.to_thread(self._summary, days, top)
+
+    def _summary(self, days: int, top: int) -> dict:
+        since = time.strftime('%Y-%m-%d', time.gmtime(time.time() - (days - 1) * 86400))
+        with self._lock:
+            daily_rows = self._db.execute(
+                "SELECT day, kind, outcome, cached, SUM(count) FROM daily WHERE day >= ? "
+                "GROUP BY day, kind, outcome, cached ORDER BY day", (since,)
+            ).fetchall()
+            latency_rows = self._db.execute(
+                "SELECT day, kind, bucket, SUM(count) FROM daily_latency WHERE day >= ? GROUP BY day, kind, bucket",
+                (since,)
+            ).fetchall()
+            label_rows = self._db.execute(
+                "SELECT label, SUM(count) AS total FROM daily_labels WHERE day >= ? GROUP BY label "
+                "ORDER BY total DESC LIMIT ?", (since, top)
+            ).fetchall()
+
+        per_day = {}
+        totals = {'generate': Counter(), 'decode': Counter()}
+        for day, kind, outcome, cached, count in daily_rows:
+            day_totals = per_day.setdefault(day, {'generate': Counter(), 'decode': Counter()})
+            for counter in (day_totals[kind], totals[kind]):
+                counter['total'] += count
+                counter[outcome] += count
+                if cached:
+                    counter['cached'] += count
+        # Latency buckets per (day, kind), and per kind over the whole window
+        latency = {}
+        day_latency = {}
+        for day, kind, bucket, count in latency_rows:
+            buckets = latency.setdefault(kind, Counter())
+            buckets[bucket] += count
+            day_latency.setdefault((day, kind), {})[bucket] = count
+
+        def describe(counter, kind, buckets):
+            scans = sum(counter[outcome] for outcome in SCAN_OUTCOMES)
+            result = {'total': counter['total'], 'cached': counter['cached']}
+            if kind == 'decode':
+                result['success_rate'] = round(counter['found'] / scans, 4) if scans else None
+            else:
+                result['errors'] = counter['error'] + counter['busy']
+            result['p50_ms'] = _percentile_bound(buckets, 50)
+            result['p95_ms'] = _percentile_bound(buckets, 95)
+            return result
+
+        return {
+            'days': days,
+            'generate': describe(totals['generate'], 'generate', latency.get('generate', {})),
+            'decode': describe(totals['decode'], 'decode', latency.get('decode', {})),
+            'per_day': {
+                day: {kind: describe(counter, kind, day_latency.get((day, kind), {})) for kind, counter in kinds.items()}
+                for day, kinds in per_day.items()
+            },
+            'top_labels': label_rows,
+        }
+
+    async def close(self) -> None:
+        """Write what is left in the buffer and close the database"""
+        try:
+            await self.flush()
+        finally:
+            with self._lock:
+                self._db.close()
+
+    def stats(self) -> dict:
+        """Buffer and flush counters"""
+        return {
+            "persistent": self.persistent,
+            "buffered": len(self._buffer),
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+        }
@@ -0,0 +1,102 @@
+"""
+Batch QR Code generation helpers
+Lines are rendered through a worker pool with a bounded window, so memory
+stays flat no matter how many lines a batch has
+"""
+
+import asyncio
+import csv
+import io
+import tempfile
+import zipfile
+from collections import deque
+
+# Payloads longer than this are rejected per line (Telegram captions are 1024 chars)
+MAX_LINE_LENGTH = 1000
+
+
+def parse_lines(text: str) -> list:
+    """Non-empty, stripped lines of a multi-line message or .txt file"""
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def parse_csv(text: str) -> list:
+    """First column of every CSV row, skipping empty cells and a header row
+
+    Headers are only looked for when there are several columns: in a
+    single-column list csv.Sniffer takes plain words or numbers for one
+    """
+    rows = [row for row in csv.reader(io.StringIO(text)) if row]
+    if rows and len(rows[0]) > 1:
+        try:
+            if csv.Sniffer().has_header(text[:4096]):
+                rows = rows[1:]
+        except csv.Error:
+            pass
+    return [row[0].strip() for row in rows if row[0].strip()]
+
+
+async def _render_one(pool, render, text, args):
+    if len(text) > MAX_LINE_LENGTH:
+        return text, None
+    try:
+        return text, await pool.run(render, text, *args)
+    except asyncio.TimeoutError:
+        return text, None
+    except ValueError:
+        # qrcode raises DataOverflowError (a ValueError subclass) when the payload does not fit
+        return text, None
+
+
+async def render_in_order(pool, render, lines, window, *args):
+    """Yield (text, png or None) for each line in order, with at most `window` renders in flight"""
+    pending = deque()
+    try:
+        for text in lines:
+            pending.append(asyncio.ensure_future(_render_one(pool, render, text, args)))
+            if len(pending) >= window:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def chunked(items, size):
+    """Split a list into consecutive chunks of at most size items"""
+    return [items[index:index + size] for index in range(0, len(items), size)]
+
+
+class ZipBuilder:
+    """Write PNGs into a ZIP in a temporary file
+
+    The file is named (unlike a SpooledTemporaryFile) because python-telegram-bot
+    reads the name of every file object it uploads
+    """
+
+    def __init__(self):
+        self.file = tempfile.NamedTemporaryFile(prefix='qr_codes_', suffix='.zip')
+        # PNGs are already compressed, storing them avoids wasted CPU
+        self._zip = zipfile.ZipFile(self.file, 'w', compression=zipfile.ZIP_STORED)
+        self._index = io.StringIO()
+        self._index_writer = csv.writer(self._index)
+        self._index_writer.writerow(['file', 'text'])
+        self.count = 0
+
+    def add(self, text: str, png) -> None:
+        self.count += 1
+        name = f"qr_{self.count:05d}.png" if png is not None else ''
+        if png is not None:
+            self._zip.writestr(name, png)
+        self._index_writer.writerow([name, text])
+
+    def finish(self):
+        """Close the archive and return the file object rewound to the start"""
+        self._zip.writestr('index.csv', self._index.getvalue().encode('utf-8-sig'), compress_type=zipfile.ZIP_DEFLATED)
+        self._zip.close()
+        self.file.seek(0)
+        return self.file
+
+    def close(self) -> None:
+        self.file.close()
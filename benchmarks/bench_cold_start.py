@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark
+Boots the bot in webhook mode as a fresh process against the stub Bot API from
+loadtest.py (as Fly.io does when a stopped machine receives a request), posts a
+text and a photo update as soon as the port accepts connections, and reports
+time to listener, time to first reply per update type and the startup phases
+from /health. All times are seconds since the child process was spawned
+
+Usage: python benchmarks/bench_cold_start.py [--runs 5]
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Same values as loadtest.py; not imported from there because that module loads
+# qrmm, cv2 and numpy at import time, which would skew the child process
+TOKEN = '123456:LOADTEST'
+BOT_PORT = 18080
+API_PORT = 18081
+
+
+def run_child():
+    """Bot process: qrmm in webhook mode, Bot API calls go to the stub"""
+    from telegram.ext import Application
+
+    import qrmm
+
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(f"http://127.0.0.1:{API_PORT}/bot")
+        .base_file_url(f"http://127.0.0.1:{API_PORT}/file/bot")
+        .rate_limiter(qrmm.outbound_limiter)
+        .build()
+    )
+    asyncio.run(qrmm.run_webhook_mode(application))
+
+
+async def wait_for_port(port, started, timeout=30.0):
+    while time.perf_counter() - started < timeout:
+        try:
+            _reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        except OSError:
+            await asyncio.sleep(0.005)
+            continue
+        writer.close()
+        await writer.wait_closed()
+        return time.perf_counter() - started
+    raise RuntimeError("bot did not start listening")
+
+
+async def boot_once(fake, factory, session):
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN=TOKEN,
+        WEBHOOK_URL=f"http://127.0.0.1:{BOT_PORT}",
+        HOST='127.0.0.1',
+        PORT=str(BOT_PORT),
+        # Fresh volume each run so nothing is served from the persistent caches
+        DATA_DIR=tempfile.mkdtemp(prefix='qrbot-coldstart-'),
+    )
+    fake.replies.clear()
+    started = time.perf_counter()
+    child = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), '--child', env=env)
+    try:
+        listener = await wait_for_port(BOT_PORT, started)
+        keys = {}
+        for kind in ('text', 'photo'):
+            key, payload = getattr(factory, kind)()
+            keys[kind] = key
+            async with session.post(f"http://127.0.0.1:{BOT_PORT}/webhook/{TOKEN}", json=payload) as resp:
+                if resp.status != 200:
+                    raise RuntimeError(f"webhook answered {resp.status}")
+        while not all(key in fake.replies for key in keys.values()):
+            if time.perf_counter() - started > 60:
+                raise RuntimeError("no reply from the bot")
+            await asyncio.sleep(0.005)
+        # Give the background warm-up a chance to report before reading /health
+        await asyncio.sleep(0.5)
+        async with session.get(f"http://127.0.0.1:{BOT_PORT}/health") as resp:
+            phases = (await resp.json())['startup']
+        result = {'listener': listener, **{f"first_{kind}_reply": fake.replies[key] - started
+                                             for kind, key in keys.items()}}
+        return result, phases
+    finally:
+        child.send_signal(signal.SIGTERM)
+        await child.wait()
+
+
+async def run(args):
+    from aiohttp import ClientSession, web
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from loadtest import FakeBotAPI, UpdateFactory, make_photo_set
+
+    photo_sets = [make_photo_set(seed) for seed in range(2)]
+    fake = FakeBotAPI(photo_sets)
+    api_runner = web.AppRunner(fake.app())
+    await api_runner.setup()
+    await web.TCPSite(api_runner, '127.0.0.1', API_PORT).start()
+    factory = UpdateFactory(photo_sets, repeat_ratio=0.0, seed=1)
+
+    results = []
+    async with ClientSession() as session:
+        for index in range(args.runs):
+            result, phases = await boot_once(fake, factory, session)
+            results.append(result)
+            print(f"run {index + 1}: " + ", ".join(f"{name}={value:.3f}s" for name, value in result.items()))
+            print("        phases: " + ", ".join(f"{name}={value:.3f}s" for name, value in phases.items()))
+    await api_runner.cleanup()
+
+    print("\nmedian over runs:")
+    for name in results[0]:
+        values = sorted(result[name] for result in results)
+        print(f"  {name:18s} {values[len(values) // 2]:.3f}s")
+
+
+def main():
+    if '--child' in sys.argv:
+        run_child()
+        return
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
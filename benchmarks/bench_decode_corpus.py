@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Offline decode corpus benchmark
+Compares the original single detectAndDecode call (colour image, new detector
+per photo) with the staged decode pipeline and reports decode rate against
+CPU-ms per image
+
+Usage:
+  python benchmarks/bench_decode_corpus.py                 # synthetic corpus
+  python benchmarks/bench_decode_corpus.py --corpus DIR    # your own images
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from decoding import decode_qr_image, warm_up_worker, InvalidImageError, PipelineStats
+from rendering import render_qr_png
+
+
+def baseline_decode(image_bytes) -> list:
+    """The decode path the bot used before the staged pipeline"""
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise InvalidImageError("Image could not be decoded")
+    detector = cv2.QRCodeDetector()
+    data, _vertices, _straight_qrcode = detector.detectAndDecode(img)
+    return [data] if data else []
+
+
+def qr_gray(payload, target_side):
+    img = cv2.imdecode(np.frombuffer(render_qr_png(payload), np.uint8), cv2.IMREAD_GRAYSCALE)
+    return cv2.resize(img, (target_side, target_side), interpolation=cv2.INTER_NEAREST)
+
+
+def on_canvas(qr, canvas_side, rng, background=200):
+    canvas = np.full((canvas_side, canvas_side), background, dtype=np.uint8)
+    y = rng.randint(0, canvas_side - qr.shape[0])
+    x = rng.randint(0, canvas_side - qr.shape[1])
+    canvas[y:y + qr.shape[0], x:x + qr.shape[1]] = qr
+    return canvas
+
+
+def synthetic_corpus(count, seed):
+    """Yield (category, expected_codes, jpeg_bytes) for rendered QR codes with common distortions"""
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+
+    def payload():
+        return "https://t.me/" + "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 60)))
+
+    categories = ['clean', 'small', 'huge_canvas', 'blur', 'low_contrast', 'noise', 'rotated', 'two_codes', 'no_code']
+    for index in range(count):
+        category = categories[index % len(categories)]
+        text = payload()
+        expected = [text]
+        if category == 'clean':
+            img = on_canvas(qr_gray(text, 400), 800, rng, 255)
+        elif category == 'small':
+            img = on_canvas(qr_gray(text, 120), 1280, rng)
+        elif category == 'huge_canvas':
+            img = on_canvas(qr_gray(text, 900), 4000, rng)
+        elif category == 'blur':
+            img = cv2.GaussianBlur(on_canvas(qr_gray(text, 360), 800, rng), (9, 9), 2.5)
+        elif category == 'low_contrast':
+            img = on_canvas(qr_gray(text, 400), 800, rng)
+            img = (110 + img.astype(np.float32) * 0.25).astype(np.uint8)
+        elif category == 'noise':
+            img = on_canvas(qr_gray(text, 400), 800, rng).astype(np.int16)
+            img = np.clip(img + np_rng.normal(0, 45, img.shape), 0, 255).astype(np.uint8)
+        elif category == 'rotated':
+            img = on_canvas(qr_gray(text, 360), 900, rng, 255)
+            matrix = cv2.getRotationMatrix2D((450, 450), rng.uniform(10, 60), 1.0)
+            img = cv2.warpAffine(img, matrix, (900, 900), borderValue=255)
+        elif category == 'two_codes':
+            other = payload()
+            expected = [text, other]
+            img = np.full((600, 1200), 255, dtype=np.uint8)
+            img[100:500, 100:500] = qr_gray(text, 400)
+            img[100:500, 700:1100] = qr_gray(other, 400)
+        else:
+            expected = []
+            img = np_rng.integers(0, 255, (800, 800), dtype=np.uint8)
+        ok, jpeg = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        yield category, expected, jpeg.tobytes()
+
+
+def directory_corpus(path):
+    for name in sorted(os.listdir(path)):
+        full_path = os.path.join(path, name)
+        if os.path.isfile(full_path):
+            with open(full_path, 'rb') as f:
+                yield 'files', None, f.read()
+
+
+def run(decoder, corpus):
+    per_category = defaultdict(lambda: {"images": 0, "decoded": 0, "complete": 0, "cpu_ms": []})
+    stats = PipelineStats()
+    for category, expected, image_bytes in corpus:
+        started = time.thread_time()
+        try:
+            result = decoder(image_bytes)
+        except InvalidImageError:
+            continue
+        elapsed_ms = (time.thread_time() - started) * 1000
+        codes = result
+        if not isinstance(result, list):
+            stats.record(result)
+            codes = result.codes
+        entry = per_category[category]
+        entry["images"] += 1
+        entry["cpu_ms"].append(elapsed_ms)
+        if codes:
+            entry["decoded"] += 1
+        if expected is not None and sorted(codes) == sorted(expected):
+            entry["complete"] += 1
+    return per_category, stats
+
+
+def report(label, per_category, stats=None):
+    print(f"\n== {label} ==")
+    print(f"  {'category':<13} {'n':>4} {'decoded':>8} {'correct':>8} {'avg ms':>8} {'p95 ms':>8}")
+    total_images = total_correct = 0
+    total_ms = []
+    for category, entry in per_category.items():
+        cpu = sorted(entry["cpu_ms"])
+        p95 = cpu[min(len(cpu) - 1, int(len(cpu) * 0.95))]
+        print(
+            f"  {category:<13} {entry['images']:>4} {entry['decoded']:>8} {entry['complete']:>8} "
+            f"{sum(cpu) / len(cpu):>8.1f} {p95:>8.1f}"
+        )
+        total_images += entry["images"]
+        total_correct += entry["complete"]
+        total_ms.extend(cpu)
+    if total_images:
+        print(
+            f"  overall: correct {total_correct}/{total_images} ({total_correct / total_images:.0%}), "
+            f"{sum(total_ms) / len(total_ms):.1f} CPU-ms/image"
+        )
+    if stats is not None:
+        for stage, entry in stats.stats()["stages"].items():
+            print(f"    stage {stage:<9} runs={entry['runs']:<5} successes={entry['successes']:<5} avg={entry['avg_cpu_ms']} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help="directory of images (default: synthetic corpus)")
+    parser.add_argument('--count', type=int, default=90, help="synthetic corpus size")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    def corpus():
+        if args.corpus:
+            return directory_corpus(args.corpus)
+        return synthetic_corpus(args.count, args.seed)
+
+    warm_up_worker()
+    per_category, _ = run(baseline_decode, corpus())
+    report("before: single detectAndDecode", per_category)
+    per_category, stats = run(decode_qr_image, corpus())
+    report("after: staged pipeline", per_category, stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Decode memory benchmark
+Submits a burst of large photo decodes to the decode pool at once, like several
+users sending camera photos together, and reports peak RSS and latency with and
+without the memory budget. Each mode runs in a fresh process so peak RSS is
+not carried over
+
+Usage: python benchmarks/bench_decode_memory.py [--jobs 12] [--workers 4] [--budget-mb 96]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_photo(width, height, seed):
+    """Noisy camera-like JPEG with a QR Code in the middle"""
+    import cv2
+    import numpy as np
+
+    from rendering import render_qr_png
+
+    rng = np.random.default_rng(seed)
+    img = rng.normal(180, 25, (height, width)).clip(0, 255).astype(np.uint8)
+    qr = cv2.imdecode(np.frombuffer(render_qr_png(f"https://example.com/{seed}"), np.uint8), cv2.IMREAD_GRAYSCALE)
+    side = min(width, height) // 3
+    qr = cv2.resize(qr, (side, side), interpolation=cv2.INTER_NEAREST)
+    img[height // 3:height // 3 + side, width // 3:width // 3 + side] = qr
+    return cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+
+def peak_rss_mb():
+    """VmHWM: unlike ru_maxrss it is not inherited across exec from the parent"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def run_burst(paths, sizes, workers, budget_mb):
+    from decode_types import decode_options
+    from memory_budget import MemoryBudget
+    from workers import WorkerPool
+
+    pool = WorkerPool('decode', workers=workers, max_pending=len(paths), queue_timeout=60,
+                      initializer='decoding:warm_up_worker')
+    budget = MemoryBudget('decode', int(budget_mb * 1024 * 1024)) if budget_mb else None
+    await pool.run('decoding:warm_up_worker')
+
+    async def one(path, size):
+        started = time.perf_counter()
+        reduce, reservation = 1, None
+        if budget is not None:
+            reduce, reservation = await budget.admit(
+                decode_options(os.path.getsize(path), *size), timeout=60
+            )
+        # Read the file only once admitted, like the bot downloads after admission
+        with open(path, 'rb') as f:
+            data = f.read()
+        result = await pool.run('decoding:decode_qr_image', data, reduce,
+                                on_done=reservation.release if reservation else None)
+        return time.perf_counter() - started, bool(result.codes), reduce
+
+    results = await asyncio.gather(*(one(path, size) for path, size in zip(paths, sizes)))
+    pool.shutdown()
+    latencies = sorted(latency for latency, _, _ in results)
+    return {
+        'peak_rss_mb': peak_rss_mb(),
+        'decoded': sum(found for _, found, _ in results),
+        'reduced': sum(reduce > 1 for _, _, reduce in results),
+        'p50_s': latencies[len(latencies) // 2],
+        'max_s': latencies[-1],
+        'budget': budget.stats() if budget else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=12)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--budget-mb', type=float, default=96)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        config = json.loads(args.child)
+        print(json.dumps(asyncio.run(run_burst(config['paths'], config['sizes'], args.workers, config['budget_mb']))))
+        return
+
+    directory = tempfile.mkdtemp(prefix='qrbot-decode-memory-')
+    shapes = [(6000, 4000), (4000, 3000), (2560, 1920)]
+    paths, sizes = [], []
+    for index in range(args.jobs):
+        width, height = shapes[index % len(shapes)]
+        path = os.path.join(directory, f"photo-{index}.jpg")
+        with open(path, 'wb') as f:
+            f.write(make_photo(width, height, index))
+        paths.append(path)
+        sizes.append((width, height))
+
+    for label, budget_mb in (('no budget', 0), (f'budget {args.budget_mb:g} MB', args.budget_mb)):
+        config = json.dumps({'paths': paths, 'sizes': sizes, 'budget_mb': budget_mb})
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--workers', str(args.workers), '--child', config],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{label:16s} peak RSS {result['peak_rss_mb']:7.1f} MB  decoded {result['decoded']}/{args.jobs}"
+              f"  reduced {result['reduced']}  p50 {result['p50_s']:.2f}s  max {result['max_s']:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+PNG encoder micro-benchmark
+Compares the previous PIL path (make_image + optimize=True, compress_level=9)
+with the direct NumPy 1-bit encoder for payloads from tiny up to version 40,
+and checks that both produce identical pixels
+
+Usage: python benchmarks/bench_png_encoder.py [--repeat 5] [--level 6]
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rendering import _make_qr, encode_matrix_png, DEFAULT_BOX_SIZE, DEFAULT_BORDER, DEFAULT_COMPRESS_LEVEL
+
+# Payload sizes in bytes; 2953 is the version 40-L binary capacity
+PAYLOAD_SIZES = (1, 16, 64, 256, 1024, 2953)
+
+
+def pil_encode(qr) -> bytes:
+    img = qr.make_image(fill_color="black", back_color="white")
+    bio = io.BytesIO()
+    img.save(bio, 'PNG', optimize=True, compress_level=9)
+    return bio.getvalue()
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--level', type=int, default=DEFAULT_COMPRESS_LEVEL, help="zlib level for the NumPy encoder")
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    print(f"{'bytes':>6} {'ver':>4} {'make ms':>8} {'PIL ms':>8} {'PIL B':>7} {'numpy ms':>9} {'numpy B':>8} {'speedup':>8} same")
+    for size in PAYLOAD_SIZES:
+        payload = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(size))
+        make_time, qr = best_time(lambda: _make_qr(payload, DEFAULT_BOX_SIZE, DEFAULT_BORDER), args.repeat)
+        pil_time, pil_png = best_time(lambda: pil_encode(qr), args.repeat)
+        np_time, np_png = best_time(
+            lambda: encode_matrix_png(qr.get_matrix(), DEFAULT_BOX_SIZE, args.level), args.repeat
+        )
+        pil_pixels = cv2.imdecode(np.frombuffer(pil_png, np.uint8), cv2.IMREAD_GRAYSCALE)
+        np_pixels = cv2.imdecode(np.frombuffer(np_png, np.uint8), cv2.IMREAD_GRAYSCALE)
+        same = np_pixels is not None and np.array_equal(pil_pixels, np_pixels)
+        print(
+            f"{size:>6} {qr.version:>4} {make_time * 1000:>8.2f} {pil_time * 1000:>8.2f} {len(pil_png):>7} "
+            f"{np_time * 1000:>9.2f} {len(np_png):>8} {pil_time / np_time:>7.1f}x {'yes' if same else 'NO'}"
+        )
+
+
+if __name__ == '__main__':
+    main()
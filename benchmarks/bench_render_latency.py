@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Render latency benchmark
+Replays a mixed stream of QR render requests and cheap /health-style requests
+and reports p50/p99 latency with rendering inline on the event loop (before)
+and in the bounded render pool (after)
+
+Usage: python benchmarks/bench_render_latency.py [--requests 400] [--rate 20]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rendering import render_qr_png
+from workers import WorkerPool, PoolBusyError
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def make_payload(rng):
+    """Random payload from tiny text to long URLs"""
+    length = rng.choice([8, 32, 120, 400, 1200])
+    return "https://example.com/" + "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(length))
+
+
+async def run_mix(mode, total, rate, health_ratio, pool_kind, workers, seed):
+    rng = random.Random(seed)
+    pool = None
+    if mode == 'pool':
+        pool = WorkerPool('bench', workers=workers, max_pending=workers * 16, kind=pool_kind)
+        pool.start()
+
+    latencies = {'render': [], 'health': []}
+    busy = 0
+
+    # Latency is measured from the scheduled arrival time, so time spent
+    # waiting behind a blocked event loop is included
+    async def render_request(payload, arrival):
+        nonlocal busy
+        try:
+            if pool is None:
+                render_qr_png(payload)
+            else:
+                await pool.run(render_qr_png, payload)
+        except PoolBusyError:
+            busy += 1
+            return
+        latencies['render'].append(time.perf_counter() - arrival)
+
+    async def health_request(arrival):
+        await asyncio.sleep(0)
+        latencies['health'].append(time.perf_counter() - arrival)
+
+    # Poisson arrivals at the requested rate, on a fixed schedule
+    arrival = time.perf_counter()
+    tasks = []
+    for _ in range(total):
+        arrival += rng.expovariate(rate)
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if rng.random() < health_ratio:
+            tasks.append(asyncio.create_task(health_request(arrival)))
+        else:
+            tasks.append(asyncio.create_task(render_request(make_payload(rng), arrival)))
+    await asyncio.gather(*tasks)
+
+    if pool is not None:
+        pool.shutdown()
+    return latencies, busy
+
+
+def report(label, latencies, busy):
+    print(f"\n== {label} ==")
+    for kind, values in latencies.items():
+        if not values:
+            continue
+        print(
+            f"  {kind:<7} n={len(values):<5} "
+            f"p50={percentile(values, 50) * 1000:8.2f} ms  "
+            f"p99={percentile(values, 99) * 1000:8.2f} ms"
+        )
+    if busy:
+        print(f"  rejected (pool busy): {busy}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--rate', type=float, default=20.0, help="arrivals per second")
+    parser.add_argument('--health-ratio', type=float, default=0.5)
+    parser.add_argument('--pool-kind', choices=['thread', 'process'], default='thread')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    for mode in ('inline', 'pool'):
+        latencies, busy = asyncio.run(run_mix(
+            mode, args.requests, args.rate, args.health_ratio,
+            args.pool_kind, args.workers, args.seed,
+        ))
+        label = "before: render on event loop" if mode == 'inline' else f"after: {args.pool_kind} pool x{args.workers}"
+        report(label, latencies, busy)
+
+
+if __name__ == '__main__':
+    main()
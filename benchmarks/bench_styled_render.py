@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Styled render benchmark
+Times plain PNG rendering against each module shape and output format of the
+styled engine (split into QR matrix and compositing/encoding time) for small to
+large payloads, and checks that every raster output decodes again
+
+Usage: python benchmarks/bench_styled_render.py [--repeat 20]
+"""
+
+import argparse
+import io
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from decoding import decode_qr_image
+from rendering import render_qr_png_timed, render_styled_qr_timed
+from styles import QRStyle
+
+PAYLOAD_SIZES = (16, 120, 600)
+
+STYLES = (
+    ('square png', QRStyle()),
+    ('rounded png', QRStyle(fg=(26, 115, 232), shape='rounded')),
+    ('dots png', QRStyle(shape='dots')),
+    ('rounded transparent', QRStyle(shape='rounded', bg=None)),
+    ('dots webp', QRStyle(shape='dots', format='webp')),
+    ('rounded svg', QRStyle(shape='rounded', format='svg')),
+    ('rounded 1024px', QRStyle(shape='rounded', size=1024)),
+)
+
+
+def timed(func, repeat):
+    """Median (make ms, encode ms) and the last output"""
+    makes, encodes = [], []
+    for _ in range(repeat):
+        data, make_seconds, encode_seconds = func()
+        makes.append(make_seconds * 1000)
+        encodes.append(encode_seconds * 1000)
+    return float(np.median(makes)), float(np.median(encodes)), data
+
+
+def decodes(data, payload):
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        rgba = np.asarray(img.convert('RGBA'), dtype=np.float32)
+    # Flatten transparency onto white, as a chat client shows it
+    gray = (rgba[..., :3] * rgba[..., 3:] / 255 + 255 * (1 - rgba[..., 3:] / 255)).mean(axis=2)
+    bio = io.BytesIO()
+    Image.fromarray(gray.astype(np.uint8)).save(bio, 'PNG')
+    return decode_qr_image(np.frombuffer(bio.getvalue(), np.uint8)).codes == [payload]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'payload':>8s}  {'style':20s} {'make ms':>8s} {'encode ms':>10s} {'bytes':>8s}  decodes")
+    for size in PAYLOAD_SIZES:
+        payload = "https://example.com/" + "x" * max(0, size - 20)
+        make_ms, encode_ms, data = timed(lambda: render_qr_png_timed(payload), args.repeat)
+        print(f"{size:8d}  {'plain png':20s} {make_ms:8.2f} {encode_ms:10.2f} {len(data):8d}  {decodes(data, payload)}")
+        for label, style in STYLES:
+            make_ms, encode_ms, data = timed(lambda: render_styled_qr_timed(payload, style), args.repeat)
+            check = '-' if style.format == 'svg' else decodes(data, payload)
+            print(f"{size:8d}  {label:20s} {make_ms:8.2f} {encode_ms:10.2f} {len(data):8d}  {check}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the webhook app
+Starts the aiohttp app from qrmm.create_app against a local stub of the Bot API
+(getFile, file download, sendPhoto, sendMessage, ...), replays a mix of
+synthetic text, styled text, photo, command, inline and batch updates into /webhook/<token> at a
+fixed rate and reports throughput, p50/p95/p99 latency per update type and peak RSS
+
+Latency is measured from the webhook POST to the bot's reply reaching the stub
+(sendPhoto/sendMessage/answerInlineQuery), or to the webhook response for
+static replies answered in the response body. Each update uses its own chat, so
+replies can be matched without parsing message ids
+
+--local-files stands in for a self-hosted Bot API server, so photos are read
+from disk; --pool-size sets the bot's Bot API connection pool
+
+Batch updates send more than BATCH_ALBUM_MAX lines; the run fails unless each
+one is answered with a ZIP holding a PNG per line
+
+Usage:
+  python benchmarks/loadtest.py --rate 20 --duration 30 --mix text=0.5,photo=0.4,inline=0.1
+  python benchmarks/loadtest.py --rate 40 --mix photo=1 --local-files --pool-size 8
+  python benchmarks/loadtest.py --rate 2 --duration 5 --mix batch=1
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import zipfile
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TOKEN = '123456:LOADTEST'
+BOT_PORT = 18080
+API_PORT = 18081
+
+# qrmm reads its configuration at import time
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', TOKEN)
+os.environ.setdefault('WEBHOOK_URL', f'http://127.0.0.1:{BOT_PORT}')
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='qrbot-loadtest-'))
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+from aiohttp import ClientSession, web  # noqa: E402
+from telegram.ext import Application  # noqa: E402
+
+import qrmm  # noqa: E402
+from botapi import build_request  # noqa: E402
+from metrics import process_rss_bytes  # noqa: E402
+from rendering import render_qr_png  # noqa: E402
+
+# Option strings for styled updates
+STYLE_OPTIONS = ('shape=dots fg=#1a73e8', 'shape=rounded fg=navy bg=cream', 'format=svg shape=rounded',
+                 'format=webp size=600', 'bg=transparent shape=dots')
+
+REPLY_METHODS = {'sendPhoto', 'sendMessage', 'sendMediaGroup', 'sendDocument'}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+
+def make_photo_set(seed):
+    """Three JPEG sizes of the same QR photo, like Telegram's PhotoSize list"""
+    rng = random.Random(seed)
+    payload = f"https://example.com/{rng.randint(0, 10 ** 9)}"
+    qr = cv2.imdecode(np.frombuffer(render_qr_png(payload), np.uint8), cv2.IMREAD_GRAYSCALE)
+    canvas = np.full((1280, 960), 200, dtype=np.uint8)
+    qr = cv2.resize(qr, (600, 600), interpolation=cv2.INTER_NEAREST)
+    canvas[340:940, 180:780] = qr
+    sizes = []
+    for longest in (320, 800, 1280):
+        scale = longest / 1280
+        img = cv2.resize(canvas, (int(960 * scale), longest), interpolation=cv2.INTER_AREA)
+        _, jpeg = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        sizes.append((img.shape[1], img.shape[0], jpeg.tobytes()))
+    return sizes
+
+
+class FakeBotAPI:
+    """Stub Bot API: records reply times per chat and serves photo files
+
+    With file_dir it stands in for a local Bot API server (--local): files are
+    written there and getFile returns their absolute paths instead of URLs
+    """
+
+    def __init__(self, photo_sets, file_dir=None):
+        self.photo_sets = photo_sets
+        self.file_dir = file_dir
+        self.files = {}
+        self.replies = {}
+        self.calls = defaultdict(int)
+        self.zip_pngs = []  # PNG count of every valid ZIP uploaded with sendDocument
+        self.message_id = 1000
+        for set_index, sizes in enumerate(photo_sets):
+            for size_index, (_w, _h, data) in enumerate(sizes):
+                self.files[f"photo-{set_index}-{size_index}"] = data
+        if file_dir is not None:
+            for name, data in self.files.items():
+                with open(os.path.join(file_dir, f"{name}.jpg"), 'wb') as f:
+                    f.write(data)
+
+    def _message(self, chat_id, extra=None):
+        self.message_id += 1
+        message = {
+            'message_id': self.message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'},
+        }
+        if extra:
+            message.update(extra)
+        return message
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] += 1
+        if request.content_type == 'application/json':
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+        chat_id = data.get('chat_id')
+        if method == 'sendDocument' and isinstance(data.get('document'), web.FileField):
+            with zipfile.ZipFile(data['document'].file) as archive:
+                names = archive.namelist()
+            self.zip_pngs.append(sum(name.endswith('.png') for name in names))
+        if method in REPLY_METHODS and chat_id is not None:
+            self.replies.setdefault(int(chat_id), time.perf_counter())
+        if method == 'answerInlineQuery':
+            self.replies.setdefault(f"inline:{data.get('inline_query_id')}", time.perf_counter())
+
+        if method == 'getMe':
+            result = {'id': 123456, 'is_bot': True, 'first_name': 'LoadTest', 'username': 'loadtest_bot'}
+        elif method == 'getFile':
+            file_id = data['file_id']
+            file_path = f"photos/{file_id}.jpg"
+            if self.file_dir is not None:
+                file_path = os.path.join(self.file_dir, f"{file_id}.jpg")
+            result = {'file_id': file_id, 'file_unique_id': file_id, 'file_size': len(self.files[file_id]),
+                      'file_path': file_path}
+        elif method == 'sendPhoto':
+            uploaded = f"uploaded-{self.message_id}"
+            result = self._message(chat_id, {'photo': [
+                {'file_id': uploaded, 'file_unique_id': uploaded, 'width': 200, 'height': 200}
+            ]})
+        elif method in ('sendMessage', 'sendDocument'):
+            result = self._message(chat_id, {'text': 'ok'})
+        elif method == 'sendMediaGroup':
+            result = [self._message(chat_id)]
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def handle_file(self, request: web.Request) -> web.Response:
+        self.calls['file download'] += 1
+        name = os.path.splitext(os.path.basename(request.match_info['path']))[0]
+        return web.Response(body=self.files[name], content_type='image/jpeg')
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self.handle_method)
+        app.router.add_get('/file/bot{token}/{path:.+}', self.handle_file)
+        return app
+
+
+class UpdateFactory:
+    """Synthetic updates; each one gets its own chat/user id"""
+
+    def __init__(self, photo_sets, repeat_ratio, seed):
+        self.rng = random.Random(seed)
+        self.photo_sets = photo_sets
+        self.repeat_ratio = repeat_ratio
+        self.update_id = 0
+        self.hot_payloads = [f"https://t.me/popular/{index}" for index in range(20)]
+
+    def _base(self):
+        self.update_id += 1
+        user = {'id': 10 ** 6 + self.update_id, 'is_bot': False, 'first_name': 'Load'}
+        return self.update_id, user
+
+    def text(self):
+        update_id, user = self._base()
+        if self.rng.random() < self.repeat_ratio:
+            payload = self.rng.choice(self.hot_payloads)
+        else:
+            payload = f"https://example.com/{update_id}/" + 'x' * self.rng.randint(0, 200)
+        return user['id'], {'update_id': update_id, 'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': payload,
+            'chat': {'id': user['id'], 'type': 'private'}, 'from': user,
+        }}
+
+    def photo(self):
+        update_id, user = self._base()
+        set_index = self.rng.randrange(len(self.photo_sets))
+        # Repeated photos share file_unique_id (forwards), others are unique
+        unique = f"set{set_index}" if self.rng.random() < self.repeat_ratio else f"u{update_id}"
+        sizes = [
+            {'file_id': f"photo-{set_index}-{size_index}", 'file_unique_id': f"{unique}-{size_index}",
+             'width': width, 'height': height, 'file_size': len(data)}
+            for size_index, (width, height, data) in enumerate(self.photo_sets[set_index])
+        ]
+        return user['id'], {'update_id': update_id, 'message': {
+            'message_id': update_id, 'date': int(time.time()), 'photo': sizes,
+            'chat': {'id': user['id'], 'type': 'private'}, 'from': user,
+        }}
+
+    def styled(self):
+        """Text with style options; every third one puts a logo from the replied-to photo"""
+        key, update = self.text()
+        message = update['message']
+        message['text'] += " | " + self.rng.choice(STYLE_OPTIONS)
+        if update['update_id'] % 3 == 0:
+            _key, photo_update = self.photo()
+            message['text'] += " logo"
+            message['reply_to_message'] = photo_update['message']
+        return key, update
+
+    def command(self):
+        update_id, user = self._base()
+        text = self.rng.choice(['/start', '/help', '/update', '/unknown'])
+        return user['id'], {'update_id': update_id, 'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}],
+            'chat': {'id': user['id'], 'type': 'private'}, 'from': user,
+        }}
+
+    def inline(self):
+        update_id, user = self._base()
+        query_id = str(update_id)
+        return f"inline:{query_id}", {'update_id': update_id, 'inline_query': {
+            'id': query_id, 'from': user, 'query': f"hello {update_id % 50}", 'offset': '',
+        }}
+
+    def batch(self):
+        """/batch with more lines than BATCH_ALBUM_MAX, so it is answered with a ZIP"""
+        update_id, user = self._base()
+        lines = [f"https://example.com/batch/{update_id}/{index}" for index in range(qrmm.BATCH_ALBUM_MAX + 11)]
+        text = '/batch\n' + '\n'.join(lines)
+        return user['id'], {'update_id': update_id, 'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len('/batch')}],
+            'chat': {'id': user['id'], 'type': 'private'}, 'from': user,
+        }}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+async def run(args):
+    photo_sets = [make_photo_set(seed) for seed in range(4)]
+    fake = FakeBotAPI(photo_sets, tempfile.mkdtemp(prefix='qrbot-botapi-') if args.local_files else None)
+    api_runner = web.AppRunner(fake.app())
+    await api_runner.setup()
+    await web.TCPSite(api_runner, '127.0.0.1', API_PORT).start()
+
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(f"http://127.0.0.1:{API_PORT}/bot")
+        .base_file_url(f"http://127.0.0.1:{API_PORT}/file/bot")
+        .local_mode(args.local_files)
+        .request(build_request(args.pool_size, qrmm.BOT_API_KEEPALIVE, qrmm.BOT_API_POOL_TIMEOUT,
+                               qrmm.BOT_API_TIMEOUT))
+        .rate_limiter(qrmm.outbound_limiter)
+        .build()
+    )
+    qrmm.setup_handlers(application)
+    await application.initialize()
+    await application.start()
+    await qrmm.start_analytics(application)
+    bot_app = qrmm.create_app(application)
+    bot_app['ready'].set()
+    bot_runner = web.AppRunner(bot_app)
+    await bot_runner.setup()
+    await web.TCPSite(bot_runner, '127.0.0.1', BOT_PORT).start()
+
+    factory = UpdateFactory(photo_sets, args.repeat_ratio, args.seed)
+    mix = parse_mix(args.mix)
+    kinds, weights = list(mix), list(mix.values())
+    rng = random.Random(args.seed)
+    sent = {}
+    ack_latency = defaultdict(list)
+    status_counts = defaultdict(int)
+    peak_rss = process_rss_bytes()
+
+    async def post(session, kind, key, payload):
+        started = time.perf_counter()
+        sent[key] = (kind, started)
+        async with session.post(f"http://127.0.0.1:{BOT_PORT}/webhook/{TOKEN}", json=payload) as resp:
+            status_counts[resp.status] += 1
+            # Static replies come back as a method call in the webhook response body
+            if resp.content_type == 'application/json' and 'method' in await resp.json():
+                fake.replies.setdefault(key, time.perf_counter())
+        ack_latency[kind].append(time.perf_counter() - started)
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while True:
+            peak_rss = max(peak_rss, process_rss_bytes())
+            await asyncio.sleep(0.1)
+
+    sampler = asyncio.create_task(sample_rss())
+    total = int(args.rate * args.duration)
+    started = time.perf_counter()
+    async with ClientSession() as session:
+        posts = []
+        next_at = started
+        for _ in range(total):
+            next_at += rng.expovariate(args.rate)
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            kind = rng.choices(kinds, weights)[0]
+            key, payload = getattr(factory, kind)()
+            posts.append(asyncio.create_task(post(session, kind, key, payload)))
+        await asyncio.gather(*posts)
+
+        # Wait for outstanding replies
+        deadline = time.perf_counter() + args.drain
+        while len(fake.replies) < len(sent) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+
+    latency = defaultdict(list)
+    for key, (kind, sent_at) in sent.items():
+        replied_at = fake.replies.get(key)
+        if replied_at is not None:
+            latency[kind].append(replied_at - sent_at)
+
+    completed = sum(len(values) for values in latency.values())
+    print(f"\nupdates sent: {len(sent)} at {args.rate}/s, replies: {completed}, elapsed {elapsed:.1f}s")
+    print(f"throughput: {completed / elapsed:.1f} replies/s, webhook statuses: {dict(status_counts)}")
+    print(f"{'type':<8} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ack p99':>9}")
+    for kind in kinds:
+        values = latency[kind]
+        print(
+            f"{kind:<8} {len(values):>5} {percentile(values, 50) * 1000:>9.1f} {percentile(values, 95) * 1000:>9.1f} "
+            f"{percentile(values, 99) * 1000:>9.1f} {percentile(ack_latency[kind], 99) * 1000:>9.1f}"
+        )
+    print(f"peak RSS: {peak_rss / 1024 / 1024:.1f} MB (harness and bot share one process)")
+    print(f"Bot API calls: {dict(fake.calls)}")
+    summary = await qrmm.analytics.summary()
+    print(f"analytics: generate {summary['generate']}, decode {summary['decode']}, log {qrmm.analytics.stats()}")
+
+    ok = True
+    batches = sum(1 for kind, _sent_at in sent.values() if kind == 'batch')
+    if batches:
+        expected = qrmm.BATCH_ALBUM_MAX + 11
+        complete = sum(1 for count in fake.zip_pngs if count == expected)
+        print(f"batch ZIPs: {complete} of {batches} with {expected} PNGs")
+        ok = complete == batches
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'rate': args.rate,
+                'throughput': completed / elapsed,
+                'peak_rss_bytes': peak_rss,
+                'latency_ms': {
+                    kind: {p: percentile(latency[kind], p) * 1000 for p in (50, 95, 99)} for kind in kinds
+                },
+            }, f, indent=2)
+
+    await bot_runner.cleanup()
+    await application.stop()
+    await qrmm.stop_analytics(application)
+    await application.shutdown()
+    await api_runner.cleanup()
+    qrmm.render_pool.shutdown()
+    qrmm.decode_pool.shutdown()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=20.0, help="updates per second")
+    parser.add_argument('--duration', type=float, default=20.0, help="seconds of traffic")
+    parser.add_argument('--mix', default='text=0.5,photo=0.4,inline=0.1')
+    parser.add_argument('--repeat-ratio', type=float, default=0.3, help="share of repeated payloads/photos")
+    parser.add_argument('--drain', type=float, default=30.0, help="seconds to wait for late replies")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="also write the summary to this file")
+    parser.add_argument('--pool-size', type=int, default=qrmm.BOT_API_POOL_SIZE, help="Bot API connection pool")
+    parser.add_argument('--local-files', action='store_true',
+                        help="stub a local Bot API server: photos are read from disk instead of downloaded")
+    if not asyncio.run(run(parser.parse_args())):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Bot API client settings
+Connection pool, keep-alive and HTTP version of the bot's HTTPX client, and
+file access for a self-hosted Bot API server started with --local, whose
+getFile paths point at files on this machine
+"""
+
+import os
+from importlib.util import find_spec
+
+import httpx
+from telegram.request import HTTPXRequest
+
+# HTTP/2 needs the h2 package (pip install "python-telegram-bot[http2]")
+HTTP2_SUPPORTED = find_spec('h2') is not None
+
+
+def build_request(pool_size: int, keepalive: float, pool_timeout: float, timeout: float,
+                  http2: bool = False) -> HTTPXRequest:
+    """HTTPX request for Bot API calls with a sized, keep-alive connection pool
+
+    Every connection may stay idle for `keepalive` seconds, so bursts reuse warm
+    TLS connections; callers wait up to `pool_timeout` for a free one
+    """
+    limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=keepalive,
+    )
+    return HTTPXRequest(
+        connection_pool_size=pool_size,
+        read_timeout=timeout,
+        write_timeout=timeout,
+        connect_timeout=timeout,
+        pool_timeout=pool_timeout,
+        http_version='2' if http2 else '1.1',
+        httpx_kwargs={'limits': limits},
+    )
+
+
+def local_file_path(telegram_file):
+    """Path of the file on this machine when a local Bot API server returned it, else None"""
+    path = telegram_file.file_path
+    if telegram_file.get_bot().local_mode and path and os.path.isabs(path):
+        return path
+    return None
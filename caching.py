@@ -0,0 +1,281 @@
+"""
+LRU caches with optional SQLite persistence on the /data volume
+In shared mode several processes use one database: a local miss reads
+through to SQLite, so an entry stored by any worker is a hit in all of them
+Lookups and writes on the event loop never touch SQLite: read-through runs in
+a thread and writes are queued for a background task to flush in batches
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Seconds a write waits for another process holding the database lock
+_BUSY_TIMEOUT = 2.0
+
+
+def make_key(*parts) -> str:
+    """Stable hash key from payload and settings (payloads are never stored in clear)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """In-memory LRU cache with hit/miss counters, per-entry TTL and optional SQLite persistence
+
+    shared=True is for a database used by several processes: misses in fetch()
+    read through to it, and local evictions leave rows in place (the table is
+    trimmed to capacity by recency instead), since other processes may still use them
+
+    put() and invalidate() only queue the database change; run() writes the
+    queue every flush_interval seconds, or as soon as batch_size changes are waiting
+    """
+
+    def __init__(self, name, capacity=10000, db_path=None, shared=False, flush_interval=1.0, batch_size=64):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.shared = shared
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.shared_hits = 0
+        self._puts = 0
+        self._data = OrderedDict()
+        # key -> (value, expires) to store, or None to delete; the latest change per key wins
+        self._pending = {}
+        self._wakeup = None
+        self._lock = threading.Lock()
+        self._db = None
+        # Shared caches read through on their own connection, so lookups never queue
+        # behind a flush waiting for another process's write lock (WAL readers are not blocked)
+        self._reader = None
+        self._read_lock = threading.Lock()
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path) -> None:
+        try:
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+            self._db = sqlite3.connect(db_path, timeout=_BUSY_TIMEOUT, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.name} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, updated REAL NOT NULL, expires REAL)"
+            )
+            columns = [row[1] for row in self._db.execute(f"PRAGMA table_info({self.name})")]
+            if 'expires' not in columns:
+                # Tables created before TTL support
+                self._db.execute(f"ALTER TABLE {self.name} ADD COLUMN expires REAL")
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS {self.name}_updated ON {self.name} (updated)")
+            self._db.execute(f"DELETE FROM {self.name} WHERE expires IS NOT NULL AND expires < ?", (time.time(),))
+            self._db.commit()
+            # Warm the in-memory cache with the most recently used entries
+            rows = self._db.execute(
+                f"SELECT key, value, expires FROM {self.name} ORDER BY updated DESC LIMIT ?",
+                (self.capacity,),
+            ).fetchall()
+            for key, value, expires in reversed(rows):
+                self._data[key] = (json.loads(value), expires)
+            logger.info(f"Loaded {len(rows)} entries into '{self.name}' cache from {db_path}")
+            if self.shared:
+                self._reader = sqlite3.connect(db_path, timeout=_BUSY_TIMEOUT, check_same_thread=False)
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"Cache '{self.name}' persistence disabled: {e}")
+            self._db = None
+
+    def _local(self, key):
+        """Value held in this process or None, moving it to the most recently used end"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires < time.time():
+            if self.shared:
+                # Another process may have stored a fresh value under this key since
+                self._data.pop(key, None)
+            else:
+                self.invalidate(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def _count(self, value) -> None:
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    def get(self, key):
+        """Return the value held in this process or None, updating LRU order and counters (no I/O)"""
+        value = self._local(key)
+        self._count(value)
+        return value
+
+    async def fetch(self, key):
+        """Like get(), but a shared cache reads a local miss through from the database in a thread"""
+        value = self._local(key)
+        if value is None and self._reader is not None:
+            entry = await asyncio.to_thread(self._read_through, key)
+            if key in self._data:
+                # put() while the read ran: that value is newer than the row
+                value = self._local(key)
+            elif entry is not None:
+                # Entry stored by another process; kept locally without writing it back
+                self._data[key] = entry
+                self._evict()
+                self.shared_hits += 1
+                value = entry[0]
+        self._count(value)
+        return value
+
+    def _read_through(self, key):
+        try:
+            with self._read_lock:
+                if self._reader is None:
+                    return None
+                row = self._reader.execute(f"SELECT value, expires FROM {self.name} WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Cache '{self.name}' read failed: {e}")
+            return None
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _evict(self) -> list:
+        evicted = []
+        while len(self._data) > self.capacity:
+            old_key, _ = self._data.popitem(last=False)
+            evicted.append(old_key)
+            self.evictions += 1
+        return evicted
+
+    def put(self, key, value, ttl=None) -> None:
+        """Insert or replace a value, evicting the least recently used entry if full"""
+        expires = time.time() + ttl if ttl is not None else None
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        evicted = self._evict()
+        self._queue(key, (value, expires))
+        if not self.shared:
+            for old_key in evicted:
+                self._queue(old_key, None)
+
+    def invalidate(self, key) -> None:
+        """Drop a single entry (e.g. a file_id Telegram no longer accepts)"""
+        self._data.pop(key, None)
+        self._queue(key, None)
+
+    def _queue(self, key, entry) -> None:
+        if self._db is None:
+            return
+        self._pending.pop(key, None)
+        self._pending[key] = entry
+        if self._wakeup is not None and len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def run(self) -> None:
+        """Flush queued writes every flush_interval seconds, or as soon as a batch is waiting"""
+        if self._db is None:
+            return
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Write all queued changes off the event loop; returns how many were written"""
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        if not await asyncio.to_thread(self._write, batch):
+            # e.g. another process held the lock past the busy timeout: retry on the next flush,
+            # keeping changes queued since then (they are newer)
+            for key, entry in batch.items():
+                if len(self._pending) >= self.capacity:
+                    break
+                self._pending.setdefault(key, entry)
+            return 0
+        return len(batch)
+
+    def _write(self, batch: dict) -> bool:
+        now = time.time()
+        rows = [(key, json.dumps(entry[0]), now, entry[1]) for key, entry in batch.items() if entry is not None]
+        deleted = [(key,) for key, entry in batch.items() if entry is None]
+        try:
+            with self._lock:
+                if self._db is None:
+                    return True
+                with self._db:
+                    if rows:
+                        self._db.executemany(
+                            f"INSERT OR REPLACE INTO {self.name} (key, value, updated, expires) VALUES (?, ?, ?, ?)",
+                            rows,
+                        )
+                    if deleted:
+                        self._db.executemany(f"DELETE FROM {self.name} WHERE key = ?", deleted)
+                    if self.shared and rows:
+                        trim_every = max(1, self.capacity // 16)
+                        if (self._puts + len(rows)) // trim_every > self._puts // trim_every:
+                            self._trim()
+                        self._puts += len(rows)
+        except sqlite3.Error as e:
+            logger.error(f"Cache '{self.name}' write of {len(batch)} changes failed: {e}")
+            return False
+        return True
+
+    def _trim(self) -> None:
+        # Shared tables keep the `capacity` most recently written rows
+        self._db.execute(
+            f"DELETE FROM {self.name} WHERE updated < "
+            f"(SELECT updated FROM {self.name} ORDER BY updated DESC LIMIT 1 OFFSET ?)",
+            (self.capacity - 1,),
+        )
+
+    def close(self) -> None:
+        """Write the changes still queued and close the database"""
+        if self._db is not None:
+            batch, self._pending = self._pending, {}
+            if batch:
+                self._write(batch)
+            with self._lock:
+                self._db.close()
+                self._db = None
+            with self._read_lock:
+                if self._reader is not None:
+                    self._reader.close()
+                    self._reader = None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Snapshot of cache counters"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "shared_hits": self.shared_hits,
+            "pending_writes": len(self._pending),
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
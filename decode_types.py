@@ -0,0 +1,220 @@
+"""
+Decode pipeline types and main-process bookkeeping
+Kept free of OpenCV and NumPy so importing them costs nothing at startup
+"""
+
+from typing import NamedTuple, Optional
+
+# Images larger than this (longest side, pixels) are downscaled before detection
+MAX_DECODE_SIDE = 2048
+
+# Reduced-resolution JPEG decode factors (cv2.IMREAD_REDUCED_GRAYSCALE_*), 1 = full size
+REDUCE_FACTORS = (1, 2, 4, 8)
+
+# Reduced decodes are only offered while the longest side stays at least this large
+MIN_REDUCED_SIDE = 800
+
+# Frames FFmpeg keeps decoded for reference (single-threaded decoding)
+VIDEO_REFERENCE_FRAMES = 8
+
+# Measured peak of the detection stages per analysed pixel (detector copies, pyramid, thresholds)
+SCRATCH_BYTES_PER_PIXEL = 7
+
+# Pipeline stages in the order they are tried
+STAGES = ('gray', 'pyramid', 'binarize')
+
+# Stages for photo sizes that are not the last one tried: binarisation is the
+# expensive fallback for photos without a code, so it only runs once, at the
+# largest size
+LADDER_STAGES = ('gray', 'pyramid')
+
+
+def estimate_decode_bytes(file_size: int, width: int, height: int, reduce: int = 1,
+                          input_copies: int = 1) -> int:
+    """Peak memory of decoding one grayscale image through the pipeline
+
+    imdecode peaks at about two bytes per decoded pixel (libjpeg buffers plus the
+    output), then the stages work on a copy capped at MAX_DECODE_SIDE
+    """
+    width, height = -(-width // reduce), -(-height // reduce)
+    pixels = width * height
+    scale = min(1.0, MAX_DECODE_SIDE / max(width, height, 1))
+    analysed = int(pixels * scale * scale)
+    return file_size * input_copies + max(2 * pixels, pixels + SCRATCH_BYTES_PER_PIXEL * analysed)
+
+
+def decode_options(file_size: int, width: int, height: int, input_copies: int = 1,
+                   first_reduce: int = 1) -> list:
+    """(reduce, estimated bytes) for the preferred decode and each acceptable reduced decode"""
+    options = [(first_reduce, estimate_decode_bytes(file_size, width, height, first_reduce, input_copies))]
+    for reduce in REDUCE_FACTORS:
+        if reduce <= first_reduce:
+            continue
+        if max(width, height) // reduce < MIN_REDUCED_SIDE:
+            break
+        options.append((reduce, estimate_decode_bytes(file_size, width, height, reduce, input_copies)))
+    return options
+
+
+def bounded_reduce(width: int, height: int) -> int:
+    """Largest reduce factor that keeps the image at least MAX_DECODE_SIDE long
+
+    The pipeline downscales to MAX_DECODE_SIDE anyway, so decoding a large JPEG at
+    this factor loses nothing and needs a fraction of the memory
+    """
+    longest = max(width, height)
+    factor = 1
+    for reduce in REDUCE_FACTORS:
+        if longest // reduce >= MAX_DECODE_SIDE:
+            factor = reduce
+    return factor
+
+
+def estimate_page_bytes(file_size: int, render_side: int) -> int:
+    """Peak memory of rendering one PDF page (grayscale, longest side render_side) and scanning it"""
+    # pdfium keeps the document and its decoded resources around: count the file twice
+    return 2 * file_size + estimate_decode_bytes(0, render_side, render_side)
+
+
+def estimate_frame_bytes(width: int, height: int) -> int:
+    """Peak memory of decoding and scanning video frames of this size
+
+    FFmpeg holds a few reference frames (YUV 4:2:0, 1.5 bytes per pixel); each
+    sampled frame is converted to BGR and then grayscale before the pipeline
+    """
+    pixels = width * height
+    return int(VIDEO_REFERENCE_FRAMES * 1.5 * pixels) + 4 * pixels + estimate_decode_bytes(0, width, height)
+
+
+class InvalidImageError(Exception):
+    """Raised when the image bytes cannot be decoded by OpenCV"""
+
+
+class MediaTooLargeError(Exception):
+    """Raised when a document or video exceeds the byte, pixel or duration caps"""
+
+
+class DecodeResult(NamedTuple):
+    """Payloads found, the stage that found them, per-stage CPU time (ms) and imdecode time (ms)"""
+    codes: list
+    stage: Optional[str]
+    timings: dict
+    decode_ms: float = 0.0
+
+
+class MediaResult(NamedTuple):
+    """Scan of a document or video: payloads, pages/frames scanned, CPU time (ms), whether a cap stopped it"""
+    codes: list
+    units: int
+    cpu_ms: float
+    capped: bool = False
+
+
+class PipelineStats:
+    """Per-stage run/success counters and CPU time, recorded in the main process"""
+
+    def __init__(self):
+        self.stages = {stage: {"runs": 0, "successes": 0, "cpu_ms": 0.0} for stage in STAGES}
+        self.images = 0
+        self.decoded = 0
+
+    def record(self, result: DecodeResult) -> None:
+        self.images += 1
+        if result.codes:
+            self.decoded += 1
+        for stage, elapsed_ms in result.timings.items():
+            entry = self.stages[stage]
+            entry["runs"] += 1
+            entry["cpu_ms"] += elapsed_ms
+        if result.stage is not None:
+            self.stages[result.stage]["successes"] += 1
+
+    def stats(self) -> dict:
+        """Counters plus average CPU ms per stage run"""
+        return {
+            "images": self.images,
+            "decoded": self.decoded,
+            "stages": {
+                stage: {
+                    "runs": entry["runs"],
+                    "successes": entry["successes"],
+                    "avg_cpu_ms": round(entry["cpu_ms"] / entry["runs"], 2) if entry["runs"] else 0.0,
+                }
+                for stage, entry in self.stages.items()
+            },
+        }
+
+
+class ResolutionLadder:
+    """Pick a mid-size PhotoSize first and escalate to larger ones only when detection fails"""
+
+    # Telegram's usual PhotoSize tiers (longest side, pixels)
+    TIERS = (90, 320, 800, 1280, 2560)
+
+    def __init__(self, start_side: int = 800):
+        self.start_side = start_side
+        self.stats_by_tier = {tier: {"attempts": 0, "successes": 0} for tier in self.TIERS}
+
+    @classmethod
+    def tier_of(cls, photo_size) -> int:
+        """Map a PhotoSize to the nearest standard tier"""
+        side = max(photo_size.width, photo_size.height)
+        return min(cls.TIERS, key=lambda tier: abs(tier - side))
+
+    def candidates(self, photo_sizes) -> list:
+        """Sizes to try in order: the smallest one >= start_side, then every larger one"""
+        ordered = sorted(photo_sizes, key=lambda p: p.width * p.height)
+        for index, photo_size in enumerate(ordered):
+            if max(photo_size.width, photo_size.height) >= self.start_side:
+                return ordered[index:]
+        # Every variant is smaller than start_side, only the largest is worth trying
+        return ordered[-1:]
+
+    def record(self, photo_size, success: bool) -> None:
+        """Count an attempt (and success) for the size's tier"""
+        entry = self.stats_by_tier[self.tier_of(photo_size)]
+        entry["attempts"] += 1
+        if success:
+            entry["successes"] += 1
+
+    def stats(self) -> dict:
+        """Per-tier attempts, successes and success rate"""
+        return {
+            "start_side": self.start_side,
+            "tiers": {
+                str(tier): {
+                    **entry,
+                    "success_rate": round(entry["successes"] / entry["attempts"], 4) if entry["attempts"] else 0.0,
+                }
+                for tier, entry in self.stats_by_tier.items()
+                if entry["attempts"]
+            },
+        }
+
+
+class MediaStats:
+    """Per-kind scan counters for documents and videos, recorded in the main process"""
+
+    def __init__(self, kinds=('image', 'pdf', 'video')):
+        self.kinds = {kind: {"scans": 0, "found": 0, "units": 0, "capped": 0, "cpu_ms": 0.0} for kind in kinds}
+
+    def record(self, kind: str, result: MediaResult) -> None:
+        entry = self.kinds[kind]
+        entry["scans"] += 1
+        entry["found"] += bool(result.codes)
+        entry["units"] += result.units
+        entry["capped"] += result.capped
+        entry["cpu_ms"] += result.cpu_ms
+
+    def stats(self) -> dict:
+        """Counters plus average pages/frames and CPU ms per scan"""
+        return {
+            kind: {
+                "scans": entry["scans"],
+                "found": entry["found"],
+                "capped": entry["capped"],
+                "avg_units": round(entry["units"] / entry["scans"], 2) if entry["scans"] else 0.0,
+                "avg_cpu_ms": round(entry["cpu_ms"] / entry["scans"], 2) if entry["scans"] else 0.0,
+            }
+            for kind, entry in self.kinds.items()
+        }
@@ -0,0 +1,169 @@
+"""
+QR Code decoding helpers (OpenCV)
+Each worker keeps its own long-lived QRCodeDetector instead of creating one per photo
+"""
+
+import mmap
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Light types live in decode_types so the bot can use them without importing cv2
+from decode_types import (  # noqa: F401
+    MAX_DECODE_SIDE, STAGES, DecodeResult, InvalidImageError, PipelineStats, ResolutionLadder,
+)
+
+# First pipeline stage works on a reduced-resolution copy (longest side, pixels)
+FAST_DECODE_SIDE = 1024
+
+# Binarisation and contrast fallbacks run on a smaller copy (longest side, pixels)
+BINARIZE_DECODE_SIDE = 800
+
+# Pyramid levels stop once the shorter side would drop below this
+MIN_PYRAMID_SIDE = 160
+
+# imread flags per reduce factor; JPEGs are decoded at the reduced size directly
+_READ_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+_local = threading.local()
+
+
+def get_detector() -> cv2.QRCodeDetector:
+    """Return this worker's detector, creating it on first use"""
+    detector = getattr(_local, 'detector', None)
+    if detector is None:
+        detector = cv2.QRCodeDetector()
+        _local.detector = detector
+    return detector
+
+
+def warm_up_worker() -> None:
+    """Pool initializer: create the detector and run one detection to warm it up"""
+    blank = np.full((64, 64), 255, dtype=np.uint8)
+    get_detector().detectAndDecode(blank)
+
+
+def limit_size(img, max_side: int = MAX_DECODE_SIDE):
+    """Downscale an image so its longest side is at most max_side"""
+    height, width = img.shape[:2]
+    longest = max(height, width)
+    if longest <= max_side:
+        return img
+    scale = max_side / longest
+    return cv2.resize(img, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+def _detect(img) -> list:
+    try:
+        data, _vertices, _straight_qrcode = get_detector().detectAndDecode(img)
+    except cv2.error:
+        return []
+    return [data] if data else []
+
+
+def _detect_multi(img) -> list:
+    try:
+        ok, decoded_info, _points, _straight_qrcode = get_detector().detectAndDecodeMulti(img)
+    except cv2.error:
+        return []
+    if not ok:
+        return []
+    return [data for data in decoded_info if data]
+
+
+def _stage_gray(full, fast) -> list:
+    # Multi detection first so photos with several codes report all of them;
+    # the single-code detector still reads some codes the multi one misses
+    return _detect_multi(fast) or _detect(fast)
+
+
+def _stage_pyramid(full, fast) -> list:
+    # Full resolution first (if the fast copy was reduced), then smaller levels
+    if full is not fast:
+        codes = _detect(full)
+        if codes:
+            return codes
+    level = fast
+    while min(level.shape[:2]) // 2 >= MIN_PYRAMID_SIDE:
+        level = cv2.pyrDown(level)
+        codes = _detect(level)
+        if codes:
+            return codes
+    return []
+
+
+def _stage_binarize(full, fast) -> list:
+    _, otsu = cv2.threshold(fast, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    codes = _detect(otsu)
+    if codes:
+        return codes
+    # Median blur first: adaptive thresholding of raw sensor noise produces
+    # thousands of contours and makes detection very slow
+    small = limit_size(fast, BINARIZE_DECODE_SIDE)
+    adaptive = cv2.adaptiveThreshold(
+        cv2.medianBlur(small, 3), 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 5
+    )
+    codes = _detect(adaptive)
+    if codes:
+        return codes
+    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+    return _detect(clahe.apply(small))
+
+
+_STAGE_FUNCS = {
+    'gray': _stage_gray,
+    'pyramid': _stage_pyramid,
+    'binarize': _stage_binarize,
+}
+
+
+def decode_qr_image(image_bytes, reduce: int = 1, stages=STAGES, max_cpu_ms: float = None) -> DecodeResult:
+    """Decode raw image bytes through the staged pipeline, stopping at the first success
+
+    reduce > 1 decodes at 1/reduce of the size (used when memory is tight)
+    """
+    started = time.thread_time()
+    # frombuffer is a view: the downloaded bytes are not copied
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), _READ_FLAGS[reduce])
+    if img is None:
+        raise InvalidImageError("Image could not be decoded")
+    decode_ms = (time.thread_time() - started) * 1000
+    return decode_gray(img, stages, decode_ms, max_cpu_ms)
+
+
+def decode_qr_file(path: str, reduce: int = 1, stages=STAGES, max_cpu_ms: float = None) -> DecodeResult:
+    """decode_qr_image for a file on disk, memory-mapped instead of read into memory"""
+    with open(path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise InvalidImageError("Image file is empty") from None
+    with mapped:
+        return decode_qr_image(mapped, reduce, stages, max_cpu_ms)
+
+
+def decode_gray(img, stages=STAGES, decode_ms: float = 0.0, max_cpu_ms: float = None) -> DecodeResult:
+    """Run a decoded grayscale image through the given pipeline stages
+
+    With max_cpu_ms no further stage starts once the image decode and the
+    stages so far used that much CPU time (the first stage always runs)
+    """
+    full = limit_size(img)
+    fast = limit_size(full, FAST_DECODE_SIDE)
+    timings = {}
+    for stage in stages:
+        if max_cpu_ms is not None and timings and decode_ms + sum(timings.values()) >= max_cpu_ms:
+            break
+        started = time.thread_time()
+        codes = _STAGE_FUNCS[stage](full, fast)
+        timings[stage] = (time.thread_time() - started) * 1000
+        if codes:
+            return DecodeResult(codes, stage, timings, decode_ms)
+    return DecodeResult([], None, timings, decode_ms)
@@ -0,0 +1,156 @@
+"""
+Bounded update dispatcher for the webhook handler
+Updates of one chat are processed in order; cheap and expensive updates run in
+separate lanes with their own concurrency caps, and excess load is shed
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CHEAP = 'cheap'
+HEAVY = 'heavy'
+
+
+def classify_update(update) -> str:
+    """Photos, documents, videos and QR generation are heavy; commands, callbacks and inline queries are cheap"""
+    message = update.message
+    if message is None:
+        return CHEAP
+    if message.photo or message.document or message.video:
+        return HEAVY
+    if message.text and not message.text.startswith('/'):
+        return HEAVY
+    if message.text and message.text.startswith('/batch'):
+        return HEAVY
+    return CHEAP
+
+
+def chat_key(update):
+    """Ordering key: the chat, else the user (inline queries), else the update itself"""
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return f"user:{update.effective_user.id}"
+    return f"update:{update.update_id}"
+
+
+class _Lane:
+    """Concurrency cap, queue bound and wait-time counters for one class of updates"""
+
+    def __init__(self, name, concurrency, max_queued):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queued = max(self.concurrency, max_queued)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.queued = 0  # accepted and not finished yet (waiting + running)
+        self.running = 0
+        self.processed = 0
+        self.shed = 0
+        self.max_wait = 0.0
+        self.recent_waits = deque(maxlen=1024)
+
+    def record_wait(self, wait: float) -> None:
+        self.recent_waits.append(wait)
+        self.max_wait = max(self.max_wait, wait)
+
+    def stats(self) -> dict:
+        waits = sorted(self.recent_waits)
+        return {
+            "concurrency": self.concurrency,
+            "max_queued": self.max_queued,
+            "depth": self.queued - self.running,
+            "running": self.running,
+            "processed": self.processed,
+            "shed": self.shed,
+            "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 2) if waits else 0.0,
+            "wait_p95_ms": round(waits[int(len(waits) * 0.95)] * 1000, 2) if waits else 0.0,
+            "wait_max_ms": round(self.max_wait * 1000, 2),
+        }
+
+
+class UpdateDispatcher:
+    """Per-chat FIFO dispatcher with global lane caps and explicit load shedding"""
+
+    def __init__(self, process, cheap_concurrency=32, heavy_concurrency=8, max_queued=200,
+                 observe_wait=None):
+        self._process = process
+        self._observe_wait = observe_wait
+        self.lanes = {
+            CHEAP: _Lane(CHEAP, cheap_concurrency, max_queued),
+            HEAVY: _Lane(HEAVY, heavy_concurrency, max_queued),
+        }
+        self._chats = {}
+        self._tasks = set()
+
+    def submit(self, update) -> bool:
+        """Queue an update; returns False when its lane is saturated and the update was shed"""
+        lane = self.lanes[classify_update(update)]
+        if lane.queued >= lane.max_queued:
+            lane.shed += 1
+            return False
+        lane.queued += 1
+
+        key = chat_key(update)
+        item = (update, lane, time.monotonic())
+        queue = self._chats.get(key)
+        if queue is not None:
+            # A worker for this chat is already draining its queue
+            queue.append(item)
+            return True
+
+        queue = self._chats[key] = deque([item])
+        task = asyncio.create_task(self._drain(key, queue))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _drain(self, key, queue) -> None:
+        try:
+            while queue:
+                update, lane, enqueued_at = queue[0]
+                try:
+                    async with lane.semaphore:
+                        wait = time.monotonic() - enqueued_at
+                        lane.record_wait(wait)
+                        if self._observe_wait is not None:
+                            self._observe_wait(wait, lane.name)
+                        lane.running += 1
+                        try:
+                            await self._process(update)
+                        finally:
+                            lane.running -= 1
+                except Exception as e:
+                    logger.error(f"Error processing update {update.update_id}: {e}")
+                finally:
+                    lane.queued -= 1
+                    lane.processed += 1
+                    queue.popleft()
+        finally:
+            self._chats.pop(key, None)
+
+    async def shutdown(self, timeout: float = 10.0) -> None:
+        """Wait for in-flight updates to finish, then cancel the rest"""
+        if not self._tasks:
+            return
+        _done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+
+    def is_busy(self, key) -> bool:
+        """True while updates for this ordering key are queued or running"""
+        return key in self._chats
+
+    def in_flight(self) -> int:
+        """Accepted updates not finished yet, across lanes"""
+        return sum(lane.queued for lane in self.lanes.values())
+
+    def stats(self) -> dict:
+        """Per-lane queue depth, running count, wait times and shed count"""
+        return {
+            "active_chats": len(self._chats),
+            "lanes": {name: lane.stats() for name, lane in self.lanes.items()},
+        }
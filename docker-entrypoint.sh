@@ -0,0 +1,15 @@
+#!/bin/sh
+# Fly.io mounts volumes owned by root: hand DATA_DIR to the app user, then drop
+# root and start the bot as that user
+set -e
+
+DATA_DIR="${DATA_DIR:-/data}"
+
+if [ "$(id -u)" = "0" ]; then
+    if [ -d "$DATA_DIR" ]; then
+        chown app:app "$DATA_DIR"
+    fi
+    exec setpriv --reuid=app --regid=app --init-groups "$@"
+fi
+
+exec "$@"
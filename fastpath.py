@@ -0,0 +1,71 @@
+"""
+Webhook fast path on the raw update JSON
+Runs before Update.de_json: update types the bot never handles are dropped, and
+static replies are returned as a Bot API method call in the webhook response
+body instead of a separate outbound request
+"""
+
+# Update types with handlers; everything else (edited messages, channel posts,
+# member updates, polls, ...) is acknowledged and dropped
+HANDLED_UPDATE_TYPES = ('message', 'inline_query', 'callback_query')
+
+# Documents taken as batch input
+_DOCUMENT_EXTENSIONS = ('.txt', '.csv')
+
+
+def update_type(data: dict):
+    """The handled update type present in the payload, or None"""
+    for key in HANDLED_UPDATE_TYPES:
+        if key in data:
+            return key
+    return None
+
+
+def parse_command(message: dict):
+    """(command, mention) for a message starting with a bot command, else None
+
+    Mirrors filters.COMMAND: only a bot_command entity at offset 0 counts
+    """
+    entities = message.get('entities')
+    text = message.get('text')
+    if not entities or not text:
+        return None
+    entity = entities[0]
+    if entity.get('type') != 'bot_command' or entity.get('offset') != 0:
+        return None
+    command, _, mention = text[1:entity.get('length', 0)].partition('@')
+    return command.lower(), mention or None
+
+
+def is_supported_message(message: dict, document_types=()) -> bool:
+    """True for messages a content handler takes (text, photo, video, .txt/.csv or scannable document)
+
+    document_types are MIME types or prefixes (ending in '/') of documents the bot scans
+    """
+    if 'text' in message or 'photo' in message or 'video' in message or 'animation' in message:
+        return True
+    document = message.get('document')
+    if document is not None:
+        if (document.get('file_name') or '').lower().endswith(_DOCUMENT_EXTENSIONS):
+            return True
+        mime_type = (document.get('mime_type') or '').lower()
+        return any(
+            mime_type.startswith(kind) if kind.endswith('/') else mime_type == kind for kind in document_types
+        )
+    return False
+
+
+def reply_method(message: dict, text: str, quote: bool = None, parse_mode: str = 'Markdown') -> dict:
+    """sendMessage call answering message, built the way Message.reply_text does
+
+    quote=None quotes only outside private chats; replies stay in the message's forum topic
+    """
+    chat = message['chat']
+    body = {'method': 'sendMessage', 'chat_id': chat['id'], 'text': text}
+    if parse_mode:
+        body['parse_mode'] = parse_mode
+    if quote or (quote is None and chat.get('type') != 'private'):
+        body['reply_parameters'] = {'message_id': message['message_id']}
+    if message.get('is_topic_message') and 'message_thread_id' in message:
+        body['message_thread_id'] = message['message_thread_id']
+    return body
@@ -0,0 +1,120 @@
+"""
+QR Code scanning for documents and videos (runs in the decode pool)
+Images are decoded at a bounded resolution, PDF pages are rendered one at a
+time and video frames are sampled at increasing density; every scan stops at
+the first code or when its page/frame or CPU-time cap is reached
+"""
+
+import time
+
+import cv2
+
+from decode_types import InvalidImageError, MediaResult
+from decoding import decode_gray, decode_qr_file
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # PDF scanning is optional
+    pdfium = None
+
+# Pipeline stages for each video frame; frames are many and similar, so only the cheap ones
+VIDEO_FRAME_STAGES = ('gray', 'pyramid')
+
+
+def scan_image(path: str, reduce: int = 1) -> MediaResult:
+    """Decode an image file (sent as a document) through the full pipeline"""
+    started = time.thread_time()
+    result = decode_qr_file(path, reduce)
+    return MediaResult(result.codes, 1, (time.thread_time() - started) * 1000)
+
+
+def scan_pdf(path: str, max_pages: int, render_side: int, max_cpu_seconds: float) -> MediaResult:
+    """Render pages one at a time in grayscale and scan each until a code is found"""
+    if pdfium is None:
+        raise InvalidImageError("PDF support is not installed")
+    started = time.thread_time()
+    try:
+        document = pdfium.PdfDocument(path)
+    except pdfium.PdfiumError as e:
+        raise InvalidImageError(f"PDF could not be opened: {e}") from None
+    pages = 0
+    try:
+        for index in range(len(document)):
+            if pages >= max_pages or time.thread_time() - started > max_cpu_seconds:
+                return MediaResult([], pages, (time.thread_time() - started) * 1000, True)
+            page = document[index]
+            try:
+                width, height = page.get_size()
+                bitmap = page.render(scale=render_side / max(width, height, 1), grayscale=True)
+                try:
+                    img = bitmap.to_numpy().reshape(bitmap.height, bitmap.width)
+                    codes = decode_gray(img).codes
+                finally:
+                    bitmap.close()
+            finally:
+                page.close()
+            pages += 1
+            if codes:
+                return MediaResult(codes, pages, (time.thread_time() - started) * 1000)
+    finally:
+        document.close()
+    return MediaResult([], pages, (time.thread_time() - started) * 1000)
+
+
+def sample_positions(total: int):
+    """Frame indices at increasing density: middle, quarters, eighths, ... (each once)"""
+    seen = set()
+    parts = 2
+    while len(seen) < total:
+        for numerator in range(1, parts, 2):
+            position = min(total - 1, numerator * total // parts)
+            if position not in seen:
+                seen.add(position)
+                yield position
+        if parts > total:
+            # Finer levels only repeat positions; pick up whatever rounding skipped
+            for position in range(total):
+                if position not in seen:
+                    seen.add(position)
+                    yield position
+            return
+        parts *= 2
+
+
+def scan_video(path: str, max_frames: int, max_cpu_seconds: float) -> MediaResult:
+    """Sample frames at increasing density until a code is found or a cap is hit"""
+    started = time.thread_time()
+    # One decoding thread keeps FFmpeg's frame buffers (and CPU use) bounded
+    capture = cv2.VideoCapture(path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_N_THREADS, 1])
+    if not capture.isOpened():
+        raise InvalidImageError("Video could not be opened")
+    frames = 0
+    try:
+        total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        positions = sample_positions(total) if total > 0 else None
+        while frames < max_frames:
+            if time.thread_time() - started > max_cpu_seconds:
+                return MediaResult([], frames, (time.thread_time() - started) * 1000, True)
+            if positions is not None:
+                position = next(positions, None)
+                if position is None:
+                    break
+                capture.set(cv2.CAP_PROP_POS_FRAMES, position)
+            # Without a frame count (some streams) frames are read in order
+            ok, frame = capture.read()
+            if not ok:
+                if positions is None:
+                    break
+                continue
+            frames += 1
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            del frame
+            codes = decode_gray(gray, VIDEO_FRAME_STAGES).codes
+            if codes:
+                return MediaResult(codes, frames, (time.thread_time() - started) * 1000)
+        capped = frames >= max_frames
+    finally:
+        capture.release()
+    if frames == 0:
+        raise InvalidImageError("No video frames could be decoded")
+    return MediaResult([], frames, (time.thread_time() - started) * 1000, capped)
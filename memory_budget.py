@@ -0,0 +1,130 @@
+"""
+Memory admission control for worker pool jobs
+Jobs reserve their estimated peak memory before they start; when the budget is
+exhausted they take a cheaper variant or wait their turn instead of running
+the VM out of memory
+"""
+
+import asyncio
+from collections import deque
+
+
+class MemoryBudgetError(Exception):
+    """Raised when a reservation could not be granted within the wait timeout"""
+
+
+class Reservation:
+    """Bytes held against a budget until release() (safe to call more than once)"""
+
+    __slots__ = ('_budget', 'nbytes')
+
+    def __init__(self, budget, nbytes: int):
+        self._budget = budget
+        self.nbytes = nbytes
+
+    def release(self) -> None:
+        if self._budget is not None:
+            self._budget._release(self.nbytes)
+            self._budget = None
+
+
+class MemoryBudget:
+    """Byte budget shared by concurrent jobs; waiting reservations are granted FIFO
+
+    A job larger than the whole budget is clamped to it, so it runs alone
+    instead of never running
+    """
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = capacity
+        self.reserved = 0
+        self.peak_reserved = 0
+        self._waiters = deque()
+        self.admitted = 0
+        self.degraded = 0
+        self.waited = 0
+        self.rejected = 0
+
+    def _grant(self, nbytes: int) -> None:
+        self.reserved += nbytes
+        self.peak_reserved = max(self.peak_reserved, self.reserved)
+
+    def try_reserve(self, nbytes: int):
+        """Reserve nbytes now if they fit and nobody is waiting, else return None"""
+        nbytes = min(nbytes, self.capacity)
+        if self._waiters or self.reserved + nbytes > self.capacity:
+            return None
+        self._grant(nbytes)
+        return Reservation(self, nbytes)
+
+    async def admit(self, options, timeout: float):
+        """Reserve memory for one of several job variants
+
+        options is a list of (tag, nbytes), preferred variant first. The first one
+        that fits right away is taken; otherwise the caller queues for the last
+        (cheapest) one. Returns (tag, reservation); raises MemoryBudgetError when
+        the wait times out
+        """
+        for index, (tag, nbytes) in enumerate(options):
+            reservation = self.try_reserve(nbytes)
+            if reservation is not None:
+                self.admitted += 1
+                if index:
+                    self.degraded += 1
+                return tag, reservation
+
+        tag, nbytes = options[-1]
+        nbytes = min(nbytes, self.capacity)
+        granted = asyncio.get_running_loop().create_future()
+        self._waiters.append((nbytes, granted))
+        self.waited += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if granted.done() and not granted.cancelled():
+                # Granted just as the wait ended: hand the bytes back
+                self._release(nbytes)
+            else:
+                granted.cancel()
+                self._wake()
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                raise MemoryBudgetError(
+                    f"{self.name} budget exhausted ({self.reserved} of {self.capacity} bytes reserved)"
+                ) from None
+            raise
+        self.admitted += 1
+        if len(options) > 1:
+            self.degraded += 1
+        return tag, Reservation(self, nbytes)
+
+    def _release(self, nbytes: int) -> None:
+        self.reserved -= nbytes
+        self._wake()
+
+    def _wake(self) -> None:
+        # Strict FIFO: a large waiter at the head holds back smaller ones behind it
+        while self._waiters:
+            nbytes, granted = self._waiters[0]
+            if granted.done():
+                self._waiters.popleft()
+                continue
+            if self.reserved + nbytes > self.capacity:
+                return
+            self._waiters.popleft()
+            self._grant(nbytes)
+            granted.set_result(None)
+
+    def stats(self) -> dict:
+        """Reserved bytes and admission counters"""
+        return {
+            "capacity_mb": round(self.capacity / 1024 / 1024, 1),
+            "reserved_mb": round(self.reserved / 1024 / 1024, 1),
+            "peak_reserved_mb": round(self.peak_reserved / 1024 / 1024, 1),
+            "waiting": sum(1 for _, granted in self._waiters if not granted.done()),
+            "admitted": self.admitted,
+            "degraded": self.degraded,
+            "waited": self.waited,
+            "rejected": self.rejected,
+        }
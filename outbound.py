@@ -0,0 +1,171 @@
+"""
+Flood-limit-aware outbound scheduler for Bot API calls
+Plugs into python-telegram-bot as a BaseRateLimiter: enforces a global and a
+per-chat send rate, honours retry_after and drops redundant chat actions
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Methods that count against Telegram's message limits
+_SEND_PREFIXES = ('send', 'copy', 'forward', 'edit')
+
+# A chat action is displayed for about 5 seconds; repeating it sooner is redundant
+CHAT_ACTION_INTERVAL = 4.0
+
+# Chat actions are dropped instead of queued when they would wait longer than this
+CHAT_ACTION_MAX_DELAY = 1.0
+
+
+class _Throttle:
+    """GCRA rate limiter: reserve() returns how long the caller has to wait"""
+
+    __slots__ = ('interval', 'burst_span', 'tat')
+
+    def __init__(self, rate: float, burst: int):
+        self.interval = 1.0 / rate
+        self.burst_span = max(1, burst) * self.interval
+        self.tat = 0.0  # theoretical arrival time of the next request
+
+    def delay(self, now: float) -> float:
+        """Wait needed if a request were reserved now (without reserving)"""
+        return max(0.0, max(self.tat, now) + self.interval - self.burst_span - now)
+
+    def reserve(self, now: float) -> float:
+        self.tat = max(self.tat, now) + self.interval
+        return max(0.0, self.tat - self.burst_span - now)
+
+    def pause(self, until: float) -> None:
+        """Block new reservations until the given time (after a 429)"""
+        self.tat = max(self.tat, until + self.burst_span - self.interval)
+
+
+class FloodAwareRateLimiter(BaseRateLimiter):
+    """Global + per-chat throttling with retry_after handling and chat-action coalescing"""
+
+    def __init__(self, global_rate=30.0, private_rate=1.0, group_rate=20 / 60, burst=3,
+                 max_retries=2, max_chats=10000):
+        self._global = _Throttle(global_rate, int(global_rate))
+        self._private_rate = private_rate
+        self._group_rate = group_rate
+        self._burst = burst
+        self._max_retries = max_retries
+        self._max_chats = max_chats
+        self._chats = OrderedDict()
+        self._last_action = OrderedDict()
+        self.waiting = 0
+        self.max_waiting = 0
+        self.sent = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.chat_actions_dropped = 0
+        self.total_delay = 0.0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self._chats.clear()
+        self._last_action.clear()
+
+    def _chat_throttle(self, chat_id, now: float) -> _Throttle:
+        throttle = self._chats.get(chat_id)
+        if throttle is None:
+            # Negative ids are groups and channels, which have a much lower limit
+            rate = self._group_rate if int(chat_id) < 0 else self._private_rate
+            throttle = self._chats[chat_id] = _Throttle(rate, self._burst)
+            # Forget idle chats, oldest first
+            while len(self._chats) > self._max_chats:
+                oldest_id, oldest = next(iter(self._chats.items()))
+                if oldest.tat > now:
+                    break
+                self._chats.pop(oldest_id)
+        else:
+            self._chats.move_to_end(chat_id)
+        return throttle
+
+    def _drop_chat_action(self, chat_id, action, now: float) -> bool:
+        """True when this chat action is redundant or would arrive too late to matter"""
+        last = self._last_action.get(chat_id)
+        if last is not None and last[0] == action and now - last[1] < CHAT_ACTION_INTERVAL:
+            return True
+        if self._global.delay(now) > CHAT_ACTION_MAX_DELAY:
+            return True
+        self._last_action[chat_id] = (action, now)
+        self._last_action.move_to_end(chat_id)
+        while len(self._last_action) > self._max_chats:
+            self._last_action.popitem(last=False)
+        return False
+
+    async def _wait(self, delay: float) -> None:
+        if delay <= 0:
+            return
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        self.total_delay += delay
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.waiting -= 1
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        is_send = endpoint.lower().startswith(_SEND_PREFIXES)
+
+        if endpoint == 'sendChatAction' and chat_id is not None:
+            if self._drop_chat_action(chat_id, data.get('action'), time.monotonic()):
+                self.chat_actions_dropped += 1
+                return True
+            self._global.reserve(time.monotonic())
+            return await callback(*args, **kwargs)
+
+        for attempt in range(self._max_retries + 1):
+            if is_send:
+                now = time.monotonic()
+                delay = self._global.reserve(now)
+                if chat_id is not None and isinstance(chat_id, int):
+                    delay = max(delay, self._chat_throttle(chat_id, now).reserve(now))
+                await self._wait(delay)
+            try:
+                result = await callback(*args, **kwargs)
+                self.sent += 1
+                return result
+            except RetryAfter as e:
+                self.rate_limited += 1
+                if attempt >= self._max_retries:
+                    raise
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                logger.warning(f"Flood limit on {endpoint} (chat {chat_id}), retrying in {retry_after}s")
+                until = time.monotonic() + retry_after
+                # Per-chat limits only hold back that chat; otherwise pause everything
+                if chat_id is not None and isinstance(chat_id, int):
+                    self._chat_throttle(chat_id, time.monotonic()).pause(until)
+                else:
+                    self._global.pause(until)
+                self.retries += 1
+                await self._wait(retry_after)
+
+    def stats(self) -> dict:
+        """Backlog and flood-limit counters"""
+        now = time.monotonic()
+        return {
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "global_backlog_s": round(max(0.0, self._global.tat - now), 3),
+            "sent": self.sent,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "chat_actions_dropped": self.chat_actions_dropped,
+            "total_delay_s": round(self.total_delay, 3),
+            "tracked_chats": len(self._chats),
+        }
@@ -1,23 +1,56 @@
+# Started first so the import time of everything below is included
+from startup import StartupTimer
+startup_timer = StartupTimer()
+
 import logging
-import qrcode
 import io
+import base64
+import hashlib
+import hmac
 import uuid
 import os
 import signal
+import tempfile
+import time
+from contextlib import suppress
+from importlib.util import find_spec
 from urllib.parse import quote
 from dotenv import load_dotenv
 import asyncio
-from aiohttp import web
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, web
 from aiohttp.web_request import Request
 from aiohttp.web_response import Response
 
-# New imports for OpenCV
-import cv2
-import numpy as np
-
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultPhoto
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultPhoto, InputMediaPhoto
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler, InlineQueryHandler
 from telegram.constants import ChatAction
+from telegram.error import BadRequest
+
+from activity import ActivityTracker
+from analytics import LATENCY_BUCKETS_MS, AnalyticsLog, payload_label
+from botapi import HTTP2_SUPPORTED, build_request, local_file_path
+from batch import parse_lines, parse_csv, render_in_order, chunked, ZipBuilder
+from caching import LRUCache, make_key
+from dispatch import UpdateDispatcher
+from fastpath import HANDLED_UPDATE_TYPES, update_type, parse_command, is_supported_message, reply_method
+from decode_types import (
+    STAGES, LADDER_STAGES, InvalidImageError, MediaTooLargeError, ResolutionLadder, PipelineStats, MediaStats,
+    decode_options, bounded_reduce, estimate_decode_bytes, estimate_page_bytes, estimate_frame_bytes,
+)
+from memory_budget import MemoryBudget, MemoryBudgetError
+from metrics import Registry, process_rss_bytes
+from outbound import FloodAwareRateLimiter
+from rendering import (
+    render_qr_png, render_qr_png_timed, render_qr_jpeg, render_styled_qr_timed,
+    DEFAULT_BOX_SIZE, DEFAULT_BORDER, DEFAULT_COMPRESS_LEVEL,
+)
+from styles import StyleError, split_style
+from supervisor import REUSE_PORT_SUPPORTED, Supervisor, send_heartbeats
+from workers import WorkerPool, PoolBusyError
+
+# cv2 and numpy are not imported here: decoding runs as 'decoding:...' jobs in the
+# decode pool and rendering imports numpy/qrcode on first use (see warm_up)
+startup_timer.mark('imports')
 
 # Load environment variables
 load_dotenv()
@@ -36,38 +69,299 @@ WEBHOOK_URL = os.getenv('WEBHOOK_URL')
 PORT = int(os.getenv('PORT', 8080))
 HOST = os.getenv('HOST', '0.0.0.0')
 
+# Multi-process webhook mode: worker processes share PORT through SO_REUSEPORT
+WORKERS = int(os.getenv('WORKERS', 1)) or os.cpu_count() or 1  # 0 = one per CPU
+WORKER_HEARTBEAT_TIMEOUT = float(os.getenv('WORKER_HEARTBEAT_TIMEOUT', 30))  # stalled event loop before a restart
+WORKER_START_TIMEOUT = float(os.getenv('WORKER_START_TIMEOUT', 60))  # seconds to import and initialize
+MULTI_PROCESS = WORKERS > 1 and bool(WEBHOOK_URL) and REUSE_PORT_SUPPORTED
+PROCESS_COUNT = WORKERS if MULTI_PROCESS else 1
+# The process supervising the workers serves no updates, so it does not open or load the databases
+# (spawned workers import this script as __mp_main__)
+SUPERVISOR_PROCESS = MULTI_PROCESS and __name__ == '__main__'
+
+# Render pool settings (QR generation runs off the event loop)
+RENDER_POOL_KIND = os.getenv('RENDER_POOL_KIND', 'thread')  # 'thread' or 'process'
+RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', 2))
+RENDER_QUEUE_SIZE = int(os.getenv('RENDER_QUEUE_SIZE', 32))
+RENDER_TIMEOUT = float(os.getenv('RENDER_TIMEOUT', 10))
+PNG_COMPRESS_LEVEL = int(os.getenv('PNG_COMPRESS_LEVEL', DEFAULT_COMPRESS_LEVEL))  # zlib level 0-9
+
+# Decode pool settings (OpenCV QR reading runs off the event loop)
+DECODE_POOL_KIND = os.getenv('DECODE_POOL_KIND', 'thread')  # 'thread' or 'process'
+DECODE_WORKERS = int(os.getenv('DECODE_WORKERS', 2))
+DECODE_QUEUE_SIZE = int(os.getenv('DECODE_QUEUE_SIZE', 16))
+DECODE_TIMEOUT = float(os.getenv('DECODE_TIMEOUT', 15))
+PHOTO_START_SIDE = int(os.getenv('PHOTO_START_SIDE', 800))  # first PhotoSize tried (longest side, px)
+PHOTO_MAX_CPU_SECONDS = float(os.getenv('PHOTO_MAX_CPU_SECONDS', 0.5))  # detection CPU per photo, all sizes together
+DECODE_MEMORY_BUDGET_MB = float(os.getenv('DECODE_MEMORY_BUDGET_MB', 160))  # estimated peak of concurrent decodes
+DECODE_MEMORY_WAIT = float(os.getenv('DECODE_MEMORY_WAIT', 10))  # seconds to queue for memory before "busy"
+
+# Image documents, PDFs and videos (scanned in the decode pool)
+MEDIA_MAX_BYTES = int(os.getenv('MEDIA_MAX_BYTES', 20 * 1024 * 1024))  # Bot API download limit
+MEDIA_MAX_PIXELS = int(os.getenv('MEDIA_MAX_PIXELS', 50_000_000))
+MEDIA_MAX_CPU_SECONDS = float(os.getenv('MEDIA_MAX_CPU_SECONDS', 8))
+MEDIA_TIMEOUT = float(os.getenv('MEDIA_TIMEOUT', 30))
+MEDIA_TMP_DIR = os.getenv('MEDIA_TMP_DIR') or None  # default: system temp directory
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', 10))
+PDF_RENDER_SIDE = int(os.getenv('PDF_RENDER_SIDE', 2000))  # longest side of a rendered page (px)
+VIDEO_MAX_FRAMES = int(os.getenv('VIDEO_MAX_FRAMES', 48))
+VIDEO_MAX_DURATION = int(os.getenv('VIDEO_MAX_DURATION', 120))  # seconds
+VIDEO_DEFAULT_SIZE = (1920, 1080)  # assumed for video files without dimensions
+PDF_SUPPORTED = find_spec('pypdfium2') is not None
+
+# Document MIME types scanned for QR Codes
+SCANNABLE_DOCUMENT_TYPES = ('image/', 'video/') + (('application/pdf',) if PDF_SUPPORTED else ())
+
+# Persistent storage (Fly.io volume) and cache settings
+DATA_DIR = os.getenv('DATA_DIR', '/data')
+QR_CACHE_SIZE = int(os.getenv('QR_CACHE_SIZE', 20000))
+DECODE_CACHE_SIZE = int(os.getenv('DECODE_CACHE_SIZE', 20000))
+DECODE_CACHE_PERSIST = os.getenv('DECODE_CACHE_PERSIST', 'true').lower() == 'true'
+DECODE_NEGATIVE_TTL = float(os.getenv('DECODE_NEGATIVE_TTL', 600))  # seconds to remember "no QR Code"
+CACHE_FLUSH_INTERVAL = float(os.getenv('CACHE_FLUSH_INTERVAL', 1))  # seconds before new entries reach SQLite
+
+# Webhook update dispatcher (per-chat ordering, bounded lanes)
+DISPATCH_CHEAP_CONCURRENCY = int(os.getenv('DISPATCH_CHEAP_CONCURRENCY', 32))
+DISPATCH_HEAVY_CONCURRENCY = int(os.getenv('DISPATCH_HEAVY_CONCURRENCY', 8))
+DISPATCH_MAX_QUEUED = int(os.getenv('DISPATCH_MAX_QUEUED', 200))  # per lane, beyond this updates are shed
+
+# Outbound Bot API scheduler (Telegram flood limits)
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', 30))  # messages per second, all chats
+OUTBOUND_PRIVATE_RATE = float(os.getenv('OUTBOUND_PRIVATE_RATE', 1))  # per private chat, per second
+OUTBOUND_GROUP_RATE = float(os.getenv('OUTBOUND_GROUP_RATE', 20 / 60))  # per group, per second
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', 2))
+
+# Bot API HTTP client: sized keep-alive connection pool, optional HTTP/2
+BOT_API_POOL_SIZE = int(os.getenv('BOT_API_POOL_SIZE', 64))  # connections (covers both dispatcher lanes)
+BOT_API_POOL_TIMEOUT = float(os.getenv('BOT_API_POOL_TIMEOUT', 10))  # seconds to wait for a free connection
+BOT_API_KEEPALIVE = float(os.getenv('BOT_API_KEEPALIVE', 60))  # seconds an idle connection stays open
+BOT_API_TIMEOUT = float(os.getenv('BOT_API_TIMEOUT', 30))  # connect/read/write timeout
+BOT_API_HTTP2 = os.getenv('BOT_API_HTTP2', 'false').lower() == 'true'
+
+# Self-hosted Bot API server (telegram-bot-api --local): files are read from disk, not downloaded
+BOT_API_BASE_URL = os.getenv('BOT_API_BASE_URL')  # e.g. http://localhost:8081/bot
+BOT_API_FILE_URL = os.getenv('BOT_API_FILE_URL')  # defaults to BOT_API_BASE_URL with /file/bot
+BOT_API_LOCAL_MODE = os.getenv('BOT_API_LOCAL_MODE', 'false').lower() == 'true'
+
+# User activity expiry and per-user rate limits (token bucket)
+USER_INACTIVE_TTL = int(os.getenv('USER_INACTIVE_TTL', 1800))  # 30 minutes
+USER_TRACK_MAX = int(os.getenv('USER_TRACK_MAX', 50000))
+USER_RATE = float(os.getenv('USER_RATE', 0.5))  # render/decode jobs per second, sustained
+USER_BURST = float(os.getenv('USER_BURST', 10))
+
+# Batch QR generation (/batch command or .txt/.csv documents)
+BATCH_MAX_LINES = int(os.getenv('BATCH_MAX_LINES', 5000))
+BATCH_ALBUM_MAX = int(os.getenv('BATCH_ALBUM_MAX', 30))  # larger batches are sent as one ZIP
+BATCH_DOCUMENT_MAX_BYTES = int(os.getenv('BATCH_DOCUMENT_MAX_BYTES', 1024 * 1024))
+ALBUM_SIZE = 10  # Telegram media group limit
+
+# Inline mode QR images (served by the bot itself at /inline/qr.jpg)
+INLINE_SIGNING_KEY = os.getenv('INLINE_SIGNING_KEY')
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', 86400))  # inline_query.answer cache_time
+INLINE_IMAGE_CACHE_SIZE = int(os.getenv('INLINE_IMAGE_CACHE_SIZE', 512))
+INLINE_BOX_SIZE = 5
+# Inline image renders have their own, larger bucket: Telegram sends a query (and fetches
+# a new image) on almost every keystroke, which must not use up the bucket for messages
+INLINE_USER_RATE = float(os.getenv('INLINE_USER_RATE', 2))  # inline image renders per second, sustained
+INLINE_USER_BURST = float(os.getenv('INLINE_USER_BURST', 30))
+
+# Cold start: webhook updates that arrive before the bot is initialized wait this long
+STARTUP_READY_TIMEOUT = float(os.getenv('STARTUP_READY_TIMEOUT', 20))
+
+# Generate/decode analytics (ring buffer flushed to DATA_DIR/analytics.db)
+ANALYTICS_BUFFER_SIZE = int(os.getenv('ANALYTICS_BUFFER_SIZE', 10000))  # events held before the oldest are dropped
+ANALYTICS_BATCH_SIZE = int(os.getenv('ANALYTICS_BATCH_SIZE', 500))  # flush early once this many are buffered
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv('ANALYTICS_FLUSH_INTERVAL', 5))  # seconds
+ANALYTICS_RETENTION_DAYS = int(os.getenv('ANALYTICS_RETENTION_DAYS', 90))  # raw events; daily rollups are kept
+STATS_DAYS = int(os.getenv('STATS_DAYS', 7))  # window shown by /stats
+STATS_ADMIN_IDS = {int(user_id) for user_id in os.getenv('STATS_ADMIN_IDS', '').split(',') if user_id.strip()}
+
 # Validate required environment variables
 if not TELEGRAM_TOKEN:
     logger.error("TELEGRAM_BOT_TOKEN not found in environment variables!")
     raise ValueError("TELEGRAM_BOT_TOKEN is required. Please check your .env file.")
 
-# User activity tracking for memory optimization
-import time
-from collections import defaultdict
+# User activity tracking for memory optimization (expires in O(1), bounded size)
+user_activity = ActivityTracker(
+    ttl=USER_INACTIVE_TTL,
+    max_users=USER_TRACK_MAX,
+    rate=USER_RATE,
+    burst=USER_BURST,
+)
+inline_activity = ActivityTracker(
+    ttl=USER_INACTIVE_TTL,
+    max_users=USER_TRACK_MAX,
+    rate=INLINE_USER_RATE,
+    burst=INLINE_USER_BURST,
+)
 
-user_last_activity = defaultdict(float)
+# Worker pool for QR rendering (bounded queue gives backpressure under bursts)
+render_pool = WorkerPool(
+    'render',
+    workers=RENDER_WORKERS,
+    max_pending=RENDER_QUEUE_SIZE,
+    kind=RENDER_POOL_KIND,
+)
 
-# Memory cleanup function
-def cleanup_inactive_users():
-    """Clean up inactive users to save memory"""
-    current_time = time.time()
-    inactive_threshold = 1800  # 30 minutes - more aggressive cleanup
-    
-    inactive_users = [
-        user_id for user_id, last_activity in user_last_activity.items()
-        if current_time - last_activity > inactive_threshold
-    ]
-    
-    for user_id in inactive_users:
-        user_last_activity.pop(user_id, None)
-    
-    if inactive_users:
-        logger.info(f"Cleaned up {len(inactive_users)} inactive users")
+# Worker pool for QR decoding (each worker keeps a warmed-up detector)
+decode_pool = WorkerPool(
+    'decode',
+    workers=DECODE_WORKERS,
+    max_pending=DECODE_QUEUE_SIZE,
+    kind=DECODE_POOL_KIND,
+    initializer='decoding:warm_up_worker',
+)
+
+# Memory admission for decodes (reserved from download until the job finishes; split across worker processes)
+decode_budget = MemoryBudget('decode', int(DECODE_MEMORY_BUDGET_MB * 1024 * 1024 / PROCESS_COUNT))
+
+# Process workers receive a pickled copy of the downloaded bytes
+DECODE_INPUT_COPIES = 2 if DECODE_POOL_KIND == 'process' else 1
+
+# Photo resolution strategy: mid-size first, larger sizes only on failure
+photo_ladder = ResolutionLadder(start_side=PHOTO_START_SIDE)
+
+# Per-stage counters for the staged detection pipeline
+decode_stats = PipelineStats()
+
+# Per-kind counters for image documents, PDFs and videos
+media_stats = MediaStats()
+
+# HTTP client for streaming file downloads (created on first use)
+_download_session = None
+
+# Outbound scheduler shared by every Bot API call (the global rate is split across worker processes)
+outbound_limiter = FloodAwareRateLimiter(
+    global_rate=OUTBOUND_GLOBAL_RATE / PROCESS_COUNT,
+    private_rate=OUTBOUND_PRIVATE_RATE,
+    group_rate=OUTBOUND_GROUP_RATE,
+    max_retries=OUTBOUND_MAX_RETRIES,
+)
+
+# Prometheus metrics served at /metrics
+metrics = Registry()
+stage_seconds = metrics.histogram(
+    'qrbot_stage_seconds', 'Time spent in each request stage', ['stage']
+)
+queue_wait_seconds = metrics.histogram(
+    'qrbot_queue_wait_seconds', 'Time updates wait in the dispatcher before processing', ['lane']
+)
+handler_errors = metrics.counter(
+    'qrbot_handler_errors_total', 'Errors caught by handler', ['handler']
+)
+webhook_fast_path = metrics.counter(
+    'qrbot_webhook_fast_path_total', 'Updates answered or dropped before deserialisation', ['outcome']
+)
+
+# Persist caches when the data volume is mounted; worker processes share a temporary directory otherwise
+if SUPERVISOR_PROCESS:
+    SHARED_DATA_DIR = None
+elif os.path.isdir(DATA_DIR):
+    SHARED_DATA_DIR = DATA_DIR
+else:
+    SHARED_DATA_DIR = os.path.join(tempfile.gettempdir(), 'qrbot') if MULTI_PROCESS else None
+CACHE_DB_PATH = os.path.join(SHARED_DATA_DIR, 'cache.db') if SHARED_DATA_DIR else None
+if os.path.isdir(DATA_DIR) and not os.access(DATA_DIR, os.W_OK):
+    # e.g. a root-owned volume with the bot running as another user (see docker-entrypoint.sh)
+    logger.error(f"{DATA_DIR} is not writable by uid {os.getuid()}: caches and analytics will not survive a restart")
+
+# Generate/decode event log behind /stats
+analytics = AnalyticsLog(
+    os.path.join(SHARED_DATA_DIR, 'analytics.db') if SHARED_DATA_DIR else None,
+    capacity=ANALYTICS_BUFFER_SIZE,
+    batch_size=ANALYTICS_BATCH_SIZE,
+    flush_interval=ANALYTICS_FLUSH_INTERVAL,
+    retention_days=ANALYTICS_RETENTION_DAYS,
+)
+
+# Telegram file_id cache for generated QR codes (payload + render settings -> file_id);
+# worker processes read each other's entries through the database
+qr_file_cache = LRUCache(
+    'qr_file_ids',
+    capacity=QR_CACHE_SIZE,
+    db_path=CACHE_DB_PATH,
+    shared=MULTI_PROCESS,
+    flush_interval=CACHE_FLUSH_INTERVAL,
+)
+
+# Decode result cache for photos (file_unique_id -> list of payloads, [] = no QR Code)
+decode_cache = LRUCache(
+    'decode_results',
+    capacity=DECODE_CACHE_SIZE,
+    db_path=CACHE_DB_PATH if DECODE_CACHE_PERSIST else None,
+    shared=MULTI_PROCESS,
+    flush_interval=CACHE_FLUSH_INTERVAL,
+)
+
+# Rendered inline images kept in memory (payload -> (jpeg bytes, etag))
+inline_image_cache = LRUCache('inline_images', capacity=INLINE_IMAGE_CACHE_SIZE)
+
+# Key for signing inline image URLs (derived from the bot token if not set)
+_inline_key = (INLINE_SIGNING_KEY or hashlib.sha256(f"inline:{TELEGRAM_TOKEN}".encode()).hexdigest()).encode()
+
+def _cache_counter(field):
+    caches = (qr_file_cache, decode_cache, inline_image_cache)
+    return lambda: {(cache.name,): getattr(cache, field) for cache in caches}
+
+metrics.counter_callback('qrbot_cache_hits_total', 'Cache hits', _cache_counter('hits'), ['cache'])
+metrics.counter_callback('qrbot_cache_misses_total', 'Cache misses', _cache_counter('misses'), ['cache'])
+metrics.gauge('qrbot_process_rss_bytes', 'Resident set size of the bot process', process_rss_bytes)
+metrics.gauge(
+    'qrbot_pool_pending_jobs', 'Jobs queued or running in each worker pool',
+    lambda: {(pool.name,): pool.pending for pool in (render_pool, decode_pool)}, ['pool']
+)
+metrics.counter_callback(
+    'qrbot_pool_rejected_total', 'Jobs rejected because a worker pool was saturated',
+    lambda: {(pool.name,): pool.rejected for pool in (render_pool, decode_pool)}, ['pool']
+)
+metrics.gauge('qrbot_outbound_waiting', 'Bot API calls waiting on flood limits', lambda: outbound_limiter.waiting)
+metrics.counter_callback(
+    'qrbot_outbound_rate_limited_total', 'Bot API calls answered with 429', lambda: outbound_limiter.rate_limited
+)
+metrics.gauge(
+    'qrbot_decode_memory_reserved_bytes', 'Estimated peak memory reserved by running decodes',
+    lambda: decode_budget.reserved
+)
+metrics.gauge('qrbot_active_users', 'Users seen within USER_INACTIVE_TTL', lambda: len(user_activity))
+metrics.gauge(
+    'qrbot_startup_seconds', 'Seconds from process start until each startup phase completed',
+    lambda: {(phase,): seconds for phase, seconds in startup_timer.phases.items()}, ['phase']
+)
+
+BUSY_TEXT = "⏳ *Bot အလုပ်များနေပါတယ်*\n\nခဏနေမှ ထပ်ပို့ကြည့်ပါ။"
+
+RATE_LIMITED_TEXT = "⏳ *ခဏစောင့်ပါ*\n\nတောင်းဆိုမှု များလွန်းနေပါတယ်။ ခဏနေမှ ထပ်ပို့ကြည့်ပါ။"
+
+async def download_file_bytes(telegram_file) -> bytes:
+    """Download a file as one bytes object
+
+    download_as_bytearray() copies the response into a new bytearray; the bytes
+    returned by the request layer can be passed to np.frombuffer as they are.
+    With a local Bot API server the file is read from disk instead
+    """
+    path = local_file_path(telegram_file)
+    if path is not None:
+        return await asyncio.to_thread(read_file_bytes, path)
+    return await telegram_file.get_bot().request.retrieve(telegram_file.file_path)
+
+def read_file_bytes(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+async def check_rate_limit(update: Update, cost: float = 1.0) -> bool:
+    """Per-user token bucket for render/decode work; tells the user once when limited"""
+    allowed, first_denial = user_activity.allow(update.effective_user.id, cost)
+    if not allowed and first_denial:
+        await update.message.reply_text(
+            RATE_LIMITED_TEXT,
+            parse_mode='Markdown',
+            reply_to_message_id=update.message.message_id
+        )
+    return allowed
 
 # --- Command Handlers ---
-async def start_command(update: Update, context) -> None:
-    user = update.effective_user
-    welcome_message = f"""Welcome {user.first_name}! 👋
+def welcome_text(first_name: str) -> str:
+    return f"""Welcome {first_name}! 👋
 
 🤖 ကျွန်တော်က QR Code Bot ပါ။
 
@@ -79,12 +373,15 @@ async def start_command(update: Update, context) -> None:
 *💡Commands:*
 /help - အကူအညီ
 /update - နောက်ဆုံး Update များ
+/batch - QR Code အများအပြား ဖန်တီးရန်
+/stats - အသုံးပြုမှု စာရင်း
 
 """
-    await update.message.reply_text(welcome_message, parse_mode='Markdown')
 
-async def help_command(update: Update, context) -> None:
-    help_text = """
+async def start_command(update: Update, context) -> None:
+    await update.message.reply_text(welcome_text(update.effective_user.first_name), parse_mode='Markdown')
+
+HELP_TEXT = """
 🤖 *QR Code Bot အသုံးပြုပုံ*
 
 *🎯 အလွယ်တကူ အသုံးပြုနည်း:*
@@ -92,26 +389,46 @@ async def help_command(update: Update, context) -> None:
 *1. QR Code ဖန်တီးရန်* 🎨
 • စာ၊ link၊ emoji၊ နံပါတ် စတာတွေကို ပို့ပေးပါ
 
-*2. QR Code ဖတ်ရန်* 📸
+*2. QR Code အများအပြား ဖန်တီးရန်* 📦
+• `/batch` နောက်မှာ တစ်ကြောင်းချင်းစီ ရေးပြီး ပို့ပါ
+• ဒါမှမဟုတ် .txt / .csv ဖိုင် ပို့ပါ
+
+*3. QR Code ဖတ်ရန်* 📸
 • QR Code ပါတဲ့ ဓာတ်ပုံကို ပို့လိုက်ပါ
 • ကျွန်တော် က အလိုအလျောက် ဖတ်ပေးပါမယ်
+• ပုံဖိုင်၊ PDF နဲ့ တိုတောင်းတဲ့ ဗီဒီယိုတွေကိုလည်း ဖတ်ပေးနိုင်ပါတယ်
+
+*4. QR Code Design ပြောင်းရန်* 🎨
+• `https://example.com | fg=#1a73e8 shape=dots`
+• `fg` / `bg` - အရောင်၊ `shape` - square / rounded / dots
+• `size` - pixels၊ `format` - png / webp / svg
+• `logo` - ဓာတ်ပုံကို reply ပြန်ပြီး အလယ်မှာ logo ထည့်ရန်
 
 *🔧 Commands:*
 /start - Bot ကို စတင်အသုံးပြုရန်
 /help - အကူအညီ ရယူရန်
 /update - နောက်ဆုံး Update များကြည့်ရန်
+/batch - QR Code အများအပြား ဖန်တီးရန်
+/stats - အသုံးပြုမှု စာရင်း ကြည့်ရန်
 
 *💡 Tips:*
 • Link တွေမှာ *https://* ပါရင် ကောင်းပါတယ်
 • အကောင်းဆုံးကတော့ အစထဲက မတွေ့ခဲ့ကြရင်ပေါ့...
     """
-    await update.message.reply_text(help_text, parse_mode='Markdown')
 
-async def update_command(update: Update, context) -> None:
-    """Show bot updates and changelog"""
-    changelog_text = """
+async def help_command(update: Update, context) -> None:
+    await update.message.reply_text(HELP_TEXT, parse_mode='Markdown')
+
+CHANGELOG_TEXT = """
 🚀 *QR MM Bot - Updates & Changelog*
 
+*📅 v2.1 - October 18, 2026* 🎨
+• 🎨 *Custom QR Code designs* - အရောင်၊ ပုံစံ (square / rounded / dots)၊ size၊ logo
+• 🖼 PNG / WebP / SVG format နဲ့ ရယူနိုင်ပါပြီ
+• ဥပမာ: `https://example.com | fg=navy shape=rounded format=svg`
+• 📊 /stats - QR Code ဖန်တီး/ဖတ်မှု စာရင်း
+• 📦 /batch - QR Code အများအပြား တစ်ခါတည်း ဖန်တီးနိုင်ပါပြီ (.txt / .csv ဖိုင်လည်း ရပါတယ်)
+
 *📅 v2.0.1 - August 15, 2025* 🎉
  🔥 *Add Feature*
 • Web Mini App အနေနဲ့ အသုံးပြုနိုင်အောင် ပြုလုပ်ထားပါတယ်၊
@@ -145,21 +462,63 @@ async def update_command(update: Update, context) -> None:
 • 🔄 Inline mode support
 • 🇲🇲 Myanmar language support
 
-*🔮 Coming Soon:*
-• 📊 QR Code analytics
-• 🎨 Custom QR Code designs
-• 📱 Batch QR Code generation
-
 *👨‍💻 Dev:* @RyanWez
 *GitHub:* `Coming Soon...`
     """
-    await update.message.reply_text(changelog_text, parse_mode='Markdown')
 
-async def unknown_command(update: Update, context) -> None:
-    """Handle unknown commands"""
-    command = update.message.text
-    
-    unknown_text = f"""
+async def update_command(update: Update, context) -> None:
+    """Show bot updates and changelog"""
+    await update.message.reply_text(CHANGELOG_TEXT, parse_mode='Markdown')
+
+def latency_text(bound) -> str:
+    if bound is None:
+        return "-"
+    if bound == float('inf'):
+        return f"> {LATENCY_BUCKETS_MS[-2] / 1000:g}s"
+    return f"≤ {bound:g}ms" if bound < 1000 else f"≤ {bound / 1000:g}s"
+
+def success_rate_text(rate) -> str:
+    return "-" if rate is None else f"{rate:.0%}"
+
+def stats_text(summary: dict, show_labels: bool = False) -> str:
+    generate = summary['generate']
+    decode = summary['decode']
+    lines = [
+        f"📊 *QR MM Bot - Stats (နောက်ဆုံး {summary['days']} ရက်)*",
+        "",
+        f"*🎨 QR Code ဖန်တီးမှု:* {generate['total']}",
+        f"• Cache မှ ပြန်ပို့: {generate['cached']}",
+        f"• မအောင်မြင်: {generate['errors']}",
+        f"• Latency p50 / p95: {latency_text(generate['p50_ms'])} / {latency_text(generate['p95_ms'])}",
+        "",
+        f"*📸 QR Code ဖတ်မှု:* {decode['total']}",
+        f"• ဖတ်နိုင်မှု: {success_rate_text(decode['success_rate'])}",
+        f"• Latency p50 / p95: {latency_text(decode['p50_ms'])} / {latency_text(decode['p95_ms'])}",
+    ]
+    if summary['per_day']:
+        lines += ["", "*📅 နေ့အလိုက် (p50 / p95):*"]
+        for day, kinds in sorted(summary['per_day'].items(), reverse=True):
+            day_generate, day_decode = kinds['generate'], kinds['decode']
+            lines += [
+                f"• `{day}`",
+                f"  🎨 {day_generate['total']} - {latency_text(day_generate['p50_ms'])} / "
+                f"{latency_text(day_generate['p95_ms'])}",
+                f"  📸 {day_decode['total']} ({success_rate_text(day_decode['success_rate'])}) - "
+                f"{latency_text(day_decode['p50_ms'])} / {latency_text(day_decode['p95_ms'])}",
+            ]
+    if show_labels and summary['top_labels']:
+        lines += ["", "*🔝 အများဆုံး:*"]
+        lines += [f"• `{label}` - {count}" for label, count in summary['top_labels']]
+    return "\n".join(lines)
+
+async def stats_command(update: Update, context) -> None:
+    """Generate/decode totals of the last week; admins also see the top payload hosts and types"""
+    summary = await analytics.summary(STATS_DAYS)
+    show_labels = update.effective_user is not None and update.effective_user.id in STATS_ADMIN_IDS
+    await update.message.reply_text(stats_text(summary, show_labels), parse_mode='Markdown')
+
+def unknown_command_text(command: str) -> str:
+    return f"""
 ❓ *မသိရှိသော Command*
 
 `{command}` ဆိုတဲ့ command ကို မသိရှိပါဘူး။
@@ -168,54 +527,163 @@ async def unknown_command(update: Update, context) -> None:
 /start - Bot ကို စတင်အသုံးပြုရန်
 /help - အကူအညီ ရယူရန်
 /update - နောက်ဆုံး Update များကြည့်ရန်
+/batch - QR Code အများအပြား ဖန်တီးရန်
+/stats - အသုံးပြုမှု စာရင်း ကြည့်ရန်
 
     """
-    await update.message.reply_text(unknown_text, parse_mode='Markdown')
+
+async def unknown_command(update: Update, context) -> None:
+    """Handle unknown commands"""
+    await update.message.reply_text(unknown_command_text(update.message.text), parse_mode='Markdown')
 
 
 # --- Message Handlers ---
+STYLE_HELP_TEXT = "🎨 *Design ပြောင်းရန်:* စာ/link နောက်မှာ ` | ` ခံပြီး options ထည့်ပါ\n`https://example.com | fg=#1a73e8 shape=dots`\n\n• `fg` / `bg` - အရောင် (#rrggbb, black, blue, ... / bg=transparent)\n• `shape` - square, rounded, dots\n• `size` - 128-2048 pixels\n• `format` - png, webp, svg\n• `logo` - ဓာတ်ပုံတစ်ပုံကို reply ပြန်ပြီး အလယ်မှာ logo ထည့်မယ်"
+
+LOGO_MISSING_TEXT = "🖼 *Logo ထည့်ရန်*\n\nLogo အဖြစ် သုံးမယ့် ဓာတ်ပုံကို reply ပြန်ပြီး `logo` option နဲ့ ပို့ပေးပါ။"
+
+# Smallest logo photo size worth downloading (the logo covers about a fifth of the code)
+LOGO_MIN_SIDE = 160
+
+async def send_styled_qr(update: Update, context, payload: str, style):
+    """Render payload with a QRStyle and send it: opaque PNGs as a photo, everything else as a file
+
+    Returns whether a cached file_id was resent, or None when no code was sent
+    """
+    message = update.message
+    logo_photo = None
+    if style.logo:
+        photos = message.reply_to_message.photo if message.reply_to_message else None
+        if not photos:
+            await message.reply_text(LOGO_MISSING_TEXT, parse_mode='Markdown', reply_to_message_id=message.message_id)
+            return None
+        logo_photo = next((size for size in photos if min(size.width, size.height) >= LOGO_MIN_SIDE), photos[-1])
+    
+    as_photo = style.format == 'png' and style.bg is not None
+    caption = f"✅ *QR Code ဖန်တီးပြီးပါပြီ*\n\n📝 *အချက်အလက်:* `{payload}`"
+    send = context.bot.send_photo if as_photo else context.bot.send_document
+    cache_key = make_key(payload, *style, logo_photo.file_unique_id if logo_photo else '')
+    
+    file_id = await qr_file_cache.fetch(cache_key)
+    if file_id:
+        try:
+            await send(message.chat_id, file_id, caption=caption, parse_mode='Markdown',
+                       reply_to_message_id=message.message_id)
+            return True
+        except BadRequest as e:
+            logger.warning(f"Cached file_id rejected: {e}")
+            qr_file_cache.invalidate(cache_key)
+    
+    logo = None
+    if logo_photo is not None:
+        with stage_seconds.time('file_download'):
+            logo = await download_file_bytes(await logo_photo.get_file())
+    data, make_seconds, encode_seconds = await render_pool.run(
+        render_styled_qr_timed, payload, style, logo, PNG_COMPRESS_LEVEL, timeout=RENDER_TIMEOUT
+    )
+    stage_seconds.observe(make_seconds, 'qr_make')
+    stage_seconds.observe(encode_seconds, 'styled_encode')
+    bio = io.BytesIO(data)
+    bio.name = f'qr_code.{style.format}'
+    with stage_seconds.time('telegram_upload'):
+        sent = await send(message.chat_id, bio, caption=caption, parse_mode='Markdown',
+                          reply_to_message_id=message.message_id)
+    if sent.photo:
+        qr_file_cache.put(cache_key, sent.photo[-1].file_id)
+    elif sent.document:
+        qr_file_cache.put(cache_key, sent.document.file_id)
+    return False
+
 async def handle_text_message(update: Update, context) -> None:
-    user_id = update.effective_user.id
+    started = time.perf_counter()
     text = update.message.text
     
-    # Update user activity
-    user_last_activity[user_id] = time.time()
-    
-    # Periodic cleanup (every 100 requests)
-    if len(user_last_activity) % 100 == 0:
-        cleanup_inactive_users()
+    # Update user activity and apply the per-user rate limit
+    if not await check_rate_limit(update):
+        return
     
     # Smart detection: Text/Link = Create QR Code automatically
     await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
     
+    # "text | options" asks for a styled code
     try:
-        # Generate QR code with optimized settings for speed and size
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,  # Lowest error correction for smaller size
-            box_size=8,  # Smaller box size for faster generation
-            border=2,    # Smaller border
+        text, style = split_style(text)
+    except StyleError as e:
+        await update.message.reply_text(
+            f"❌ *Option မှားနေပါတယ်:* {e}\n\n{STYLE_HELP_TEXT}",
+            parse_mode='Markdown',
+            reply_to_message_id=update.message.message_id
         )
-        qr.add_data(text)
-        qr.make(fit=True)
+        return
+    
+    label = payload_label(text)
+    if style is not None:
+        try:
+            cached = await send_styled_qr(update, context, text, style)
+            if cached is not None:
+                analytics.record('generate', 'styled', 'ok', started, cached=cached, label=label)
+        except PoolBusyError as e:
+            analytics.record('generate', 'styled', 'busy', started, label=label)
+            handler_errors.inc('text_busy')
+            logger.warning(f"Render pool busy: {e}")
+            await update.message.reply_text(BUSY_TEXT, parse_mode='Markdown', reply_to_message_id=update.message.message_id)
+        except Exception as e:
+            analytics.record('generate', 'styled', 'error', started, label=label)
+            handler_errors.inc('styled')
+            logger.error(f"Error generating styled QR code: {e}")
+            await update.message.reply_text(
+                "❌ QR Code ဖန်တီးရာတွင် အမှားတစ်ခုဖြစ်ပွားသွားပါတယ်။ Network connection ကို စစ်ကြည့်ပြီး ထပ်ကြိုးစားကြည့်ပါ။",
+                reply_to_message_id=update.message.message_id
+            )
+        return
+    
+    caption = f"✅ *QR Code ဖန်တီးပြီးပါပြီ*\n\n📝 *အချက်အလက်:* `{text}`\n\n💡 *Tip:* QR Code ဖတ်ချင်ရင် ဓာတ်ပုံ ပို့လိုက်ပါ"
+    cache_key = make_key(text, DEFAULT_BOX_SIZE, DEFAULT_BORDER)
+    
+    try:
+        # Already uploaded once: resend by file_id, no render and no upload
+        file_id = await qr_file_cache.fetch(cache_key)
+        if file_id:
+            try:
+                await context.bot.send_photo(
+                    chat_id=update.message.chat_id,
+                    photo=file_id,
+                    caption=caption,
+                    parse_mode='Markdown',
+                    reply_to_message_id=update.message.message_id
+                )
+                analytics.record('generate', 'text', 'ok', started, cached=True, label=label)
+                return
+            except BadRequest as e:
+                # Telegram no longer accepts this file_id, render a fresh one
+                logger.warning(f"Cached file_id rejected: {e}")
+                qr_file_cache.invalidate(cache_key)
         
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        bio = io.BytesIO()
+        # Generate QR code in the render pool so the event loop stays free
+        png_bytes, make_seconds, encode_seconds = await render_pool.run(
+            render_qr_png_timed, text, DEFAULT_BOX_SIZE, DEFAULT_BORDER, PNG_COMPRESS_LEVEL, timeout=RENDER_TIMEOUT
+        )
+        stage_seconds.observe(make_seconds, 'qr_make')
+        stage_seconds.observe(encode_seconds, 'png_encode')
+        bio = io.BytesIO(png_bytes)
         bio.name = 'qr_code.png'
-        # Optimize PNG for smaller file size and faster upload
-        qr_img.save(bio, 'PNG', optimize=True, compress_level=9)
-        bio.seek(0)
         
         # Try to send photo with better error handling
         try:
-            await context.bot.send_photo(
-                chat_id=update.message.chat_id, 
-                photo=bio, 
-                caption=f"✅ *QR Code ဖန်တီးပြီးပါပြီ*\n\n📝 *အချက်အလက်:* `{text}`\n\n💡 *Tip:* QR Code ဖတ်ချင်ရင် ဓာတ်ပုံ ပို့လိုက်ပါ",
-                parse_mode='Markdown',
-                reply_to_message_id=update.message.message_id
-            )
+            with stage_seconds.time('telegram_upload'):
+                message = await context.bot.send_photo(
+                    chat_id=update.message.chat_id, 
+                    photo=bio, 
+                    caption=caption,
+                    parse_mode='Markdown',
+                    reply_to_message_id=update.message.message_id
+                )
+            if message.photo:
+                qr_file_cache.put(cache_key, message.photo[-1].file_id)
+            analytics.record('generate', 'text', 'ok', started, label=label)
         except Exception as send_error:
+            analytics.record('generate', 'text', 'error', started, label=label)
+            handler_errors.inc('text_send')
             logger.error(f"Error sending photo: {send_error}")
             # If photo sending fails, send text message
             await update.message.reply_text(
@@ -224,97 +692,519 @@ async def handle_text_message(update: Update, context) -> None:
                 reply_to_message_id=update.message.message_id
             )
             
+    except PoolBusyError as e:
+        analytics.record('generate', 'text', 'busy', started, label=label)
+        handler_errors.inc('text_busy')
+        logger.warning(f"Render pool busy: {e}")
+        await update.message.reply_text(
+            BUSY_TEXT,
+            parse_mode='Markdown',
+            reply_to_message_id=update.message.message_id
+        )
     except Exception as e:
+        analytics.record('generate', 'text', 'error', started, label=label)
+        handler_errors.inc('text')
         logger.error(f"Error generating QR code: {e}")
         await update.message.reply_text(
             "❌ QR Code ဖန်တီးရာတွင် အမှားတစ်ခုဖြစ်ပွားသွားပါတယ်။ Network connection ကို စစ်ကြည့်ပြီး ထပ်ကြိုးစားကြည့်ပါ။",
             reply_to_message_id=update.message.message_id
         )
 
+def decoded_codes_text(codes: list) -> str:
+    """Reply for a finished scan: the payload(s) found, or tips when there was none"""
+    if len(codes) == 1:
+        return f"✅ *QR Code ဖတ်ပြီးပါပြီ*\n\n📋 *တွေ့ရှိသော အချက်အလက်:*\n`{codes[0]}`\n\n💡 *Tip:* QR Code ဖန်တီးချင်ရင် စာ သို့ link ပို့လိုက်ပါ"
+    if codes:
+        found = "\n".join(f"{index}. `{data}`" for index, data in enumerate(codes, 1))
+        return f"✅ *QR Code {len(codes)} ခု ဖတ်ပြီးပါပြီ*\n\n📋 *တွေ့ရှိသော အချက်အလက်များ:*\n{found}\n\n💡 *Tip:* QR Code ဖန်တီးချင်ရင် စာ သို့ link ပို့လိုက်ပါ"
+    return "❌ *QR Code မတွေ့ပါ*\n\nဒီပုံထဲမှာ QR Code မတွေ့ပါဘူး။ ရှင်းလင်းတဲ့ QR Code ပုံတစ်ပုံကို ထပ်ပို့ကြည့်ပါ။\n\n💡 *Tips:*\n• QR Code ကို ရှင်းရှင်းလင်းလင်း ရိုက်ပါ\n• အလင်း လုံလောက်အောင် ရိုက်ပါ\n• QR Code တစ်ခုလုံး ပါအောင် ရိုက်ပါ"
+
 async def handle_photo_message(update: Update, context) -> None:
-    user_id = update.effective_user.id
-    
-    # Update user activity
-    user_last_activity[user_id] = time.time()
+    started = time.perf_counter()
+    # Update user activity and apply the per-user rate limit
+    if not await check_rate_limit(update):
+        return
     
     # Smart detection: Photo = Read QR Code automatically
     chat_id = update.effective_chat.id
     await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
 
     try:
-        photo_file = await update.message.photo[-1].get_file()
+        photo = update.message.photo[-1]
         
-        # Download the photo to a byte array in memory
-        photo_bytes = await photo_file.download_as_bytearray()
-        
-        # Convert byte array to a NumPy array
-        np_array = np.frombuffer(photo_bytes, np.uint8)
+        # Forwarded/re-sent images share file_unique_id: answer without downloading
+        codes = await decode_cache.fetch(photo.file_unique_id)
+        if isinstance(codes, str):
+            # Entries persisted before multi-code support
+            codes = [codes] if codes else []
+        cached = codes is not None
+        if codes is None:
+            readable = False
+            candidates = photo_ladder.candidates(update.message.photo)
+            # Photos without a code would otherwise run every stage at every size
+            cpu_left_ms = PHOTO_MAX_CPU_SECONDS * 1000
+            for index, photo_size in enumerate(candidates):
+                # Reserve the decode's estimated peak memory before downloading;
+                # under pressure this picks a reduced-size decode or waits
+                options = decode_options(
+                    photo_size.file_size or photo_size.width * photo_size.height // 4,
+                    photo_size.width, photo_size.height, DECODE_INPUT_COPIES
+                )
+                reduce, reservation = await decode_budget.admit(options, timeout=DECODE_MEMORY_WAIT)
+                try:
+                    with stage_seconds.time('file_download'):
+                        photo_file = await photo_size.get_file()
+                        # A local Bot API server's file is memory-mapped by the worker instead
+                        photo_path = local_file_path(photo_file)
+                        photo_bytes = None if photo_path else await download_file_bytes(photo_file)
+                except BaseException:
+                    reservation.release()
+                    raise
+                
+                # Decode in the decode pool so large photos cannot freeze the event loop;
+                # the reservation is released when the job really ends
+                stages = STAGES if index == len(candidates) - 1 else LADDER_STAGES
+                if photo_path:
+                    job = ('decoding:decode_qr_file', photo_path, reduce, stages, cpu_left_ms)
+                else:
+                    job = ('decoding:decode_qr_image', photo_bytes, reduce, stages, cpu_left_ms)
+                try:
+                    result = await decode_pool.run(*job, timeout=DECODE_TIMEOUT, on_done=reservation.release)
+                except InvalidImageError:
+                    photo_ladder.record(photo_size, False)
+                    continue
+                finally:
+                    # Do not keep this size's bytes alive while the next one downloads
+                    del photo_bytes, job
+                readable = True
+                decode_stats.record(result)
+                stage_seconds.observe(result.decode_ms / 1000, 'imdecode')
+                stage_seconds.observe(sum(result.timings.values()) / 1000, 'detection')
+                codes = result.codes
+                photo_ladder.record(photo_size, bool(codes))
+                cpu_left_ms -= result.decode_ms + sum(result.timings.values())
+                if codes or cpu_left_ms <= 0:
+                    break
+            
+            if not readable:
+                analytics.record('decode', 'photo', 'unreadable', started)
+                await update.message.reply_text(
+                    "❌ *ဓာတ်ပုံ ဖတ်၍မရပါ*\n\nဓာတ်ပုံကို ဖတ်လို့မရပါဘူး။ တခြားပုံတစ်ပုံကို ထပ်ပို့ကြည့်ပါ။\n\n💡 *Tip:* QR Code ဖန်တီးချင်ရင် စာ သို့ link ပို့လိုက်ပါ",
+                    parse_mode='Markdown',
+                    reply_to_message_id=update.message.message_id
+                )
+                return
+            
+            # Found codes are kept until evicted, misses only for DECODE_NEGATIVE_TTL
+            decode_cache.put(photo.file_unique_id, codes, ttl=None if codes else DECODE_NEGATIVE_TTL)
         
-        # Decode the NumPy array into an image
-        img = cv2.imdecode(np_array, cv2.IMREAD_COLOR)
+        await update.message.reply_text(
+            decoded_codes_text(codes),
+            parse_mode='Markdown',
+            reply_to_message_id=update.message.message_id
+        )
+        analytics.record('decode', 'photo', 'found' if codes else 'none', started, cached=cached)
 
-        if img is None:
-            await update.message.reply_text(
-                "❌ *ဓာတ်ပုံ ဖတ်၍မရပါ*\n\nဓာတ်ပုံကို ဖတ်လို့မရပါဘူး။ တခြားပုံတစ်ပုံကို ထပ်ပို့ကြည့်ပါ။\n\n💡 *Tip:* QR Code ဖန်တီးချင်ရင် စာ သို့ link ပို့လိုက်ပါ",
-                parse_mode='Markdown',
-                reply_to_message_id=update.message.message_id
-            )
-            return
+    except (PoolBusyError, MemoryBudgetError) as e:
+        analytics.record('decode', 'photo', 'busy', started)
+        handler_errors.inc('photo_busy')
+        logger.warning(f"Decode pool busy: {e}")
+        await update.message.reply_text(
+            BUSY_TEXT,
+            parse_mode='Markdown',
+            reply_to_message_id=update.message.message_id
+        )
+    except asyncio.TimeoutError:
+        analytics.record('decode', 'photo', 'timeout', started)
+        handler_errors.inc('photo_timeout')
+        logger.warning(f"QR decode timed out after {DECODE_TIMEOUT}s")
+        await update.message.reply_text(
+            "❌ *QR Code ဖတ်၍မရပါ*\n\nဓာတ်ပုံ ဖတ်ရာတွင် အချိန်ကြာလွန်းသွားပါတယ်။ ပိုရှင်းတဲ့ ပုံတစ်ပုံကို ထပ်ပို့ကြည့်ပါ။",
+            parse_mode='Markdown',
+            reply_to_message_id=update.message.message_id
+        )
+    except Exception as e:
+        analytics.record('decode', 'photo', 'error', started)
+        handler_errors.inc('photo')
+        logger.error(f"Error decoding QR code with OpenCV: {e}")
+        await update.message.reply_text(
+            "❌ *QR Code ဖတ်၍မရပါ*\n\nQR Code ကိုဖတ်ရာတွင် အမှားတစ်ခုဖြစ်ပွားသွားပါတယ်။ ထပ်ကြိုးစားကြည့်ပါ။\n\n💡 *Tip:* QR Code ဖန်တီးချင်ရင် စာ သို့ link ပို့လိုက်ပါ",
+            parse_mode='Markdown',
+            reply_to_message_id=update.message.message_id
+        )
 
-        # Initialize the QRCode detector
-        detector = cv2.QRCodeDetector()
-        data, vertices, straight_qrcode = detector.detectAndDecode(img)
-        
-        if data:
-            reply_text = f"✅ *QR Code ဖတ်ပြီးပါပြီ*\n\n📋 *တွေ့ရှိသော အချက်အလက်:*\n`{data}`\n\n💡 *Tip:* QR Code ဖန်တီးချင်ရင် စာ သို့ link ပို့လိုက်ပါ"
+
+MEDIA_TOO_LARGE_TEXT = f"❌ *ဖိုင် အရမ်းကြီးနေပါတယ်*\n\n{MEDIA_MAX_BYTES // (1024 * 1024)} MB ထက်မကြီးတဲ့ ဖိုင် သို့မဟုတ် {VIDEO_MAX_DURATION} စက္ကန့်ထက် မကျော်တဲ့ ဗီဒီယိုကို ပို့ပေးပါ။"
+
+MEDIA_UNREADABLE_TEXT = "❌ *ဖိုင် ဖတ်၍မရပါ*\n\nဒီဖိုင်ကို ဖတ်လို့မရပါဘူး။ တခြားဖိုင်တစ်ခုကို ထပ်ပို့ကြည့်ပါ။\n\n💡 *Tip:* QR Code ဖန်တီးချင်ရင် စာ သို့ link ပို့လိုက်ပါ"
+
+def media_to_scan(message):
+    """(kind, media) for documents and videos that can hold a QR Code, else None"""
+    if message.video:
+        return 'video', message.video
+    if message.animation:
+        return 'video', message.animation
+    document = message.document
+    if document is not None:
+        mime_type = (document.mime_type or '').lower()
+        if mime_type.startswith('image/'):
+            return 'image', document
+        if mime_type.startswith('video/'):
+            return 'video', document
+        if mime_type == 'application/pdf' and PDF_SUPPORTED:
+            return 'pdf', document
+    return None
+
+async def close_download_session() -> None:
+    global _download_session
+    if _download_session is not None:
+        await _download_session.close()
+        _download_session = None
+
+async def download_to_temp_file(telegram_file, max_bytes: int) -> str:
+    """Stream a Telegram file to a temporary file, aborting once it exceeds max_bytes"""
+    global _download_session
+    if _download_session is None:
+        _download_session = ClientSession(
+            connector=TCPConnector(limit=BOT_API_POOL_SIZE, keepalive_timeout=BOT_API_KEEPALIVE),
+            timeout=ClientTimeout(total=120),
+        )
+    fd, path = tempfile.mkstemp(prefix='qrbot-media-', dir=MEDIA_TMP_DIR)
+    try:
+        size = 0
+        with os.fdopen(fd, 'wb') as f:
+            async with _download_session.get(telegram_file.file_path) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise MediaTooLargeError(f"File exceeds {max_bytes} bytes")
+                    f.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+def read_image_header(path: str):
+    """(width, height, format) from the image header, without decoding pixels"""
+    from PIL import Image, UnidentifiedImageError
+    
+    try:
+        with Image.open(path) as img:
+            return img.width, img.height, img.format
+    except Image.DecompressionBombError as e:
+        raise MediaTooLargeError(str(e)) from None
+    except (UnidentifiedImageError, OSError) as e:
+        raise InvalidImageError(str(e)) from None
+
+async def scan_media_file(kind: str, media):
+    """Download a document/video to disk, reserve decode memory for it and scan it in the decode pool"""
+    with stage_seconds.time('file_download'):
+        telegram_file = await media.get_file()
+        # A local Bot API server already has the file on this machine: scan it in place
+        local_path = local_file_path(telegram_file)
+        path = local_path or await download_to_temp_file(telegram_file, MEDIA_MAX_BYTES)
+    
+    def remove_download() -> None:
+        if local_path is None:
+            with suppress(FileNotFoundError):
+                os.unlink(path)
+    
+    try:
+        if local_path is not None and os.path.getsize(path) > MEDIA_MAX_BYTES:
+            raise MediaTooLargeError(f"File exceeds {MEDIA_MAX_BYTES} bytes")
+        file_size = os.path.getsize(path)
+        if kind == 'image':
+            width, height, image_format = read_image_header(path)
+            if width * height > MEDIA_MAX_PIXELS:
+                raise MediaTooLargeError(f"Image has {width * height} pixels")
+            if image_format == 'JPEG':
+                # Large JPEGs are decoded straight to a bounded resolution
+                options = decode_options(file_size, width, height, first_reduce=bounded_reduce(width, height))
+            else:
+                options = [(1, estimate_decode_bytes(file_size, width, height))]
+        elif kind == 'pdf':
+            options = [(1, estimate_page_bytes(file_size, PDF_RENDER_SIDE))]
         else:
-            reply_text = "❌ *QR Code မတွေ့ပါ*\n\nဒီပုံထဲမှာ QR Code မတွေ့ပါဘူး။ ရှင်းလင်းတဲ့ QR Code ပုံတစ်ပုံကို ထပ်ပို့ကြည့်ပါ။\n\n💡 *Tips:*\n• QR Code ကို ရှင်းရှင်းလင်းလင်း ရိုက်ပါ\n• အလင်း လုံလောက်အောင် ရိုက်ပါ\n• QR Code တစ်ခုလုံး ပါအောင် ရိုက်ပါ"
+            width = getattr(media, 'width', None) or VIDEO_DEFAULT_SIZE[0]
+            height = getattr(media, 'height', None) or VIDEO_DEFAULT_SIZE[1]
+            options = [(1, estimate_frame_bytes(width, height))]
+        reduce, reservation = await decode_budget.admit(options, timeout=DECODE_MEMORY_WAIT)
+    except BaseException:
+        remove_download()
+        raise
+    
+    def finished() -> None:
+        # Runs when the job really ends (even after a timeout), so the file is no longer read
+        reservation.release()
+        remove_download()
+    
+    if kind == 'image':
+        job = ('media:scan_image', path, reduce)
+    elif kind == 'pdf':
+        job = ('media:scan_pdf', path, PDF_MAX_PAGES, PDF_RENDER_SIDE, MEDIA_MAX_CPU_SECONDS)
+    else:
+        job = ('media:scan_video', path, VIDEO_MAX_FRAMES, MEDIA_MAX_CPU_SECONDS)
+    return await decode_pool.run(*job, timeout=MEDIA_TIMEOUT, on_done=finished)
+
+async def handle_media_message(update: Update, context) -> None:
+    """Scan image documents, PDFs and videos for QR Codes"""
+    started = time.perf_counter()
+    message = update.message
+    kind, media = media_to_scan(message)
+    # PDFs and videos can cost several decodes
+    if not await check_rate_limit(update, cost=1 if kind == 'image' else 2):
+        return
+    
+    chat_id = update.effective_chat.id
+    await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
+    
+    try:
+        too_long = kind == 'video' and (getattr(media, 'duration', 0) or 0) > VIDEO_MAX_DURATION
+        if too_long or (media.file_size or 0) > MEDIA_MAX_BYTES:
+            analytics.record('decode', kind, 'too_large', started)
+            await message.reply_text(MEDIA_TOO_LARGE_TEXT, parse_mode='Markdown', reply_to_message_id=message.message_id)
+            return
+        
+        codes = await decode_cache.fetch(media.file_unique_id)
+        cached = codes is not None
+        if codes is None:
+            try:
+                result = await scan_media_file(kind, media)
+            except InvalidImageError:
+                analytics.record('decode', kind, 'unreadable', started)
+                await message.reply_text(MEDIA_UNREADABLE_TEXT, parse_mode='Markdown', reply_to_message_id=message.message_id)
+                return
+            media_stats.record(kind, result)
+            stage_seconds.observe(result.cpu_ms / 1000, 'media_scan')
+            codes = result.codes
+            decode_cache.put(media.file_unique_id, codes, ttl=None if codes else DECODE_NEGATIVE_TTL)
         
+        await message.reply_text(
+            decoded_codes_text(codes),
+            parse_mode='Markdown',
+            reply_to_message_id=message.message_id
+        )
+        analytics.record('decode', kind, 'found' if codes else 'none', started, cached=cached)
+    
+    except MediaTooLargeError as e:
+        analytics.record('decode', kind, 'too_large', started)
+        logger.info(f"Rejected {kind} file: {e}")
+        await message.reply_text(MEDIA_TOO_LARGE_TEXT, parse_mode='Markdown', reply_to_message_id=message.message_id)
+    except (PoolBusyError, MemoryBudgetError) as e:
+        analytics.record('decode', kind, 'busy', started)
+        handler_errors.inc('media_busy')
+        logger.warning(f"Decode pool busy: {e}")
+        await message.reply_text(BUSY_TEXT, parse_mode='Markdown', reply_to_message_id=message.message_id)
+    except asyncio.TimeoutError:
+        analytics.record('decode', kind, 'timeout', started)
+        handler_errors.inc('media_timeout')
+        logger.warning(f"{kind} scan timed out after {MEDIA_TIMEOUT}s")
+        await message.reply_text(
+            "❌ *QR Code ဖတ်၍မရပါ*\n\nဖိုင် ဖတ်ရာတွင် အချိန်ကြာလွန်းသွားပါတယ်။ ပိုသေးတဲ့ ဖိုင်တစ်ခုကို ထပ်ပို့ကြည့်ပါ။",
+            parse_mode='Markdown',
+            reply_to_message_id=message.message_id
+        )
+    except Exception as e:
+        analytics.record('decode', kind, 'error', started)
+        handler_errors.inc('media')
+        logger.error(f"Error scanning {kind} file: {e}")
+        await message.reply_text(MEDIA_UNREADABLE_TEXT, parse_mode='Markdown', reply_to_message_id=message.message_id)
+
+
+async def run_batch(update: Update, context, lines: list) -> None:
+    """Render every line as a QR Code and deliver them as albums or one ZIP"""
+    chat_id = update.effective_chat.id
+    if not lines:
         await update.message.reply_text(
-            reply_text, 
+            "📦 *Batch QR Code*\n\nQR Code ဖန်တီးမယ့် စာကြောင်းတွေ မတွေ့ပါ။\n\n💡 *ဥပမာ:*\n`/batch`\n`https://google.com`\n`09123456789`",
             parse_mode='Markdown',
             reply_to_message_id=update.message.message_id
         )
+        return
+    if len(lines) > BATCH_MAX_LINES:
+        await update.message.reply_text(
+            f"❌ *စာကြောင်း များလွန်းပါတယ်*\n\nတစ်ကြိမ်မှာ အများဆုံး {BATCH_MAX_LINES} ကြောင်းသာ ပို့နိုင်ပါတယ်။",
+            parse_mode='Markdown',
+            reply_to_message_id=update.message.message_id
+        )
+        return
+    
+    window = render_pool.workers * 2
+    render_args = (DEFAULT_BOX_SIZE, DEFAULT_BORDER, PNG_COMPRESS_LEVEL)
+    failed = 0
+    # Lines are recorded once delivered; on busy/error the rest are recorded with that outcome
+    recorded = 0
 
+    def record_delivered(rendered: list) -> None:
+        nonlocal recorded
+        for text, ok in rendered:
+            analytics.record('generate', 'batch', 'ok' if ok else 'error', label=payload_label(text))
+        recorded += len(rendered)
+
+    def record_undelivered(outcome: str) -> None:
+        for text in lines[recorded:]:
+            analytics.record('generate', 'batch', outcome, label=payload_label(text))
+
+    try:
+        if len(lines) <= BATCH_ALBUM_MAX:
+            # Small batches: albums of 10, each album rendered and sent before the next
+            for chunk in chunked(lines, ALBUM_SIZE):
+                await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.UPLOAD_PHOTO)
+                media = []
+                rendered = []
+                async for text, png in render_in_order(render_pool, render_qr_png, chunk, window, *render_args):
+                    rendered.append((text, png is not None))
+                    if png is None:
+                        failed += 1
+                        continue
+                    media.append(InputMediaPhoto(media=png, caption=text[:1024]))
+                if len(media) == 1:
+                    await context.bot.send_photo(chat_id=chat_id, photo=media[0].media, caption=media[0].caption)
+                elif media:
+                    await context.bot.send_media_group(chat_id=chat_id, media=media)
+                record_delivered(rendered)
+        else:
+            # Large batches: stream PNGs into a single ZIP
+            await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.UPLOAD_DOCUMENT)
+            archive = ZipBuilder()
+            rendered = []
+            try:
+                async for text, png in render_in_order(render_pool, render_qr_png, lines, window, *render_args):
+                    rendered.append((text, png is not None))
+                    if png is None:
+                        failed += 1
+                    archive.add(text, png)
+                await context.bot.send_document(
+                    chat_id=chat_id,
+                    document=archive.finish(),
+                    filename='qr_codes.zip',
+                    caption=f"✅ QR Code {len(lines) - failed} ခု ဖန်တီးပြီးပါပြီ",
+                    reply_to_message_id=update.message.message_id
+                )
+                record_delivered(rendered)
+            finally:
+                archive.close()
+        
+        if failed:
+            await update.message.reply_text(
+                f"⚠️ စာကြောင်း {failed} ကြောင်းကို QR Code ဖန်တီးလို့ မရပါဘူး (ရှည်လွန်းနိုင်ပါတယ်)။",
+                reply_to_message_id=update.message.message_id
+            )
+    except PoolBusyError as e:
+        record_undelivered('busy')
+        handler_errors.inc('batch_busy')
+        logger.warning(f"Render pool busy during batch: {e}")
+        await update.message.reply_text(
+            BUSY_TEXT,
+            parse_mode='Markdown',
+            reply_to_message_id=update.message.message_id
+        )
     except Exception as e:
-        logger.error(f"Error decoding QR code with OpenCV: {e}")
+        record_undelivered('error')
+        handler_errors.inc('batch')
+        logger.error(f"Error generating batch QR codes: {e}")
         await update.message.reply_text(
-            "❌ *QR Code ဖတ်၍မရပါ*\n\nQR Code ကိုဖတ်ရာတွင် အမှားတစ်ခုဖြစ်ပွားသွားပါတယ်။ ထပ်ကြိုးစားကြည့်ပါ။\n\n💡 *Tip:* QR Code ဖန်တီးချင်ရင် စာ သို့ link ပို့လိုက်ပါ",
+            "❌ QR Code ဖန်တီးရာတွင် အမှားတစ်ခုဖြစ်ပွားသွားပါတယ်။ Network connection ကို စစ်ကြည့်ပြီး ထပ်ကြိုးစားကြည့်ပါ။",
+            reply_to_message_id=update.message.message_id
+        )
+
+async def batch_command(update: Update, context) -> None:
+    """Batch QR generation: /batch followed by one payload per line"""
+    # A batch takes the user's whole bucket
+    if not await check_rate_limit(update, cost=USER_BURST):
+        return
+    
+    # Everything after the command itself, one payload per line
+    command_line, _, body = update.message.text.partition('\n')
+    lines = parse_lines(command_line.partition(' ')[2] + '\n' + body)
+    await run_batch(update, context, lines)
+
+async def handle_batch_document(update: Update, context) -> None:
+    """Batch QR generation from an uploaded .txt or .csv file"""
+    # A batch takes the user's whole bucket
+    if not await check_rate_limit(update, cost=USER_BURST):
+        return
+    
+    document = update.message.document
+    if document.file_size and document.file_size > BATCH_DOCUMENT_MAX_BYTES:
+        await update.message.reply_text(
+            f"❌ *ဖိုင် ကြီးလွန်းပါတယ်*\n\nအများဆုံး {BATCH_DOCUMENT_MAX_BYTES // 1024} KB အထိသာ လက်ခံပါတယ်။",
             parse_mode='Markdown',
             reply_to_message_id=update.message.message_id
         )
+        return
+    
+    try:
+        document_file = await document.get_file()
+        content = bytes(await document_file.download_as_bytearray()).decode('utf-8-sig', errors='replace')
+    except Exception as e:
+        logger.error(f"Error downloading batch document: {e}")
+        await update.message.reply_text(
+            "❌ ဖိုင်ကို ဖတ်လို့မရပါဘူး။ ထပ်ကြိုးစားကြည့်ပါ။",
+            reply_to_message_id=update.message.message_id
+        )
+        return
+    
+    is_csv = (document.file_name or '').lower().endswith('.csv')
+    lines = parse_csv(content) if is_csv else parse_lines(content)
+    del content
+    await run_batch(update, context, lines)
 
 
+# Labels for unsupported message types, checked in order (field names match the Bot API JSON)
+UNSUPPORTED_MESSAGE_LABELS = (
+    ('sticker', "Sticker"),
+    ('document', "Document"),
+    ('audio', "Audio"),
+    ('voice', "Voice message"),
+    ('location', "Location"),
+    ('contact', "Contact"),
+)
+
+def unsupported_message_text(fields) -> str:
+    """Reply for a message type the bot cannot use; fields = message fields that are set"""
+    message_type = next((label for field, label in UNSUPPORTED_MESSAGE_LABELS if field in fields), "အခြား")
+    return (
+        f"🤔 *{message_type} ကို လက်ခံ၍မရပါ*\n\n*✅ လက်ခံနိုင်သော အမျိုးအစားများ:*\n• 📝 *စာ/Text* - QR Code ဖန်တီးမယ်\n• 🔗 *Link* - QR Code ဖန်တီးမယ်\n• 📸 *ဓာတ်ပုံ* - QR Code ဖတ်မယ်\n• 🎞 *ပုံဖိုင် / PDF / ဗီဒီယို* - QR Code ဖတ်မယ်\n• 📄 *.txt / .csv ဖိုင်* - QR Code အများအပြား ဖန်တီးမယ်\n\n💡 *အသုံးပြုပုံ:*\n• QR Code ဖန်တီးချင်ရင် → စာ သို့ link ပို့ပါ\n• QR Code ဖတ်ချင်ရင် → ဓာတ်ပုံ ပို့ပါ"
+    )
+
 async def handle_other_messages(update: Update, context) -> None:
     """Handle other message types (stickers, documents, etc.)"""
-    user_id = update.effective_user.id
-    
     # Update user activity
-    user_last_activity[user_id] = time.time()
-    
-    # Determine message type for better response
-    message_type = "အခြား"
-    if update.message.sticker:
-        message_type = "Sticker"
-    elif update.message.document:
-        message_type = "Document"
-    elif update.message.video:
-        message_type = "Video"
-    elif update.message.audio:
-        message_type = "Audio"
-    elif update.message.voice:
-        message_type = "Voice message"
-    elif update.message.location:
-        message_type = "Location"
-    elif update.message.contact:
-        message_type = "Contact"
-    
-    await update.message.reply_text(
-        f"🤔 *{message_type} ကို လက်ခံ၍မရပါ*\n\n*✅ လက်ခံနိုင်သော အမျိုးအစားများ:*\n• 📝 *စာ/Text* - QR Code ဖန်တီးမယ်\n• 🔗 *Link* - QR Code ဖန်တီးမယ်\n• 📸 *ဓာတ်ပုံ* - QR Code ဖတ်မယ်\n\n💡 *အသုံးပြုပုံ:*\n• QR Code ဖန်တီးချင်ရင် → စာ သို့ link ပို့ပါ\n• QR Code ဖတ်ချင်ရင် → ဓာတ်ပုံ ပို့ပါ",
+    user_activity.touch(update.effective_user.id)
+    
+    message = update.message
+    fields = {field for field, _ in UNSUPPORTED_MESSAGE_LABELS if getattr(message, field)}
+    await message.reply_text(
+        unsupported_message_text(fields),
         parse_mode='Markdown',
-        reply_to_message_id=update.message.message_id
+        reply_to_message_id=message.message_id
     )
 
+def static_reply(message: dict):
+    """Webhook response body for messages answered with static text, None when a handler must run"""
+    sender = message.get('from')
+    if sender is None:
+        return None
+    command = parse_command(message)
+    if command is not None:
+        name, mention = command
+        # Mentions need the bot's username (only known after getMe); /batch renders, /stats reads the log
+        if mention is not None or name in ('batch', 'stats'):
+            return None
+        if name == 'start':
+            return reply_method(message, welcome_text(sender.get('first_name', '')))
+        if name == 'help':
+            return reply_method(message, HELP_TEXT)
+        if name == 'update':
+            return reply_method(message, CHANGELOG_TEXT)
+        return reply_method(message, unknown_command_text(message['text']))
+    if is_supported_message(message, SCANNABLE_DOCUMENT_TYPES):
+        return None
+    user_activity.touch(sender['id'])
+    return reply_method(message, unsupported_message_text(message), quote=True)
+
 
 # --- Callback & Inline Handlers ---
 async def button_handler(update: Update, context) -> None:
@@ -332,8 +1222,12 @@ async def inline_qr(update: Update, context) -> None:
     query_text = update.inline_query.query
     if not query_text:
         return
-    encoded_text = quote(query_text)
-    qr_image_url = f"http://api.qrserver.com/v1/create-qr-code/?data={encoded_text}&size=200x200"
+    # Polling mode has no public web server for the image
+    if WEBHOOK_URL:
+        qr_image_url = inline_image_url(query_text, update.effective_user.id)
+    else:
+        encoded_text = quote(query_text)
+        qr_image_url = f"http://api.qrserver.com/v1/create-qr-code/?data={encoded_text}&size=200x200"
     results = [
         InlineQueryResultPhoto(
             id=str(uuid.uuid4()),
@@ -342,7 +1236,56 @@ async def inline_qr(update: Update, context) -> None:
             caption=f"QR Code for: '{query_text}'"
         )
     ]
-    await update.inline_query.answer(results, cache_time=10)
+    # Results only depend on the query text (and the user, whose id the image URL
+    # carries for rate limiting), so Telegram may cache them per user for long
+    await update.inline_query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=bool(WEBHOOK_URL))
+    analytics.record('generate', 'inline', 'ok', label=payload_label(query_text))
+
+
+def sign_payload(encoded: str, user_id: str) -> str:
+    """HMAC signature for an encoded inline payload and the user it was answered to"""
+    return hmac.new(_inline_key, f"{encoded}:{user_id}".encode(), hashlib.sha256).hexdigest()[:32]
+
+def inline_image_url(text: str, user_id: int) -> str:
+    """Signed URL of the self-hosted QR image for an inline query"""
+    encoded = base64.urlsafe_b64encode(text.encode('utf-8')).decode().rstrip('=')
+    return f"{WEBHOOK_URL}/inline/qr.jpg?d={encoded}&u={user_id}&s={sign_payload(encoded, str(user_id))}"
+
+async def inline_image_handler(request: Request) -> Response:
+    """Serve QR images for inline results (signed payloads only)"""
+    encoded = request.query.get('d', '')
+    user_id = request.query.get('u', '')
+    signature = request.query.get('s', '')
+    if not encoded or not hmac.compare_digest(signature, sign_payload(encoded, user_id)):
+        return web.Response(status=403)
+    
+    cached = inline_image_cache.get(encoded)
+    if cached is None:
+        # Only renders are charged; images already cached are free
+        if not inline_activity.allow(user_id)[0]:
+            return web.Response(status=429, headers={'Retry-After': '1'})
+        try:
+            text = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)).decode('utf-8')
+            image = await render_pool.run(render_qr_jpeg, text, INLINE_BOX_SIZE, DEFAULT_BORDER, timeout=RENDER_TIMEOUT)
+        except PoolBusyError:
+            return web.Response(status=503, headers={'Retry-After': '1'})
+        except Exception as e:
+            handler_errors.inc('inline_image')
+            logger.error(f"Error rendering inline QR image: {e}")
+            return web.Response(status=400)
+        etag = f'"{hashlib.sha256(image).hexdigest()[:32]}"'
+        cached = (image, etag)
+        inline_image_cache.put(encoded, cached)
+    
+    image, etag = cached
+    # The image for a signed URL never changes, so let proxies and clients keep it
+    headers = {
+        'ETag': etag,
+        'Cache-Control': 'public, max-age=31536000, immutable',
+    }
+    if etag in request.headers.get('If-None-Match', ''):
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=image, content_type='image/jpeg', headers=headers)
 
 
 # Health check endpoint
@@ -353,7 +1296,27 @@ async def health_check(request: Request) -> Response:
         health_data = {
             "status": "healthy",
             "bot_name": BOT_NAME,
-            "timestamp": asyncio.get_event_loop().time()
+            "timestamp": asyncio.get_event_loop().time(),
+            "qr_file_cache": qr_file_cache.stats(),
+            "decode_cache": decode_cache.stats(),
+            "photo_sizes": photo_ladder.stats(),
+            "decode_pipeline": decode_stats.stats(),
+            "decode_memory": decode_budget.stats(),
+            "bot_api": {
+                "server": BOT_API_BASE_URL or "api.telegram.org",
+                "local_mode": BOT_API_LOCAL_MODE,
+                "http2": BOT_API_HTTP2 and HTTP2_SUPPORTED,
+                "pool_size": BOT_API_POOL_SIZE,
+            },
+            "media": media_stats.stats(),
+            "analytics": analytics.stats(),
+            "dispatcher": request.app['dispatcher'].stats(),
+            "outbound": outbound_limiter.stats(),
+            "users": user_activity.stats(),
+            "inline_users": inline_activity.stats(),
+            "ready": request.app['ready'].is_set(),
+            "worker": {"index": request.app.get('worker_index'), "pid": os.getpid(), "workers": PROCESS_COUNT},
+            "startup": startup_timer.stats()
         }
         return web.json_response(health_data, status=200)
     except Exception as e:
@@ -367,31 +1330,103 @@ async def webhook_handler(request: Request) -> Response:
         # Get the application from request app
         application = request.app['telegram_app']
         
-        # Get update data
-        update_data = await request.json()
-        update = Update.de_json(update_data, application.bot)
+        with stage_seconds.time('webhook_parse'):
+            update_data = await request.json()
+        
+        # Fast path on the raw JSON: drop update types without handlers...
+        kind = update_type(update_data)
+        if kind is None:
+            webhook_fast_path.inc('dropped')
+            return web.Response(status=200)
+        # ...and answer static replies in the response body (unless the chat has
+        # updates in flight, which would be overtaken)
+        if kind == 'message' and not request.app['dispatcher'].is_busy(update_data['message']['chat']['id']):
+            reply = static_reply(update_data['message'])
+            if reply is not None:
+                webhook_fast_path.inc('reply')
+                startup_timer.mark('first_update_accepted')
+                return web.json_response(reply)
         
-        # Process the update asynchronously (non-blocking)
-        asyncio.create_task(application.process_update(update))
+        # Cold start: the listener is up before the bot is initialized
+        if not request.app['ready'].is_set():
+            try:
+                await asyncio.wait_for(request.app['ready'].wait(), STARTUP_READY_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("Bot not initialized yet, asking Telegram to retry")
+                return web.Response(status=503, headers={'Retry-After': '5'})
+        
+        with stage_seconds.time('webhook_deserialize'):
+            update = Update.de_json(update_data, application.bot)
+        
+        # Queue the update (per-chat order, bounded concurrency)
+        if not request.app['dispatcher'].submit(update):
+            # Saturated: shed explicitly, Telegram redelivers the update later
+            logger.warning(f"Dispatcher saturated, shedding update {update.update_id}")
+            return web.Response(status=503, headers={'Retry-After': '5'})
         
         # Return immediately to Telegram
+        startup_timer.mark('first_update_accepted')
         return web.Response(status=200)
     except Exception as e:
+        handler_errors.inc('webhook')
         logger.error(f"Error processing webhook: {e}")
         return web.Response(status=500)
 
+async def metrics_handler(request: Request) -> Response:
+    """Prometheus metrics endpoint"""
+    return web.Response(
+        text=metrics.render(),
+        content_type='text/plain',
+        headers={'X-Content-Type-Options': 'nosniff'},
+        charset='utf-8'
+    )
+
 async def keep_alive_ping(request: Request) -> Response:
     """Keep-alive endpoint to prevent sleeping"""
     return web.Response(text="pong", status=200)
 
+async def warm_up() -> None:
+    """Load the QR libraries in the worker pools and run one render and one decode"""
+    try:
+        png = await render_pool.run(
+            render_qr_png, BOT_USERNAME, DEFAULT_BOX_SIZE, DEFAULT_BORDER, PNG_COMPRESS_LEVEL, timeout=RENDER_TIMEOUT
+        )
+        if WEBHOOK_URL:
+            await render_pool.run(render_qr_jpeg, BOT_USERNAME, INLINE_BOX_SIZE, DEFAULT_BORDER, timeout=RENDER_TIMEOUT)
+        await decode_pool.run('decoding:decode_qr_image', png, timeout=DECODE_TIMEOUT)
+        startup_timer.mark('warm_up')
+    except Exception as e:
+        # Not fatal: the first real request pays the imports instead
+        logger.warning(f"Warm-up failed: {e}")
+
 def create_app(application: Application) -> web.Application:
     """Create aiohttp web application"""
     app = web.Application()
     app['telegram_app'] = application
+    # Set once the Telegram application is initialized and started
+    app['ready'] = asyncio.Event()
+    
+    async def process_update(update: Update) -> None:
+        await application.process_update(update)
+        startup_timer.mark('first_update_processed')
+    
+    app['dispatcher'] = UpdateDispatcher(
+        process_update,
+        cheap_concurrency=DISPATCH_CHEAP_CONCURRENCY,
+        heavy_concurrency=DISPATCH_HEAVY_CONCURRENCY,
+        max_queued=DISPATCH_MAX_QUEUED,
+        observe_wait=queue_wait_seconds.observe,
+    )
+    metrics.gauge(
+        'qrbot_in_flight_updates', 'Updates accepted by the dispatcher and not finished yet',
+        app['dispatcher'].in_flight
+    )
     
     # Add routes
     app.router.add_get('/health', health_check)
     app.router.add_get('/ping', keep_alive_ping)
+    app.router.add_get('/metrics', metrics_handler)
+    app.router.add_get('/inline/qr.jpg', inline_image_handler)
     app.router.add_post(f'/webhook/{TELEGRAM_TOKEN}', webhook_handler)
     
     return app
@@ -400,7 +1435,7 @@ async def setup_webhook(application: Application) -> None:
     """Setup webhook for production"""
     if WEBHOOK_URL:
         webhook_url = f"{WEBHOOK_URL}/webhook/{TELEGRAM_TOKEN}"
-        await application.bot.set_webhook(webhook_url)
+        await application.bot.set_webhook(webhook_url, allowed_updates=list(HANDLED_UPDATE_TYPES))
         logger.info(f"Webhook set to: {webhook_url}")
     else:
         logger.warning("WEBHOOK_URL not set, webhook not configured")
@@ -411,6 +1446,8 @@ def setup_handlers(application: Application) -> None:
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("update", update_command))
+    application.add_handler(CommandHandler("batch", batch_command))
+    application.add_handler(CommandHandler("stats", stats_command))
     
     # Inline handler for backward compatibility
     application.add_handler(InlineQueryHandler(inline_qr))
@@ -421,46 +1458,100 @@ def setup_handlers(application: Application) -> None:
     # Message handlers (smart detection)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
     application.add_handler(MessageHandler(filters.PHOTO, handle_photo_message))
+    application.add_handler(MessageHandler(
+        filters.Document.FileExtension("txt") | filters.Document.FileExtension("csv"), handle_batch_document
+    ))
+    media_filter = filters.VIDEO | filters.ANIMATION | filters.Document.IMAGE | filters.Document.VIDEO
+    if PDF_SUPPORTED:
+        media_filter |= filters.Document.PDF
+    application.add_handler(MessageHandler(media_filter, handle_media_message))
     application.add_handler(MessageHandler(~(filters.TEXT | filters.PHOTO | filters.COMMAND), handle_other_messages))
     
     # Unknown command handler (must be last)
     application.add_handler(MessageHandler(filters.COMMAND, unknown_command))
 
+def bot_api_http2() -> bool:
+    """BOT_API_HTTP2, unless the h2 package is missing"""
+    if BOT_API_HTTP2 and not HTTP2_SUPPORTED:
+        logger.warning('BOT_API_HTTP2 needs the h2 package (pip install "python-telegram-bot[http2]"), using HTTP/1.1')
+        return False
+    return BOT_API_HTTP2
+
 def create_application() -> Application:
-    """Create telegram application with timeout settings"""
-    return (
+    """Create telegram application with a pooled Bot API client and outbound rate limiting"""
+    builder = (
         Application.builder()
         .token(TELEGRAM_TOKEN)
-        .read_timeout(30)
-        .write_timeout(30)
-        .connect_timeout(30)
-        .build()
+        .request(build_request(BOT_API_POOL_SIZE, BOT_API_KEEPALIVE, BOT_API_POOL_TIMEOUT, BOT_API_TIMEOUT,
+                               http2=bot_api_http2()))
+        .rate_limiter(outbound_limiter)
     )
+    if BOT_API_BASE_URL:
+        builder = builder.base_url(BOT_API_BASE_URL).base_file_url(
+            BOT_API_FILE_URL or BOT_API_BASE_URL.rstrip('/').rsplit('/', 1)[0] + '/file/bot'
+        )
+    if BOT_API_LOCAL_MODE:
+        builder = builder.local_mode(True)
+    return builder.build()
 
-async def run_webhook_mode() -> None:
-    """Run bot in webhook mode for production"""
-    application = create_application()
-    setup_handlers(application)
-    
-    # Initialize the application
-    await application.initialize()
-    
-    logger.info("Starting bot in webhook mode...")
-    
-    # Setup webhook
-    await setup_webhook(application)
+async def start_analytics(application: Application) -> None:
+    """Run the analytics and cache flush loops for as long as the application runs (also the post_init hook)"""
+    application.bot_data['analytics_task'] = asyncio.create_task(analytics.run())
+    application.bot_data['cache_tasks'] = [
+        asyncio.create_task(cache.run()) for cache in (qr_file_cache, decode_cache)
+    ]
+
+async def stop_analytics(application: Application) -> None:
+    """Stop the flush loops and write the events and cache entries still buffered"""
+    task = application.bot_data.pop('analytics_task', None)
+    if task is not None:
+        task.cancel()
+    for task in application.bot_data.pop('cache_tasks', []):
+        task.cancel()
+    await analytics.close()
+    for cache in (qr_file_cache, decode_cache):
+        await cache.flush()
+
+async def run_webhook_mode(application: Application = None, worker_index: int = None, heartbeat=None) -> None:
+    """Run bot in webhook mode for production
     
-    # Create web app
-    web_app = create_app(application)
+    The listener starts first so a machine woken by an incoming webhook accepts
+    it right away; updates wait for the bot to finish initializing. Worker
+    processes (worker_index set) bind the port with SO_REUSEPORT and report
+    heartbeats to the supervisor
+    """
+    if application is None:
+        application = create_application()
+    setup_handlers(application)
     
-    # Start the application
-    await application.start()
+    if worker_index is None:
+        logger.info("Starting bot in webhook mode...")
+    else:
+        logger.info(f"Starting webhook worker {worker_index} (pid {os.getpid()})...")
+    heartbeat_task = asyncio.create_task(send_heartbeats(heartbeat)) if heartbeat is not None else None
     
     # Run web server
+    web_app = create_app(application)
+    web_app['worker_index'] = worker_index
     runner = web.AppRunner(web_app)
     await runner.setup()
-    site = web.TCPSite(runner, HOST, PORT)
+    site = web.TCPSite(runner, HOST, PORT, reuse_port=worker_index is not None)
     await site.start()
+    startup_timer.mark('listener')
+    
+    # Load the QR libraries while the bot initializes
+    warm_up_task = asyncio.create_task(warm_up())
+    
+    # Initialize and start the application (getMe is the first Bot API round trip)
+    await application.initialize()
+    await application.start()
+    await start_analytics(application)
+    web_app['ready'].set()
+    startup_timer.mark('ready')
+    
+    # Setup webhook (once, from the first worker)
+    if not worker_index:
+        await setup_webhook(application)
     
     logger.info(f"Bot is running on {HOST}:{PORT} with webhook")
     
@@ -486,20 +1577,55 @@ async def run_webhook_mode() -> None:
     finally:
         logger.info("Starting cleanup...")
         try:
+            warm_up_task.cancel()
+            if heartbeat_task is not None:
+                heartbeat_task.cancel()
+            await web_app['dispatcher'].shutdown()
             await application.stop()
             await runner.cleanup()
+            await stop_analytics(application)
+            await close_download_session()
+            render_pool.shutdown()
+            decode_pool.shutdown()
+            qr_file_cache.close()
+            decode_cache.close()
             logger.info("Cleanup completed successfully")
         except Exception as e:
             logger.error(f"Error during cleanup: {e}")
 
+def run_worker(index: int, heartbeat) -> None:
+    """Entry point of a webhook worker process"""
+    asyncio.run(run_webhook_mode(worker_index=index, heartbeat=heartbeat))
+
+def run_worker_processes() -> None:
+    """Run WORKERS webhook processes on one port, supervised and restarted on exit or a stalled event loop"""
+    if not REUSE_PORT_SUPPORTED:
+        logger.warning("WORKERS needs SO_REUSEPORT, which this platform lacks; running a single process")
+        asyncio.run(main())
+        return
+    # Spawned workers re-import the main script as __main__, so this name resolves
+    # there without loading the module a second time
+    supervisor = Supervisor(
+        f"{__name__}:run_worker",
+        WORKERS,
+        heartbeat_timeout=WORKER_HEARTBEAT_TIMEOUT,
+        start_timeout=WORKER_START_TIMEOUT,
+    )
+    logger.info(f"Starting {WORKERS} webhook workers on {HOST}:{PORT}...")
+    supervisor.run()
+
 def run_polling_mode() -> None:
     """Run bot in polling mode for development"""
+    if WORKERS > 1:
+        logger.warning("WORKERS only applies to webhook mode, polling with a single process")
     application = create_application()
     setup_handlers(application)
+    application.post_init = start_analytics
+    application.post_shutdown = stop_analytics
     
     logger.info("Starting bot in polling mode...")
     print("Bot is running in development mode...")
-    application.run_polling()
+    application.run_polling(allowed_updates=list(HANDLED_UPDATE_TYPES))
 
 async def main() -> None:
     """Main function - determines run mode"""
@@ -510,7 +1636,10 @@ async def main() -> None:
         run_polling_mode()
 
 if __name__ == '__main__':
-    if WEBHOOK_URL:
+    if WEBHOOK_URL and WORKERS > 1:
+        # Production mode with several webhook processes
+        run_worker_processes()
+    elif WEBHOOK_URL:
         # Production mode with webhook
         asyncio.run(main())
     else:
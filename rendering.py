@@ -0,0 +1,444 @@
+"""
+QR Code rendering helpers
+Plain functions so they can run inside thread or process pool workers
+"""
+
+import base64
+import io
+import struct
+import time
+import zlib
+from functools import lru_cache
+
+# numpy and qrcode are imported inside the functions: they load in the worker on
+# first use (or during warm-up) instead of delaying the bot's startup
+
+# Default render settings (optimized for speed and size)
+DEFAULT_BOX_SIZE = 8
+DEFAULT_BORDER = 2
+
+# zlib level for the direct PNG encoder (1-bit rows of repeated modules compress well at low levels)
+DEFAULT_COMPRESS_LEVEL = 6
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def _make_qr(text: str, box_size: int, border: int, error_correction: str = 'L'):
+    import qrcode
+
+    qr = qrcode.QRCode(
+        version=1,
+        # Lowest error correction for smaller size, unless a style needs more
+        error_correction=getattr(qrcode.constants, f'ERROR_CORRECT_{error_correction}'),
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(text)
+    qr.make(fit=True)
+    return qr
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+
+def encode_matrix_png(matrix, box_size: int, compress_level: int = DEFAULT_COMPRESS_LEVEL) -> bytes:
+    """Encode a QR module matrix (True = dark, border included) as a 1-bit grayscale PNG"""
+    import numpy as np
+
+    modules = np.asarray(matrix, dtype=bool)
+    # 1-bit grayscale: 0 = black, 1 = white
+    row_bits = np.repeat(~modules, box_size, axis=1)
+    packed = np.packbits(row_bits, axis=1)
+    # Each scanline starts with filter type 0; every module row repeats box_size times
+    scanlines = np.hstack([np.zeros((packed.shape[0], 1), dtype=np.uint8), packed])
+    raw = np.repeat(scanlines, box_size, axis=0).tobytes()
+
+    height, width = modules.shape[0] * box_size, modules.shape[1] * box_size
+    header = struct.pack('>IIBBBBB', width, height, 1, 0, 0, 0, 0)
+    return b''.join((
+        PNG_SIGNATURE,
+        _png_chunk(b'IHDR', header),
+        _png_chunk(b'IDAT', zlib.compress(raw, compress_level)),
+        _png_chunk(b'IEND', b''),
+    ))
+
+
+def render_qr_png_timed(text: str, box_size: int = DEFAULT_BOX_SIZE, border: int = DEFAULT_BORDER,
+                        compress_level: int = DEFAULT_COMPRESS_LEVEL) -> tuple:
+    """Render text into a PNG QR Code; returns (png bytes, make seconds, encode seconds)"""
+    started = time.perf_counter()
+    qr = _make_qr(text, box_size, border)
+    made = time.perf_counter()
+    # get_matrix() includes the border modules
+    png = encode_matrix_png(qr.get_matrix(), box_size, compress_level)
+    return png, made - started, time.perf_counter() - made
+
+
+def render_qr_png(text: str, box_size: int = DEFAULT_BOX_SIZE, border: int = DEFAULT_BORDER,
+                  compress_level: int = DEFAULT_COMPRESS_LEVEL) -> bytes:
+    """Render text into a PNG QR Code and return the encoded bytes"""
+    return render_qr_png_timed(text, box_size, border, compress_level)[0]
+
+
+def render_qr_jpeg(text: str, box_size: int = DEFAULT_BOX_SIZE, border: int = DEFAULT_BORDER,
+                   quality: int = 90) -> bytes:
+    """Render text into a JPEG QR Code (Telegram inline photo results must be JPEG)"""
+    qr_img = _make_qr(text, box_size, border).make_image(fill_color="black", back_color="white").convert('L')
+    bio = io.BytesIO()
+    qr_img.save(bio, 'JPEG', quality=quality)
+    return bio.getvalue()
+
+
+# --- Styled QR Codes ---
+# The image is composited from the module matrix with NumPy: every module picks a
+# pre-built antialiased tile (by shape and, for rounded modules, by which
+# neighbours are dark), finder patterns are pasted from a pre-built template and
+# colours are applied through a 256-entry lookup table. Tiles, templates and
+# tables are cached per worker, so a styled code costs about as much as a plain one
+
+# Supersampling factor for antialiased tile edges
+_SUPERSAMPLE = 4
+
+# Smallest module size for styled raster output (shapes need a few pixels)
+MIN_STYLED_BOX_SIZE = 4
+
+# Logo side as a share of the code (without quiet zone); fits within error correction H
+LOGO_SCALE = 0.22
+
+# Dot radius and rounded module corner radius, in modules
+_DOT_RADIUS = 0.42
+_CORNER_RADIUS = 0.3
+
+# Finder pattern corner radii (ring outside, ring inside, centre) in modules. Only
+# lightly rounded: OpenCV (and older phone scanners) miss circular or strongly
+# rounded finder patterns, so dots keep square ones
+_FINDER_RADII = {'square': (0, 0, 0), 'rounded': (0.5, 0.3, 0.3), 'dots': (0, 0, 0)}
+
+
+def style_error_correction(style) -> str:
+    """Error correction level for a style: H under a logo, M for shaped modules"""
+    if style.logo:
+        return 'H'
+    return 'L' if style.shape == 'square' else 'M'
+
+
+def _rounded_rect_distance(x, y, half: float, radius: float):
+    """Signed distance to a square of half-side `half` with corner radius `radius` (centred at 0), negative inside"""
+    import numpy as np
+
+    qx = np.abs(x) - (half - radius)
+    qy = np.abs(y) - (half - radius)
+    return np.hypot(np.maximum(qx, 0), np.maximum(qy, 0)) + np.minimum(np.maximum(qx, qy), 0) - radius
+
+
+def _rounded_rect(x, y, half: float, radius: float):
+    """Mask of points inside a square of half-side `half` with corner radius `radius` (centred at 0)"""
+    return _rounded_rect_distance(x, y, half, radius) <= 0
+
+
+def _downsample(mask, box_size: int):
+    """Average a supersampled mask into uint8 coverage"""
+    import numpy as np
+
+    shape = mask.shape[:-2] + (box_size, _SUPERSAMPLE, box_size, _SUPERSAMPLE)
+    coverage = mask.reshape(shape).mean(axis=(-3, -1))
+    return np.rint(coverage * 255).astype(np.uint8)
+
+
+@lru_cache(maxsize=32)
+def _module_tiles(shape: str, box_size: int):
+    """Coverage tiles (n, box, box) indexed by module code; tile 0 is a light module
+
+    square and dots have one dark tile; rounded has 16, indexed 1 + neighbour bits
+    (1 = up, 2 = right, 4 = down, 8 = left), where a corner is rounded only when
+    both modules beside it are light
+    """
+    import numpy as np
+
+    steps = box_size * _SUPERSAMPLE
+    coords = (np.arange(steps) + 0.5) / steps - 0.5  # module units, centred
+    x, y = np.meshgrid(coords, coords)
+    if shape == 'dots':
+        dark = [np.hypot(x, y) <= _DOT_RADIUS]
+    elif shape == 'rounded':
+        rounded = _rounded_rect(x, y, 0.5, _CORNER_RADIUS)
+        dark = []
+        for neighbours in range(16):
+            up, right, down, left = (bool(neighbours & bit) for bit in (1, 2, 4, 8))
+            mask = np.ones((steps, steps), dtype=bool)
+            for corner_x, corner_y, keep in ((x < 0, y < 0, up or left), (x >= 0, y < 0, up or right),
+                                             (x >= 0, y >= 0, down or right), (x < 0, y >= 0, down or left)):
+                if not keep:
+                    quadrant = corner_x & corner_y
+                    mask[quadrant] = rounded[quadrant]
+            dark.append(mask)
+    else:
+        dark = [np.ones((steps, steps), dtype=bool)]
+    masks = np.stack([np.zeros((steps, steps), dtype=bool)] + dark)
+    tiles = _downsample(masks, box_size)
+    tiles.setflags(write=False)
+    return tiles
+
+
+@lru_cache(maxsize=32)
+def _finder_tile(shape: str, box_size: int):
+    """Coverage of a 7x7-module finder pattern (ring plus centre) in the given shape
+
+    Built at output resolution from signed distances (edges blended over one
+    pixel) instead of supersampling: at large sizes a supersampled grid of the
+    whole pattern would take hundreds of MB
+    """
+    import numpy as np
+
+    coords = (np.arange(7 * box_size, dtype=np.float32) + 0.5) / box_size - 3.5
+    # Row and column vectors broadcast to the full grid only in the final results
+    x, y = coords[np.newaxis, :], coords[:, np.newaxis]
+    outer, inner, centre = _FINDER_RADII[shape]
+
+    def coverage(half, radius):
+        # Distance in pixels: points within half a pixel of the edge are partly covered
+        return np.clip(0.5 - _rounded_rect_distance(x, y, half, radius) * box_size, 0, 1)
+
+    ring = np.minimum(coverage(3.5, outer), 1 - coverage(2.5, inner))
+    tile = np.rint(np.maximum(ring, coverage(1.5, centre)) * 255).astype(np.uint8)
+    tile.setflags(write=False)
+    return tile
+
+
+@lru_cache(maxsize=64)
+def _color_table(fg: tuple, bg):
+    """(256, 3 or 4) uint8 table mapping coverage to colour; RGBA when bg is transparent"""
+    import numpy as np
+
+    coverage = np.arange(256, dtype=np.float32)[:, None] / 255
+    if bg is None:
+        table = np.empty((256, 4), dtype=np.uint8)
+        table[:, :3] = fg
+        table[:, 3] = np.rint(coverage[:, 0] * 255)
+    else:
+        table = np.rint(np.asarray(bg, np.float32) + (np.asarray(fg, np.float32) - bg) * coverage).astype(np.uint8)
+    table.setflags(write=False)
+    return table
+
+
+def _finder_origins(count: int, border: int):
+    """Top-left module of the three finder patterns"""
+    far = count - border - 7
+    return (border, border), (border, far), (far, border)
+
+
+def _module_codes(modules, shape: str, border: int):
+    """Tile index per module, with finder pattern areas cleared"""
+    import numpy as np
+
+    codes = modules.astype(np.uint8)
+    if shape == 'rounded':
+        padded = np.pad(modules, 1)
+        neighbours = (padded[:-2, 1:-1] * 1 | padded[1:-1, 2:] * 2 | padded[2:, 1:-1] * 4
+                      | padded[1:-1, :-2] * 8).astype(np.uint8)
+        codes = np.where(modules, neighbours + 1, 0).astype(np.uint8)
+    for row, col in _finder_origins(modules.shape[0], border):
+        codes[row:row + 7, col:col + 7] = 0
+    return codes
+
+
+def _logo_box(count: int, border: int):
+    """(start, end) module range of the centre area cleared for a logo (square, odd-sized)"""
+    side = int((count - 2 * border) * LOGO_SCALE) | 1
+    start = (count - side) // 2
+    return start, start + side
+
+
+@lru_cache(maxsize=16)
+def _logo_pixels(logo: bytes, side: int):
+    """Logo decoded and fitted into a side x side RGBA array (aspect kept, centred)"""
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(io.BytesIO(logo)) as img:
+        img = img.convert('RGBA')
+        img.thumbnail((side, side), Image.LANCZOS)
+        canvas = Image.new('RGBA', (side, side), (0, 0, 0, 0))
+        canvas.paste(img, ((side - img.width) // 2, (side - img.height) // 2))
+    pixels = np.asarray(canvas)
+    pixels.setflags(write=False)
+    return pixels
+
+
+def _composite_coverage(modules, shape: str, box_size: int, border: int):
+    """uint8 coverage image (dark = 255) for the module matrix"""
+    codes = _module_codes(modules, shape, border)
+    count = modules.shape[0]
+    tiles = _module_tiles(shape, box_size)
+    # (rows, cols, box, box) -> (rows * box, cols * box)
+    coverage = tiles[codes].transpose(0, 2, 1, 3).reshape(count * box_size, count * box_size)
+    finder = _finder_tile(shape, box_size)
+    for row, col in _finder_origins(count, border):
+        coverage[row * box_size:(row + 7) * box_size, col * box_size:(col + 7) * box_size] = finder
+    return coverage
+
+
+def _encode_raster(coverage, style, logo, start: int, end: int, box_size: int, compress_level: int) -> bytes:
+    import numpy as np
+    from PIL import Image
+
+    table = _color_table(style.fg, style.bg)
+    bio = io.BytesIO()
+    if logo is None and style.format == 'png':
+        # Coverage is already a palette index: no per-pixel colour work at all
+        img = Image.fromarray(coverage)
+        img.putpalette(table[:, :3].tobytes())
+        extra = {'transparency': table[:, 3].tobytes()} if table.shape[1] == 4 else {}
+        img.save(bio, 'PNG', compress_level=compress_level, **extra)
+        return bio.getvalue()
+
+    pixels = table[coverage]
+    if logo is not None:
+        side = (end - start) * box_size
+        # One module of margin inside the cleared area
+        margin = box_size
+        logo_rgba = _logo_pixels(logo, side - 2 * margin).astype(np.float32)
+        alpha = logo_rgba[..., 3:] / 255
+        area = pixels[start * box_size + margin:end * box_size - margin, start * box_size + margin:end * box_size - margin]
+        if pixels.shape[2] == 4:
+            base_alpha = area[..., 3:].astype(np.float32) / 255
+            out_alpha = alpha + base_alpha * (1 - alpha)
+            rgb = (logo_rgba[..., :3] * alpha + area[..., :3] * base_alpha * (1 - alpha)) / np.maximum(out_alpha, 1e-6)
+            area[..., :3] = np.rint(rgb)
+            area[..., 3:] = np.rint(out_alpha * 255)
+        else:
+            area[...] = np.rint(logo_rgba[..., :3] * alpha + area * (1 - alpha))
+    img = Image.fromarray(pixels)
+    if style.format == 'webp':
+        img.save(bio, 'WEBP', lossless=True, quality=0, method=0)
+    else:
+        img.save(bio, 'PNG', compress_level=compress_level)
+    return bio.getvalue()
+
+
+def _svg_round_rect(x: float, y: float, side: float, radius: float) -> str:
+    """Closed SVG subpath of a square with rounded corners"""
+    edge = side - 2 * radius
+    if not radius:
+        return f"M{x:g} {y:g}h{side:g}v{side:g}h{-side:g}z"
+    arc = f"a{radius:g} {radius:g} 0 0 1 "
+    return (f"M{x + radius:g} {y:g}h{edge:g}{arc}{radius:g} {radius:g}v{edge:g}{arc}{-radius:g} {radius:g}"
+            f"h{-edge:g}{arc}{-radius:g} {-radius:g}v{-edge:g}{arc}{radius:g} {-radius:g}z")
+
+
+@lru_cache(maxsize=4)
+def _svg_module_paths(shape: str):
+    """(x offset, y offset, relative path) per tile index, from the module's top-left corner"""
+    if shape == 'dots':
+        radius = _DOT_RADIUS
+        arc = f"a{radius:g} {radius:g} 0 1 0 "
+        return (None, (0.5 - radius, 0.5, f"{arc}{2 * radius:g} 0{arc}{-2 * radius:g} 0z"))
+    if shape == 'square':
+        return (None, (0, 0, "h1v1h-1z"))
+    paths = [None]
+    radius = _CORNER_RADIUS
+    arc = f"a{radius:g} {radius:g} 0 0 1 "
+    for neighbours in range(16):
+        up, right, down, left = (bool(neighbours & bit) for bit in (1, 2, 4, 8))
+        # A corner is rounded when both modules beside it are light
+        top_left, top_right, bottom_right, bottom_left = (
+            0 if keep else radius for keep in (up or left, up or right, down or right, down or left)
+        )
+        path = f"h{1 - top_left - top_right:g}"
+        if top_right:
+            path += f"{arc}{radius:g} {radius:g}"
+        path += f"v{1 - top_right - bottom_right:g}"
+        if bottom_right:
+            path += f"{arc}{-radius:g} {radius:g}"
+        path += f"h{bottom_right + bottom_left - 1:g}"
+        if bottom_left:
+            path += f"{arc}{-radius:g} {-radius:g}"
+        path += f"v{bottom_left + top_left - 1:g}"
+        if top_left:
+            path += f"{arc}{radius:g} {-radius:g}"
+        paths.append((top_left, 0, path + "z"))
+    return tuple(paths)
+
+
+def _svg_color(color: tuple) -> str:
+    return '#%02x%02x%02x' % color
+
+
+def _encode_svg(modules, style, logo, start: int, end: int, box_size: int, border: int) -> bytes:
+    """SVG in module units: one even-odd path for modules and finder patterns, logo embedded as data URI"""
+    import numpy as np
+
+    count = modules.shape[0]
+    codes = _module_codes(modules, style.shape, border)
+    if logo is not None:
+        codes[start:end, start:end] = 0
+    parts = []
+    if style.shape == 'square':
+        # Horizontal runs of dark modules become one rectangle each
+        dark = np.pad(codes > 0, ((0, 0), (1, 1)))
+        edges = np.diff(dark.astype(np.int8), axis=1)
+        for row, col_start, col_end in zip(*np.nonzero(edges == 1), np.nonzero(edges == -1)[1]):
+            parts.append(f"M{col_start} {row}h{col_end - col_start}v1h{col_start - col_end}z")
+    else:
+        paths = _svg_module_paths(style.shape)
+        for row, col in zip(*np.nonzero(codes)):
+            dx, dy, path = paths[codes[row, col]]
+            parts.append(f"M{col + dx:g} {row + dy:g}{path}")
+    outer, inner, centre = _FINDER_RADII[style.shape]
+    for row, col in _finder_origins(count, border):
+        parts.append(_svg_round_rect(col, row, 7, outer))
+        parts.append(_svg_round_rect(col + 1, row + 1, 5, inner))
+        parts.append(_svg_round_rect(col + 2, row + 2, 3, centre))
+
+    pixels = count * box_size
+    svg = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" height="{pixels}" viewBox="0 0 {count} {count}"'
+           + (' shape-rendering="crispEdges"' if style.shape == 'square' else '') + '>']
+    if style.bg is not None:
+        svg.append(f'<rect width="{count}" height="{count}" fill="{_svg_color(style.bg)}"/>')
+    svg.append(f'<path fill="{_svg_color(style.fg)}" fill-rule="evenodd" d="{"".join(parts)}"/>')
+    if logo is not None:
+        side = end - start - 2
+        data = base64.b64encode(_logo_png(logo, side * box_size)).decode('ascii')
+        svg.append(f'<image x="{start + 1}" y="{start + 1}" width="{side}" height="{side}" '
+                   f'href="data:image/png;base64,{data}"/>')
+    svg.append('</svg>')
+    return ''.join(svg).encode('utf-8')
+
+
+def _logo_png(logo: bytes, side: int) -> bytes:
+    from PIL import Image
+
+    bio = io.BytesIO()
+    Image.fromarray(_logo_pixels(logo, side)).save(bio, 'PNG')
+    return bio.getvalue()
+
+
+def render_styled_qr_timed(text: str, style, logo: bytes = None,
+                           compress_level: int = DEFAULT_COMPRESS_LEVEL) -> tuple:
+    """Render text as a styled QR Code; returns (encoded bytes, make seconds, encode seconds)
+
+    style is a styles.QRStyle; logo is an image file placed in the centre
+    """
+    import numpy as np
+
+    started = time.perf_counter()
+    qr = _make_qr(text, DEFAULT_BOX_SIZE, DEFAULT_BORDER, style_error_correction(style))
+    made = time.perf_counter()
+    modules = np.asarray(qr.get_matrix(), dtype=bool)
+    count = modules.shape[0]
+    box_size = DEFAULT_BOX_SIZE if style.size is None else max(MIN_STYLED_BOX_SIZE, round(style.size / count))
+    start, end = _logo_box(count, DEFAULT_BORDER) if logo is not None else (0, 0)
+    if style.format == 'svg':
+        data = _encode_svg(modules, style, logo, start, end, box_size, DEFAULT_BORDER)
+    else:
+        if logo is not None:
+            modules[start:end, start:end] = False
+        coverage = _composite_coverage(modules, style.shape, box_size, DEFAULT_BORDER)
+        data = _encode_raster(coverage, style, logo, start, end, box_size, compress_level)
+    return data, made - started, time.perf_counter() - made
+
+
+def render_styled_qr(text: str, style, logo: bytes = None, compress_level: int = DEFAULT_COMPRESS_LEVEL) -> bytes:
+    """Render text as a styled QR Code and return the encoded bytes"""
+    return render_styled_qr_timed(text, style, logo, compress_level)[0]
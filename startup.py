@@ -0,0 +1,37 @@
+"""
+Cold-start timing
+Records when each startup phase finished, relative to the start of the process,
+so time-to-first-response after a machine wakes up can be tracked
+"""
+
+import os
+import time
+
+
+def _process_age() -> float:
+    """Seconds since this process was started (0.0 where /proc is unavailable)"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Fields after the command name; starttime is field 22 (clock ticks since boot)
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+class StartupTimer:
+    """Startup phases in completion order, each recorded once (seconds since process start)"""
+
+    def __init__(self):
+        self._started = time.perf_counter() - _process_age()
+        self.phases = {}
+
+    def mark(self, phase: str) -> None:
+        """Record a phase the first time it completes; later calls are ignored"""
+        if phase not in self.phases:
+            self.phases[phase] = time.perf_counter() - self._started
+
+    def stats(self) -> dict:
+        return {phase: round(seconds, 4) for phase, seconds in self.phases.items()}
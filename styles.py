@@ -0,0 +1,139 @@
+"""
+Styled QR Code options
+Parses the "text | fg=#1a73e8 shape=dots format=svg" syntax into a QRStyle.
+Kept free of NumPy and PIL so the bot parses options without loading them
+"""
+
+from typing import NamedTuple, Optional
+
+# Separates the payload from the options (last occurrence wins)
+OPTIONS_SEPARATOR = ' | '
+
+SHAPES = ('square', 'rounded', 'dots')
+FORMATS = ('png', 'webp', 'svg')
+
+# Requested image side (pixels); the code snaps to a whole number of pixels per module
+MIN_SIZE = 128
+MAX_SIZE = 2048
+
+# Scanners need dark modules on a light background with at least this contrast ratio
+MIN_CONTRAST = 3.0
+
+COLOR_NAMES = {
+    'black': (0, 0, 0),
+    'white': (255, 255, 255),
+    'gray': (128, 128, 128),
+    'red': (200, 30, 30),
+    'green': (20, 130, 60),
+    'blue': (26, 115, 232),
+    'navy': (20, 40, 100),
+    'purple': (110, 40, 160),
+    'orange': (230, 120, 20),
+    'brown': (110, 60, 30),
+    'yellow': (250, 220, 60),
+    'pink': (250, 200, 215),
+    'cream': (255, 250, 235),
+}
+
+_KEY_ALIASES = {
+    'fg': 'fg', 'color': 'fg', 'colour': 'fg',
+    'bg': 'bg', 'background': 'bg',
+    'shape': 'shape',
+    'size': 'size',
+    'format': 'format',
+    'logo': 'logo',
+}
+
+
+class StyleError(ValueError):
+    """Raised for an option with an invalid value; the message is shown to the user"""
+
+
+class QRStyle(NamedTuple):
+    fg: tuple = (0, 0, 0)
+    bg: Optional[tuple] = (255, 255, 255)  # None = transparent
+    shape: str = 'square'
+    size: Optional[int] = None  # None = default module size
+    format: str = 'png'
+    logo: bool = False  # centre logo from the photo the message replies to
+
+
+def parse_color(value: str, allow_transparent: bool = False):
+    """(r, g, b) for '#rgb', '#rrggbb' or a colour name; None for 'transparent'"""
+    value = value.lower()
+    if value in COLOR_NAMES:
+        return COLOR_NAMES[value]
+    if allow_transparent and value in ('transparent', 'none'):
+        return None
+    digits = value[1:] if value.startswith('#') else value
+    if len(digits) == 3:
+        digits = ''.join(digit * 2 for digit in digits)
+    if len(digits) == 6:
+        try:
+            return tuple(int(digits[index:index + 2], 16) for index in (0, 2, 4))
+        except ValueError:
+            pass
+    raise StyleError(f"Unknown colour: {value}")
+
+
+def relative_luminance(color: tuple) -> float:
+    """WCAG relative luminance of an sRGB colour"""
+    channels = []
+    for channel in color:
+        channel /= 255
+        channels.append(channel / 12.92 if channel <= 0.03928 else ((channel + 0.055) / 1.055) ** 2.4)
+    return 0.2126 * channels[0] + 0.7152 * channels[1] + 0.0722 * channels[2]
+
+
+def contrast_ratio(fg: tuple, bg: Optional[tuple]) -> float:
+    """Contrast of fg on bg, negative when fg is the lighter colour (transparent counts as white)"""
+    dark = relative_luminance(fg)
+    light = relative_luminance(bg if bg is not None else (255, 255, 255))
+    if dark > light:
+        return -(dark + 0.05) / (light + 0.05)
+    return (light + 0.05) / (dark + 0.05)
+
+
+def _parse_options(tokens: list) -> QRStyle:
+    values = {}
+    for token in tokens:
+        key, _, value = token.partition('=')
+        key = _KEY_ALIASES[key.lower()]
+        value = value.strip()
+        if key == 'fg':
+            values['fg'] = parse_color(value)
+        elif key == 'bg':
+            values['bg'] = parse_color(value, allow_transparent=True)
+        elif key == 'shape':
+            if value.lower() not in SHAPES:
+                raise StyleError(f"shape must be one of {', '.join(SHAPES)}")
+            values['shape'] = value.lower()
+        elif key == 'size':
+            if not value.isdigit() or not MIN_SIZE <= int(value) <= MAX_SIZE:
+                raise StyleError(f"size must be {MIN_SIZE}-{MAX_SIZE} pixels")
+            values['size'] = int(value)
+        elif key == 'format':
+            if value.lower() not in FORMATS:
+                raise StyleError(f"format must be one of {', '.join(FORMATS)}")
+            values['format'] = value.lower()
+        else:
+            values['logo'] = value.lower() in ('', 'yes', 'on', 'true', '1')
+    style = QRStyle(**values)
+    if contrast_ratio(style.fg, style.bg) < MIN_CONTRAST:
+        raise StyleError("fg must be darker than bg with enough contrast to scan")
+    return style
+
+
+def split_style(text: str):
+    """(payload, QRStyle or None) for a message; raises StyleError for a bad option value
+
+    Only text after the last ' | ' made up entirely of known options counts as
+    options, so payloads that happen to contain ' | ' are left alone
+    """
+    payload, separator, options = text.rpartition(OPTIONS_SEPARATOR)
+    if not separator or not payload.strip():
+        return text, None
+    tokens = options.split()
+    if not tokens or any(token.partition('=')[0].lower() not in _KEY_ALIASES for token in tokens):
+        return text, None
+    return payload.strip(), _parse_options(tokens)
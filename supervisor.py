@@ -0,0 +1,137 @@
+"""
+Multi-process webhook mode
+A supervisor process starts N copies of the bot that all listen on the same
+port (SO_REUSEPORT: the kernel spreads incoming connections across them),
+restarts workers that exit or whose event loop stops sending heartbeats, and
+stops them all on SIGTERM/SIGINT
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import signal
+import socket
+import time
+
+from workers import call_by_name
+
+logger = logging.getLogger(__name__)
+
+# Several processes may only bind the same port where the OS load-balances it
+REUSE_PORT_SUPPORTED = hasattr(socket, 'SO_REUSEPORT')
+
+# Seconds between heartbeats written by a worker's event loop
+HEARTBEAT_INTERVAL = 1.0
+
+
+async def send_heartbeats(heartbeat) -> None:
+    """Worker side: stamp the shared heartbeat for as long as the event loop keeps running"""
+    while True:
+        heartbeat.value = time.time()
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+
+class WorkerProcess:
+    """One supervised worker: its process, heartbeat slot and restart history"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.heartbeat = None
+        self.started = 0.0
+        self.restarts = 0
+        self.crashes = 0  # consecutive exits shortly after starting
+        self.next_start = 0.0
+
+    def heartbeat_age(self) -> float:
+        """Seconds since the last heartbeat, or since the start while the worker boots"""
+        return time.time() - max(self.heartbeat.value, self.started)
+
+
+class Supervisor:
+    """Pre-spawned worker processes running `target` ('module:function', called with index and heartbeat)
+
+    Workers are started with the spawn method so none inherits the supervisor's
+    SQLite connections, threads or sockets
+    """
+
+    def __init__(self, target: str, workers: int, heartbeat_timeout: float = 30.0,
+                 start_timeout: float = 60.0, max_backoff: float = 30.0, check_interval: float = 1.0):
+        self.target = target
+        self.heartbeat_timeout = heartbeat_timeout
+        self.start_timeout = start_timeout
+        self.max_backoff = max_backoff
+        self.check_interval = check_interval
+        self.workers = [WorkerProcess(index) for index in range(max(1, workers))]
+        self._context = multiprocessing.get_context('spawn')
+        self._stopping = False
+
+    def _start(self, worker: WorkerProcess) -> None:
+        worker.heartbeat = self._context.RawValue('d', 0.0)
+        worker.process = self._context.Process(
+            target=call_by_name,
+            args=(self.target, worker.index, worker.heartbeat),
+            name=f"qrbot-worker-{worker.index}",
+        )
+        worker.started = time.time()
+        worker.process.start()
+        logger.info(f"Worker {worker.index} started (pid {worker.process.pid})")
+
+    def _restart_later(self, worker: WorkerProcess, reason: str) -> None:
+        # Workers that die right after starting are restarted with exponential backoff
+        if time.time() - worker.started < self.start_timeout:
+            worker.crashes += 1
+        else:
+            worker.crashes = 0
+        delay = min(self.max_backoff, 2 ** worker.crashes - 1)
+        worker.next_start = time.time() + delay
+        worker.process = None
+        worker.restarts += 1
+        logger.error(f"Worker {worker.index} {reason}, restarting in {delay:.0f}s")
+
+    def _check(self, worker: WorkerProcess) -> None:
+        if worker.process is None:
+            if time.time() >= worker.next_start:
+                self._start(worker)
+            return
+        if not worker.process.is_alive():
+            self._restart_later(worker, f"exited with code {worker.process.exitcode}")
+            return
+        # Before the first heartbeat the worker gets start_timeout to import and initialize
+        timeout = self.heartbeat_timeout if worker.heartbeat.value else self.start_timeout
+        if worker.heartbeat_age() > timeout:
+            worker.process.kill()
+            worker.process.join(5)
+            self._restart_later(worker, f"missed heartbeats for {worker.heartbeat_age():.0f}s")
+
+    def _stop_signal(self, signum, frame) -> None:
+        logger.info(f"Received signal {signum}, stopping workers...")
+        self._stopping = True
+
+    def run(self) -> None:
+        """Start all workers and supervise them until SIGTERM/SIGINT"""
+        signal.signal(signal.SIGINT, self._stop_signal)
+        signal.signal(signal.SIGTERM, self._stop_signal)
+        for worker in self.workers:
+            self._start(worker)
+        while not self._stopping:
+            time.sleep(self.check_interval)
+            for worker in self.workers:
+                if not self._stopping:
+                    self._check(worker)
+        self.stop()
+
+    def stop(self, timeout: float = 20.0) -> None:
+        """SIGTERM every worker (graceful shutdown), SIGKILL those still running after timeout"""
+        running = [worker.process for worker in self.workers if worker.process is not None]
+        for process in running:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.time() + timeout
+        for process in running:
+            process.join(max(0.0, deadline - time.time()))
+            if process.is_alive():
+                logger.warning(f"{process.name} did not stop in {timeout:.0f}s, killing it")
+                process.kill()
+                process.join()
+        logger.info("All workers stopped")
@@ -0,0 +1,132 @@
+"""
+Bounded worker pools for CPU-heavy work (QR rendering, image decoding)
+Keeps the asyncio event loop free for network I/O
+"""
+
+import asyncio
+import importlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def call_by_name(target: str, *args):
+    """Import 'module:function' inside the worker and call it
+
+    Lets callers submit jobs without importing heavy modules (cv2, numpy)
+    themselves; the first job in each worker pays the import instead
+    """
+    module_name, _, func_name = target.partition(':')
+    return getattr(importlib.import_module(module_name), func_name)(*args)
+
+
+class PoolBusyError(Exception):
+    """Raised when a worker pool queue is full and the job could not be admitted"""
+
+
+class WorkerPool:
+    """Thread or process pool with a bounded pending queue and backpressure"""
+
+    def __init__(self, name, workers=2, max_pending=32, kind='thread',
+                 queue_timeout=2.0, initializer=None, initargs=()):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Unknown pool kind: {kind}")
+        self.name = name
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_pending = max(self.workers, max_pending)
+        self.queue_timeout = queue_timeout
+        self._initializer = initializer
+        self._initargs = initargs
+        self._executor = None
+        self._slots = None
+        self.pending = 0
+        self.rejected = 0
+        self.completed = 0
+
+    def start(self) -> None:
+        """Create the underlying executor (idempotent)"""
+        if self._executor is not None:
+            return
+        executor_cls = ThreadPoolExecutor if self.kind == 'thread' else ProcessPoolExecutor
+        kwargs = {'max_workers': self.workers}
+        if isinstance(self._initializer, str):
+            kwargs['initializer'] = call_by_name
+            kwargs['initargs'] = (self._initializer,) + tuple(self._initargs)
+        elif self._initializer is not None:
+            kwargs['initializer'] = self._initializer
+            kwargs['initargs'] = self._initargs
+        if self.kind == 'thread':
+            kwargs['thread_name_prefix'] = self.name
+        self._executor = executor_cls(**kwargs)
+        logger.info(f"Started {self.kind} pool '{self.name}' with {self.workers} workers")
+
+    def shutdown(self) -> None:
+        """Stop the executor, cancelling jobs that have not started yet"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, func, *args, timeout=None, on_done=None):
+        """Run func(*args) in the pool; raises PoolBusyError when saturated
+
+        func may be a callable or a 'module:function' string resolved in the worker.
+        on_done() is called once the job has really finished (even after a timeout),
+        or right away if the job was never started
+        """
+        if self._executor is None:
+            self.start()
+        if self._slots is None:
+            # Created lazily so the semaphore binds to the running loop
+            self._slots = asyncio.Semaphore(self.max_pending)
+
+        started = False
+        try:
+            # Backpressure: wait briefly for a free slot, then give up
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise PoolBusyError(f"{self.name} pool is saturated ({self.pending} pending)")
+
+            self.pending += 1
+            loop = asyncio.get_running_loop()
+            try:
+                if isinstance(func, str):
+                    future = loop.run_in_executor(self._executor, call_by_name, func, *args)
+                else:
+                    future = loop.run_in_executor(self._executor, func, *args)
+            except Exception:
+                self._release(None)
+                raise
+            started = True
+        finally:
+            if not started and on_done is not None:
+                on_done()
+        # The slot is held until the job really finishes, even if the caller
+        # stops waiting, so timed-out jobs still count against the bound
+        future.add_done_callback(self._release)
+        if on_done is not None:
+            future.add_done_callback(lambda _future: on_done())
+        if timeout is not None:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        else:
+            result = await future
+        self.completed += 1
+        return result
+
+    def _release(self, _future) -> None:
+        self.pending -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        """Snapshot of pool counters"""
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }